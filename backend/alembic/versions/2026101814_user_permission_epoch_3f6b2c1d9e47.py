@@ -0,0 +1,28 @@
+"""User permission epoch
+
+Revision ID: 3f6b2c1d9e47
+Revises: 04280ccacd1e
+Create Date: 2026-10-18 09:14:22.318570
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f6b2c1d9e47"
+down_revision = "04280ccacd1e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "users",
+        sa.Column("permission_epoch", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column("users", "permission_epoch")
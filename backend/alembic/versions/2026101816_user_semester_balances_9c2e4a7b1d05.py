@@ -0,0 +1,53 @@
+"""User semester balances
+
+Revision ID: 9c2e4a7b1d05
+Revises: 3f6b2c1d9e47
+Create Date: 2026-10-18 11:16:40.204113
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9c2e4a7b1d05"
+down_revision = "3f6b2c1d9e47"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user_semester_balances",
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("semester_id", sa.UUID(), nullable=False),
+        sa.Column("balance", sa.DECIMAL(precision=12, scale=5), nullable=False),
+        sa.Column("usage_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["semester_id"], ["semesters.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "semester_id"),
+    )
+    op.create_index(
+        "ix_user_semester_balances_semester_balance",
+        "user_semester_balances",
+        ["semester_id", "balance"],
+        unique=False,
+    )
+    op.execute(
+        """
+        INSERT INTO user_semester_balances (user_id, semester_id, balance, usage_count)
+        SELECT user_id, semester_id, sum(cost), count(*)
+        FROM machine_usages
+        WHERE semester_id IS NOT NULL
+        GROUP BY user_id, semester_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_user_semester_balances_semester_balance",
+        table_name="user_semester_balances",
+    )
+    op.drop_table("user_semester_balances")
@@ -0,0 +1,66 @@
+"""Charge sheet snapshots
+
+Revision ID: 5d81f0c3a6e2
+Revises: 9c2e4a7b1d05
+Create Date: 2026-10-18 11:17:52.640918
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5d81f0c3a6e2"
+down_revision = "9c2e4a7b1d05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Semesters that are already closed are frozen when their charge sheet is next requested
+    op.create_table(
+        "charge_sheet_snapshots",
+        sa.Column("semester_id", sa.UUID(), nullable=False),
+        sa.Column(
+            "time_created",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("row_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["semester_id"], ["semesters.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("semester_id"),
+    )
+    op.create_table(
+        "charge_sheet_snapshot_rows",
+        sa.Column("semester_id", sa.UUID(), nullable=False),
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("RIN", sa.String(length=9), nullable=False),
+        sa.Column("first_name", sa.String(length=64), nullable=False),
+        sa.Column("last_name", sa.String(length=64), nullable=False),
+        sa.Column("is_graduating", sa.Boolean(), nullable=False),
+        sa.Column("balance", sa.DECIMAL(precision=12, scale=5), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["semester_id"],
+            ["charge_sheet_snapshots.semester_id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("semester_id", "user_id"),
+    )
+    op.create_index(
+        "ix_charge_sheet_snapshot_rows_order",
+        "charge_sheet_snapshot_rows",
+        ["semester_id", "is_graduating", "last_name", "first_name", "RIN"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_charge_sheet_snapshot_rows_order",
+        table_name="charge_sheet_snapshot_rows",
+    )
+    op.drop_table("charge_sheet_snapshot_rows")
+    op.drop_table("charge_sheet_snapshots")
@@ -0,0 +1,33 @@
+"""Keyset pagination indexes
+
+Revision ID: b47e1a9c3d20
+Revises: 5d81f0c3a6e2
+Create Date: 2026-10-18 12:03:41.215307
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b47e1a9c3d20"
+down_revision = "5d81f0c3a6e2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Orderings on unique columns (names, RCSID, RIN) already have an index
+    op.create_index("ix_users_last_name_id", "users", ["last_name", "id"])
+    op.create_index("ix_users_first_name_id", "users", ["first_name", "id"])
+    op.create_index(
+        "ix_machine_usages_user_time_started",
+        "machine_usages",
+        ["user_id", "time_started", "id"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_machine_usages_user_time_started", table_name="machine_usages")
+    op.drop_index("ix_users_first_name_id", table_name="users")
+    op.drop_index("ix_users_last_name_id", table_name="users")
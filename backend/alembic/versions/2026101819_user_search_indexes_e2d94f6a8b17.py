@@ -0,0 +1,41 @@
+"""User search indexes
+
+Revision ID: e2d94f6a8b17
+Revises: b47e1a9c3d20
+Create Date: 2026-10-18 12:41:09.583126
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "e2d94f6a8b17"
+down_revision = "b47e1a9c3d20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in ("RCSID", "first_name", "last_name"):
+        op.create_index(
+            f"ix_users_{column.lower()}_trgm",
+            "users",
+            [column],
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+    op.create_index(
+        "ix_users_rin_prefix",
+        "users",
+        ["RIN"],
+        postgresql_ops={"RIN": "varchar_pattern_ops"},
+    )
+
+
+def downgrade():
+    op.drop_index("ix_users_rin_prefix", table_name="users")
+    for column in ("RCSID", "first_name", "last_name"):
+        op.drop_index(f"ix_users_{column.lower()}_trgm", table_name="users")
+    # pg_trgm is left installed, other objects may use it
@@ -0,0 +1,66 @@
+"""Audit log entities
+
+Revision ID: 7a3c5e91f04b
+Revises: e2d94f6a8b17
+Create Date: 2026-10-18 13:20:44.918372
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7a3c5e91f04b"
+down_revision = "e2d94f6a8b17"
+branch_labels = None
+depends_on = None
+
+# Copied from EntityType and ENTITY_ID_KEYS as they were, so later changes to them
+# don't change what this migration creates and backfills
+ENTITY_ID_KEYS = {
+    "machine_id": "MACHINE",
+    "machine_type_id": "MACHINE_TYPE",
+    "machine_group_id": "MACHINE_GROUP",
+    "machine_usage_id": "MACHINE_USAGE",
+    "resource_id": "RESOURCE",
+    "resource_slot_id": "RESOURCE_SLOT",
+    "role_id": "ROLE",
+    "semester_id": "SEMESTER",
+    "user_id": "USER",
+    "org_id": "ORG",
+}
+
+entity_type_enum = sa.Enum(*ENTITY_ID_KEYS.values(), name="entitytype")
+
+
+def upgrade():
+    entity_type_enum.create(op.get_bind())
+    op.add_column(
+        "audit_logs", sa.Column("entity_type", entity_type_enum, nullable=True)
+    )
+    op.add_column("audit_logs", sa.Column("entity_id", sa.UUID(), nullable=True))
+
+    # Existing logs have one id key each, new ones are filled in on insert
+    for key, entity_type in ENTITY_ID_KEYS.items():
+        op.execute(
+            sa.text(
+                "UPDATE audit_logs "
+                "SET entity_type = CAST(:entity_type AS entitytype), "
+                "entity_id = CAST(content ->> :key AS uuid) "
+                "WHERE entity_type IS NULL AND content ->> :key IS NOT NULL"
+            ).bindparams(entity_type=entity_type, key=key)
+        )
+
+    op.create_index(
+        "ix_audit_logs_entity",
+        "audit_logs",
+        ["entity_type", "entity_id", sa.text("time_created DESC")],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_audit_logs_entity", table_name="audit_logs")
+    op.drop_column("audit_logs", "entity_id")
+    op.drop_column("audit_logs", "entity_type")
+    entity_type_enum.drop(op.get_bind())
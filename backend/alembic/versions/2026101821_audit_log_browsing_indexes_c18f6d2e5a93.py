@@ -0,0 +1,33 @@
+"""Audit log browsing indexes
+
+Revision ID: c18f6d2e5a93
+Revises: 7a3c5e91f04b
+Create Date: 2026-10-18 14:02:37.106524
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c18f6d2e5a93"
+down_revision = "7a3c5e91f04b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_audit_logs_time_created", "audit_logs", ["time_created", "id"])
+    op.create_index("ix_audit_logs_type", "audit_logs", ["type", "time_created", "id"])
+    op.create_index(
+        "ix_audit_logs_user_rcsid",
+        "audit_logs",
+        [sa.text("(content ->> 'user_rcsid')"), "time_created"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_audit_logs_user_rcsid", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_type", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_time_created", table_name="audit_logs")
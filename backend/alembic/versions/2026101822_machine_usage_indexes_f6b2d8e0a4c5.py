@@ -0,0 +1,47 @@
+"""Machine usage indexes
+
+Revision ID: f6b2d8e0a4c5
+Revises: c18f6d2e5a93
+Create Date: 2026-10-18 14:48:15.332870
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "f6b2d8e0a4c5"
+down_revision = "c18f6d2e5a93"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_machine_usages_semester_user": ["semester_id", "user_id"],
+    "ix_machine_usages_machine": ["machine_id"],
+}
+
+
+def upgrade():
+    # Built without blocking writes to machine_usages. CONCURRENTLY can't run in a
+    # transaction. If a build fails it leaves an INVALID index behind, drop it and
+    # run the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(
+                name,
+                "machine_usages",
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(
+                name,
+                table_name="machine_usages",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
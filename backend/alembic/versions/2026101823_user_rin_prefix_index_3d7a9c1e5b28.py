@@ -0,0 +1,34 @@
+"""User RIN prefix index in byte order
+
+Revision ID: 3d7a9c1e5b28
+Revises: f6b2d8e0a4c5
+Create Date: 2026-10-18 16:20:44.918305
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3d7a9c1e5b28"
+down_revision = "f6b2d8e0a4c5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A varchar_pattern_ops index can't order results, so generic plans walked the
+    # unique RIN index instead. One on the "C" collation serves the range and the order.
+    op.drop_index("ix_users_rin_prefix", table_name="users")
+    op.create_index("ix_users_rin_prefix", "users", [sa.text('"RIN" COLLATE "C"')])
+
+
+def downgrade():
+    op.drop_index("ix_users_rin_prefix", table_name="users")
+    op.create_index(
+        "ix_users_rin_prefix",
+        "users",
+        ["RIN"],
+        postgresql_ops={"RIN": "varchar_pattern_ops"},
+    )
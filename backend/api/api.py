@@ -3,6 +3,7 @@ from fastapi import APIRouter
 from api.routes import volunteer_actions
 
 from .routes import (
+    audit_logs,
     auth,
     machine_groups,
     machine_types,
@@ -18,6 +19,7 @@ from .routes import (
 )
 
 api_router = APIRouter()
+api_router.include_router(audit_logs.router, tags=["audit_logs"])
 api_router.include_router(auth.router, tags=["auth"])
 api_router.include_router(machine_groups.router, tags=["machine_groups"])
 api_router.include_router(machine_types.router, tags=["machine_types"])
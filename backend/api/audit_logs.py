@@ -0,0 +1,107 @@
+"""
+Audit log queries.
+
+Logs are browsed newest first, filtered by type, time, the RCSID of the user
+who acted and the entity they are about, a page at a time with cursors (see
+`api.pagination`) or exported whole as NDJSON. Detail endpoints embed only
+the latest few logs of their entity, with the cursor of the rest: passing it
+to `/auditlogs` with the same `entity_type` and `entity_id` pages through them.
+"""
+
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.session import async_session
+from models.audit_log import AuditLog, actor_rcsid
+from schemas.enums import EntityType, LogType
+from schemas.responses import AuditLogModel
+from .pagination import fetch_page
+
+# Logs embedded in a detail response
+DETAIL_AUDIT_LOGS = 20
+# Logs fetched from the cursor at a time while exporting
+PARTITION_SIZE = 1000
+
+# Newest first, see `page_audit_logs`
+SORT_KEYS = (AuditLog.time_created, AuditLog.id)
+SCOPE = "time_created"
+
+
+def audit_logs_query(
+    types: Sequence[LogType] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    user_rcsid: str | None = None,
+    entity_type: EntityType | None = None,
+    entity_id: UUID | None = None,
+) -> Select:
+    """Logs matching every filter given. Unordered, `since` inclusive and `until` exclusive."""
+
+    query = select(AuditLog)
+    if types:
+        query = query.where(AuditLog.type.in_(types))
+    if since is not None:
+        query = query.where(AuditLog.time_created >= since)
+    if until is not None:
+        query = query.where(AuditLog.time_created < until)
+    if user_rcsid is not None:
+        query = query.where(actor_rcsid == user_rcsid)
+    if entity_type is not None:
+        query = query.where(AuditLog.entity_type == entity_type)
+    if entity_id is not None:
+        query = query.where(AuditLog.entity_id == entity_id)
+    return query
+
+
+async def page_audit_logs(
+    session: AsyncSession, query: Select, limit: int, cursor: str | None
+) -> tuple[list[AuditLogModel], str | None]:
+    """One page of an `audit_logs_query`, newest first, and the cursor of the next."""
+
+    rows, next_cursor = await fetch_page(
+        session,
+        query,
+        SORT_KEYS,
+        scope=SCOPE,
+        descending=True,
+        limit=limit,
+        offset=0,
+        cursor=cursor or "",
+    )
+    return [AuditLogModel.model_validate(log) for log, in rows], next_cursor
+
+
+async def latest_audit_logs(
+    session: AsyncSession, entity_type: EntityType, entity_id: UUID
+) -> tuple[list[AuditLogModel], str | None]:
+    """The latest logs of an entity for its detail response, and the cursor of the rest."""
+
+    return await page_audit_logs(
+        session,
+        audit_logs_query(entity_type=entity_type, entity_id=entity_id),
+        DETAIL_AUDIT_LOGS,
+        None,
+    )
+
+
+async def ndjson_lines(
+    query: Select, session_maker: async_sessionmaker = async_session
+) -> AsyncIterator[str]:
+    """Every log of an `audit_logs_query`, newest first, one JSON object per line."""
+
+    # Runs while the response is sent, after the request's session is closed
+    async with session_maker() as session:
+        result = await session.stream_scalars(
+            query.order_by(*(key.desc() for key in SORT_KEYS)).execution_options(
+                yield_per=PARTITION_SIZE
+            )
+        )
+        async for partition in result.partitions():
+            yield "".join(
+                AuditLogModel.model_validate(log).model_dump_json() + "\n"
+                for log in partition
+            )
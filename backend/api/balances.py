@@ -0,0 +1,266 @@
+"""
+Per user, per semester balances.
+
+Balances live in `user_semester_balances`, a ledger kept in step with
+`machine_usages` by the flush hooks below: every flush that adds, edits or
+deletes a usage applies the difference it makes to the affected rows, in the
+same transaction. Reading a balance is a primary key lookup however many usages
+it sums. The same statement drops the frozen charge sheets of the semesters it
+touches, see `api.charge_sheets`. Before it, the semesters are locked FOR KEY
+SHARE, which a freeze's FOR UPDATE waits for and blocks in turn, so a charge is
+either in the frozen sheet or drops it.
+
+Usages of the active semester, as cached by `api.utils`, skip both: it is never
+frozen. A freeze still waits for them by locking the semester's balance rows,
+in case this process hadn't yet heard that the semester moved on.
+
+Bulk statements on `machine_usages` skip the ORM and so the ledger too. After
+one, run `python rebuild_balances.py` to recompute the ledger from scratch.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from uuid import UUID
+
+from sqlalchemy import (
+    Row,
+    and_,
+    any_,
+    bindparam,
+    delete,
+    event,
+    func,
+    inspect,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models.charge_sheet_snapshot import ChargeSheetSnapshot
+from models.machine_usage import MachineUsage
+from models.semester import Semester
+from models.user_semester_balance import UserSemesterBalance
+from .utils import peek_active_semester_id
+
+_DELETED_INFO_KEY = "deleted_usage_balances"
+
+# (user id, semester id) -> [balance change, usage count change]
+Deltas = dict[tuple[UUID, UUID], list]
+
+
+def _add(deltas: Deltas, user_id, semester_id, cost, count: int) -> None:
+    # Usages outside of a semester are never charged
+    if semester_id is None:
+        return
+    delta = deltas[(user_id, semester_id)]
+    delta[0] += cost * count
+    delta[1] += count
+
+
+def _old_value(usage: MachineUsage, name: str):
+    history = inspect(usage).attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(usage, name)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_deleted_usages(session: Session, flush_context, instances) -> None:
+    # Read before the flush, deleted rows can't be loaded afterwards
+    deltas: Deltas = defaultdict(lambda: [Decimal(0), 0])
+    for obj in session.deleted:
+        if isinstance(obj, MachineUsage):
+            _add(
+                deltas,
+                _old_value(obj, "user_id"),
+                _old_value(obj, "semester_id"),
+                _old_value(obj, "cost"),
+                -1,
+            )
+    session.info[_DELETED_INFO_KEY] = deltas
+
+
+@event.listens_for(Session, "after_flush")
+def _update_balances(session: Session, flush_context) -> None:
+    """Apply the balance changes of the usages in this flush to the ledger.
+
+    Runs after the flush so new usages have their user and semester ids, even
+    when those were set through relationships.
+    """
+
+    deltas: Deltas = session.info.pop(_DELETED_INFO_KEY, None) or defaultdict(
+        lambda: [Decimal(0), 0]
+    )
+    for obj in session.new:
+        if isinstance(obj, MachineUsage):
+            _add(deltas, obj.user_id, obj.semester_id, obj.cost, 1)
+    for obj in session.dirty:
+        if not isinstance(obj, MachineUsage):
+            continue
+        attrs = inspect(obj).attrs
+        if not any(
+            attrs[name].history.has_changes()
+            for name in ("user_id", "semester_id", "cost")
+        ):
+            continue
+        _add(
+            deltas,
+            _old_value(obj, "user_id"),
+            _old_value(obj, "semester_id"),
+            _old_value(obj, "cost"),
+            -1,
+        )
+        _add(deltas, obj.user_id, obj.semester_id, obj.cost, 1)
+
+    rows = [
+        {
+            "user_id": user_id,
+            "semester_id": semester_id,
+            "balance": balance,
+            "usage_count": usage_count,
+        }
+        # Sorted so concurrent transactions lock rows in the same order
+        for (user_id, semester_id), (balance, usage_count) in sorted(deltas.items())
+        if balance or usage_count
+    ]
+    if not rows:
+        return
+
+    upsert = insert(UserSemesterBalance)
+    semester_ids = sorted({row["semester_id"] for row in rows})
+    # The active semester is never frozen, so ordinary usages skip both the lock
+    # and the snapshot delete
+    if semester_ids != [peek_active_semester_id()]:
+        # Serializes with `freeze_charge_sheet`: without it, a freeze and a usage
+        # committing at the same time can't see each other's rows, and the frozen
+        # sheet misses the charge for good
+        session.execute(
+            select(Semester.id)
+            .where(Semester.id.in_(semester_ids))
+            .with_for_update(read=True, key_share=True)
+        )
+        # An array instead of IN, whose expanding parameter can't run as executemany
+        stale_snapshots = delete(ChargeSheetSnapshot).where(
+            ChargeSheetSnapshot.semester_id
+            == any_(
+                bindparam(
+                    "stale_semester_ids",
+                    semester_ids,
+                    type_=ARRAY(ChargeSheetSnapshot.semester_id.type),
+                )
+            )
+        )
+        upsert = upsert.add_cte(stale_snapshots.cte())
+    session.execute(
+        upsert.on_conflict_do_update(
+            index_elements=[
+                UserSemesterBalance.user_id,
+                UserSemesterBalance.semester_id,
+            ],
+            set_={
+                "balance": UserSemesterBalance.balance + upsert.excluded.balance,
+                "usage_count": UserSemesterBalance.usage_count
+                + upsert.excluded.usage_count,
+            },
+        ),
+        rows,
+    )
+
+
+async def get_semester_balance(
+    session: AsyncSession, user_id: UUID, semester_id: UUID | None
+) -> Decimal:
+    """Return the balance of a user in a semester."""
+
+    if not semester_id:
+        return Decimal(0)
+
+    balance = await session.scalar(
+        select(UserSemesterBalance.balance).where(
+            UserSemesterBalance.user_id == user_id,
+            UserSemesterBalance.semester_id == semester_id,
+        )
+    )
+    return balance or Decimal(0)
+
+
+def _computed_balances():
+    """Balances summed from `machine_usages`, what the ledger should contain."""
+
+    return (
+        select(
+            MachineUsage.user_id,
+            MachineUsage.semester_id,
+            func.sum(MachineUsage.cost).label("balance"),
+            func.count().label("usage_count"),
+        )
+        .where(MachineUsage.semester_id.is_not(None))
+        .group_by(MachineUsage.user_id, MachineUsage.semester_id)
+    )
+
+
+async def find_balance_differences(session: AsyncSession) -> list[Row]:
+    """Compare the ledger with `machine_usages`.
+
+    Returns a row per user and semester where they disagree, with the ledger's
+    balance and usage count and the computed ones.
+    """
+
+    ledger = UserSemesterBalance.__table__
+    computed = _computed_balances().subquery()
+    ledger_balance = func.coalesce(ledger.c.balance, 0)
+    computed_balance = func.coalesce(computed.c.balance, 0)
+    ledger_count = func.coalesce(ledger.c.usage_count, 0)
+    computed_count = func.coalesce(computed.c.usage_count, 0)
+
+    return (
+        await session.execute(
+            select(
+                func.coalesce(ledger.c.user_id, computed.c.user_id).label("user_id"),
+                func.coalesce(ledger.c.semester_id, computed.c.semester_id).label(
+                    "semester_id"
+                ),
+                ledger_balance.label("ledger_balance"),
+                computed_balance.label("computed_balance"),
+                ledger_count.label("ledger_usage_count"),
+                computed_count.label("computed_usage_count"),
+            )
+            .select_from(
+                ledger.join(
+                    computed,
+                    and_(
+                        ledger.c.user_id == computed.c.user_id,
+                        ledger.c.semester_id == computed.c.semester_id,
+                    ),
+                    full=True,
+                )
+            )
+            .where(
+                or_(
+                    ledger_balance != computed_balance,
+                    ledger_count != computed_count,
+                )
+            )
+        )
+    ).all()
+
+
+async def rebuild_balances(session: AsyncSession) -> int:
+    """Recompute the whole ledger from `machine_usages`, returns the number of rows.
+
+    Frozen charge sheets are dropped too, they are made again from the new
+    ledger when next requested. Usages can't be written until the session
+    commits.
+    """
+
+    await session.execute(text("LOCK TABLE machine_usages IN SHARE MODE"))
+    await session.execute(delete(ChargeSheetSnapshot))
+    await session.execute(delete(UserSemesterBalance))
+    computed = _computed_balances()
+    result = await session.execute(
+        insert(UserSemesterBalance).from_select(
+            ["user_id", "semester_id", "balance", "usage_count"], computed
+        )
+    )
+    return result.rowcount
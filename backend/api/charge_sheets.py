@@ -0,0 +1,321 @@
+"""
+Charge sheet exports.
+
+A charge sheet lists everyone with usages in a semester and what they owe.
+Rows come from a single query over the balance ledger, read through a
+server-side cursor a partition at a time and written out as they arrive, so
+an export takes the same memory for a hundred users or a hundred thousand.
+
+The charges of a semester that is no longer active shouldn't change, so the
+first time its charge sheet is requested it is frozen into
+`charge_sheet_snapshots`, with a hash of its contents, and served from there.
+Not when the active semester moves on: other processes take a moment to hear
+of it, and meanwhile still write its usages as the active semester's, without
+the lock a freeze relies on (see `api.balances`). A snapshot is dropped when
+its semester becomes active again or a balance in it changes anyway, and made
+again when next requested.
+
+JSON exports are a list of `UserChargeResponse`, streamed the same way.
+XLSX exports have a sheet for graduating users and one for everyone else,
+written by XlsxWriter in constant memory mode into a temporary file. CSV can't
+hold two sheets, so CSV exports carry an "Is Graduating" column, and can be
+limited to either group.
+
+https://xlsxwriter.readthedocs.io/working_with_memory.html
+"""
+
+import asyncio
+import csv
+import io
+import tempfile
+from collections.abc import AsyncIterator, Sequence
+from decimal import ROUND_HALF_EVEN, Decimal
+from uuid import UUID
+
+import xlsxwriter
+from sqlalchemy import Row, Select, delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.session import async_session
+from models.charge_sheet_snapshot import ChargeSheetSnapshot, ChargeSheetSnapshotRow
+from models.semester import Semester
+from models.user import User
+from models.user_semester_balance import UserSemesterBalance
+from schemas.responses import UserChargeResponse
+from .pricing import CENT
+
+# Rows fetched from the cursor at a time
+PARTITION_SIZE = 1000
+# Bytes of the finished XLSX file sent at a time
+FILE_CHUNK_SIZE = 64 * 1024
+
+HEADER = (
+    "RIN",
+    "First Name",
+    "Last Name",
+    "Membership Charge",
+    "Usages Charge",
+    "Total Charge",
+)
+
+
+def charges_query(semester_id: UUID, graduating: bool | None = None) -> Select:
+    """Everyone charged for a semester, non-graduating users first."""
+
+    query = (
+        select(
+            User.RIN,
+            User.first_name,
+            User.last_name,
+            User.is_graduating,
+            UserSemesterBalance.balance,
+        )
+        .join(UserSemesterBalance, UserSemesterBalance.user_id == User.id)
+        .where(
+            UserSemesterBalance.semester_id == semester_id,
+            UserSemesterBalance.usage_count > 0,
+        )
+        .order_by(User.is_graduating, User.last_name, User.first_name, User.RIN)
+    )
+    if graduating is not None:
+        query = query.where(User.is_graduating == graduating)
+    return query
+
+
+def snapshot_query(semester_id: UUID, graduating: bool | None = None) -> Select:
+    """`charges_query`, served from a semester's frozen charge sheet."""
+
+    query = (
+        select(
+            ChargeSheetSnapshotRow.RIN,
+            ChargeSheetSnapshotRow.first_name,
+            ChargeSheetSnapshotRow.last_name,
+            ChargeSheetSnapshotRow.is_graduating,
+            ChargeSheetSnapshotRow.balance,
+        )
+        .where(ChargeSheetSnapshotRow.semester_id == semester_id)
+        .order_by(
+            ChargeSheetSnapshotRow.is_graduating,
+            ChargeSheetSnapshotRow.last_name,
+            ChargeSheetSnapshotRow.first_name,
+            ChargeSheetSnapshotRow.RIN,
+        )
+    )
+    if graduating is not None:
+        query = query.where(ChargeSheetSnapshotRow.is_graduating == graduating)
+    return query
+
+
+async def freeze_charge_sheet(session: AsyncSession, semester_id: UUID) -> str:
+    """Snapshot the charge sheet of a semester if it isn't already, returns its hash.
+
+    Doesn't commit, and holds a lock on the semester until the session does:
+    usages of the semester can't be written meanwhile, see `api.balances`.
+    """
+
+    # A committed snapshot is current, balance changes drop it in their transaction
+    content_hash = await session.scalar(
+        select(ChargeSheetSnapshot.content_hash).where(
+            ChargeSheetSnapshot.semester_id == semester_id
+        )
+    )
+    if content_hash is not None:
+        return content_hash
+
+    # Waits for transactions writing usages of this semester to commit, so the
+    # snapshot includes their charges, and keeps new ones out until this commits
+    await session.execute(
+        select(Semester.id).where(Semester.id == semester_id).with_for_update()
+    )
+    # Usages written as the active semester don't lock it themselves. Until they
+    # commit, new balance rows hold a foreign key lock on the semester, which the
+    # line above waits for, and updated ones are locked, which this waits for.
+    await session.execute(
+        select(UserSemesterBalance.user_id)
+        .where(UserSemesterBalance.semester_id == semester_id)
+        .with_for_update(read=True)
+    )
+
+    # Waits for a concurrent freeze of the same semester, then uses its snapshot
+    created = await session.scalar(
+        insert(ChargeSheetSnapshot)
+        .values(semester_id=semester_id, content_hash="", row_count=0)
+        .on_conflict_do_nothing()
+        .returning(ChargeSheetSnapshot.semester_id)
+    )
+    if created is None:
+        return await session.scalar(
+            select(ChargeSheetSnapshot.content_hash).where(
+                ChargeSheetSnapshot.semester_id == semester_id
+            )
+        )
+
+    charges = charges_query(semester_id).order_by(None)
+    await session.execute(
+        insert(ChargeSheetSnapshotRow).from_select(
+            [
+                "semester_id",
+                "user_id",
+                "RIN",
+                "first_name",
+                "last_name",
+                "is_graduating",
+                "balance",
+            ],
+            charges.with_only_columns(
+                literal(semester_id).label("semester_id"),
+                User.id,
+                *charges.selected_columns,
+            ),
+        )
+    )
+
+    # Hash of the rows in user id order, one comma separated line per user
+    rows = (
+        select(ChargeSheetSnapshotRow)
+        .where(ChargeSheetSnapshotRow.semester_id == semester_id)
+        .subquery()
+    )
+    lines = func.string_agg(
+        func.concat_ws(
+            ",",
+            rows.c.user_id,
+            rows.c.RIN,
+            rows.c.first_name,
+            rows.c.last_name,
+            rows.c.is_graduating,
+            rows.c.balance,
+        ),
+        aggregate_order_by(literal("\n"), rows.c.user_id),
+    )
+    content_hash, row_count = (
+        await session.execute(
+            select(
+                func.encode(
+                    func.sha256(func.convert_to(func.coalesce(lines, ""), "UTF8")),
+                    "hex",
+                ),
+                func.count(),
+            )
+        )
+    ).one()
+    await session.execute(
+        update(ChargeSheetSnapshot)
+        .where(ChargeSheetSnapshot.semester_id == semester_id)
+        .values(content_hash=content_hash, row_count=row_count)
+    )
+    return content_hash
+
+
+async def thaw_charge_sheet(session: AsyncSession, semester_id: UUID) -> None:
+    """Drop the snapshot of a semester that is active again. Doesn't commit."""
+
+    await session.execute(
+        delete(ChargeSheetSnapshot).where(
+            ChargeSheetSnapshot.semester_id == semester_id
+        )
+    )
+
+
+async def stream_charges(query: Select) -> AsyncIterator[Sequence[Row]]:
+    """Run a charges query on its own session, yielding partitions of rows."""
+
+    # Runs while the response is sent, after the request's session is closed
+    async with async_session() as session:
+        result = await session.stream(query.execution_options(yield_per=PARTITION_SIZE))
+        async for partition in result.partitions():
+            yield partition
+
+
+def _charges(row: Row, membership_charge: Decimal) -> tuple[Decimal, Decimal, Decimal]:
+    """Membership, usages and total charge of a row, in cents."""
+
+    membership_charge = membership_charge.quantize(CENT)
+    usages_charge = row.balance.quantize(CENT, rounding=ROUND_HALF_EVEN)
+    return membership_charge, usages_charge, membership_charge + usages_charge
+
+
+def _csv_safe(value: str) -> str:
+    # Spreadsheets run cells starting with these as formulas
+    return "'" + value if value.startswith(("=", "+", "-", "@")) else value
+
+
+async def json_chunks(partitions: AsyncIterator[Sequence[Row]]) -> AsyncIterator[bytes]:
+    yield b"["
+    separator = b""
+    async for partition in partitions:
+        yield separator + b",".join(
+            UserChargeResponse(
+                RIN=row.RIN,
+                first_name=row.first_name,
+                last_name=row.last_name,
+                is_graduating=row.is_graduating,
+                semester_balance=row.balance,
+            )
+            .model_dump_json()
+            .encode()
+            for row in partition
+        )
+        separator = b","
+    yield b"]"
+
+
+async def csv_chunks(
+    partitions: AsyncIterator[Sequence[Row]], membership_charge: Decimal
+) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow((*HEADER, "Is Graduating"))
+
+    async for partition in partitions:
+        for row in partition:
+            writer.writerow(
+                (
+                    row.RIN,
+                    _csv_safe(row.first_name),
+                    _csv_safe(row.last_name),
+                    *_charges(row, membership_charge),
+                    row.is_graduating,
+                )
+            )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def xlsx_chunks(
+    partitions: AsyncIterator[Sequence[Row]], membership_charge: Decimal
+) -> AsyncIterator[bytes]:
+    with tempfile.TemporaryFile() as file:
+        # Rows are flushed to disk as soon as the next one is written
+        workbook = xlsxwriter.Workbook(file, {"constant_memory": True})
+        money = workbook.add_format({"num_format": "0.00"})
+        sheets = {
+            False: workbook.add_worksheet("Not Graduating"),
+            True: workbook.add_worksheet("Graduating"),
+        }
+        next_rows = {False: 1, True: 1}
+        for sheet in sheets.values():
+            sheet.write_row(0, 0, HEADER)
+
+        async for partition in partitions:
+            for row in partition:
+                sheet = sheets[row.is_graduating]
+                index = next_rows[row.is_graduating]
+                sheet.write_string(index, 0, row.RIN)
+                sheet.write_string(index, 1, row.first_name)
+                sheet.write_string(index, 2, row.last_name)
+                for column, charge in enumerate(_charges(row, membership_charge), 3):
+                    sheet.write_number(index, column, charge, money)
+                next_rows[row.is_graduating] = index + 1
+
+        # Zipping up the sheets is the slow part, keep it off the event loop
+        await asyncio.to_thread(workbook.close)
+
+        file.seek(0)
+        while chunk := file.read(FILE_CHUNK_SIZE):
+            yield chunk
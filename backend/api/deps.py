@@ -1,14 +1,18 @@
+import hashlib
 import time
 from collections.abc import AsyncGenerator
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core import config, security
+from core.invalidation import INSTANCE_ID, Topic, topic_version
+from core.permissions import LOCKOUT_MASK, PERMISSION_SCHEMA, SUPERUSER_MASK, to_mask
+from core.replica import read_session_maker
 from core.session import async_session
 from models.user import User
 from schemas.enums import Permissions
@@ -28,12 +32,25 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
 DBSession = Annotated[AsyncSession, Depends(get_session)]
 
 
-async def get_current_user(
-    session: AsyncSession = Depends(get_session),
+async def get_read_only_session(
+    request: Request,
+) -> AsyncGenerator[AsyncSession, None]:
+    session_maker = await read_session_maker(request)
+    async with session_maker() as session:
+        yield session
+
+
+# A session on the read replica when there is a usable one, see `core.replica`.
+# Never write through it, and don't fill caches from it: keep a DBSession for
+# permission checks.
+ReadOnlyDBSession = Annotated[AsyncSession, Depends(get_read_only_session)]
+
+
+async def get_token_payload(
     token: str = Depends(
         reusable_oauth2
     ),  # The token is pulled all the way from the calling request, thanks to Depends
-) -> User:
+) -> security.JWTTokenPayload:
     try:
         payload = jwt.decode(
             token, config.settings.SECRET_KEY, algorithms=[security.JWT_ALGORITHM]
@@ -53,6 +70,13 @@ async def get_current_user(
             detail="Could not validate credentials, token expired or not yet valid",
         )
 
+    return token_data
+
+
+async def get_current_user(
+    session: AsyncSession = Depends(get_session),
+    token_data: security.JWTTokenPayload = Depends(get_token_payload),
+) -> User:
     result = await session.execute(select(User).where(User.RCSID == token_data.sub))
     user = result.scalars().first()
 
@@ -61,29 +85,134 @@ async def get_current_user(
     return user
 
 
+def check_permission_mask(user_mask: int, required_mask: int) -> None:
+    """Raise if a user with `user_mask` may not access something requiring `required_mask`."""
+
+    if user_mask & SUPERUSER_MASK:
+        return
+
+    if user_mask & LOCKOUT_MASK:
+        raise HTTPException(
+            status_code=403,
+            detail="User access has been disabled by an administrator",
+        )
+
+    if user_mask & required_mask != required_mask:
+        raise HTTPException(status_code=403, detail="User lacks required permissions")
+
+
 class PermittedUserChecker:
     def __init__(self, required_permissions: set[Permissions]):
         self.required_permissions = required_permissions
+        # Compiled once per route, so each check is a single AND and compare
+        self.required_mask = to_mask(required_permissions)
 
     async def __call__(
         self,
         session: AsyncSession = Depends(get_session),
         current_user: User = Depends(get_current_user),
     ) -> User:
-        user_permissions = await utils.get_user_permissions(session, current_user.id)
+        user_mask = await utils.get_user_permission_mask(session, current_user.id)
+        check_permission_mask(user_mask, self.required_mask)
+        return current_user
 
-        if Permissions.IS_SUPERUSER in user_permissions:
-            return current_user
 
-        if Permissions.LOCKOUT in user_permissions:
-            raise HTTPException(
-                status_code=403,
-                detail="User access has been disabled by an administrator",
-            )
+class PermittedTokenChecker:
+    """Permission check for read-only endpoints that don't need the `User` row.
+
+    With JWT_PERMISSION_CLAIMS enabled, the permissions signed into the token
+    are used as long as the user's permission epoch hasn't moved since it was
+    issued, so a warm request doesn't touch the database. Tokens without
+    claims, or with stale ones, are checked the same way as PermittedUserChecker.
+    """
+
+    def __init__(self, required_permissions: set[Permissions]):
+        self.required_permissions = required_permissions
+        self.required_mask = to_mask(required_permissions)
+
+    async def __call__(
+        self,
+        session: AsyncSession = Depends(get_session),
+        token_data: security.JWTTokenPayload = Depends(get_token_payload),
+    ) -> security.JWTTokenPayload:
+        claims = token_data.permission_claims
+        if (
+            config.settings.JWT_PERMISSION_CLAIMS
+            and claims is not None
+            and claims.perm_schema == PERMISSION_SCHEMA
+            and claims.epoch == await utils.get_permission_epoch(session, claims.uid)
+        ):
+            check_permission_mask(claims.perms, self.required_mask)
+            return token_data
+
+        user_id = await session.scalar(
+            select(User.id).where(User.RCSID == token_data.sub)
+        )
+        if not user_id:
+            raise HTTPException(status_code=404, detail="User not found.")
+
+        user_mask = await utils.get_user_permission_mask(session, user_id)
+        check_permission_mask(user_mask, self.required_mask)
+        return token_data
 
-        if not self.required_permissions.issubset(user_permissions):
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already holds `etag`."""
+
+    if_none_match = request.headers.get("If-None-Match")
+    return if_none_match is not None and (
+        if_none_match.strip() == "*"
+        or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    )
+
+
+class VersionedETag:
+    """Strong ETag for responses built only from the tables behind `topics`.
+
+    The tag combines this process' instance id, the current version of each
+    topic, the current `max_age_seconds` window and the request path and query.
+    The window bounds how long a missed invalidation, e.g. while the
+    invalidation listener reconnects, keeps a stale response valid: tags
+    change at least that often, defaulting to ETAG_MAX_AGE_SECONDS. A request
+    whose If-None-Match already holds it gets a 304 without the route running
+    at all. Otherwise the tag is set on the response and returned, for routes
+    that build their own `Response`.
+
+    Topic versions are read before the route queries anything, so a response
+    is never tagged as newer than the data it contains.
+
+    Declare it before the route's permission check, so a 304 skips that check's
+    queries too. With `authenticated`, a 304 still needs a valid token, but not
+    the permissions: it only tells a client that the copy it was once allowed
+    to see is unchanged.
+    """
+
+    def __init__(
+        self,
+        *topics: Topic,
+        max_age_seconds: int | None = None,
+        authenticated: bool = False,
+    ):
+        self.topics = topics
+        self.max_age_seconds = max_age_seconds
+        self.authenticated = authenticated
+
+    async def __call__(self, request: Request, response: Response) -> str:
+        versions = ".".join(str(topic_version(topic)) for topic in self.topics)
+        max_age = self.max_age_seconds or config.settings.ETAG_MAX_AGE_SECONDS
+        window = int(time.time() // max_age)
+        url_hash = hashlib.blake2b(
+            f"{request.url.path}?{request.url.query}".encode(), digest_size=6
+        ).hexdigest()
+        etag = f'"{INSTANCE_ID}-{versions}-{window}-{url_hash}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        if etag_matches(request, etag):
+            if self.authenticated:
+                await get_token_payload(await reusable_oauth2(request))
             raise HTTPException(
-                status_code=403, detail="User lacks required permissions"
+                status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
             )
 
-        return current_user
+        response.headers.update(headers)
+        return etag
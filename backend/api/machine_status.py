@@ -0,0 +1,167 @@
+"""
+Process-wide snapshot of the public machine status.
+
+`/machinestatus` is unauthenticated and polled by every open status page and
+the Discord bot, but the data behind it only changes when a machine is used,
+cleared, failed or edited. The response is built once, serialized to bytes and
+served as-is until one of the tables it reads from is committed to, or
+MACHINE_STATUS_MAX_AGE_SECONDS passes.
+"""
+
+import asyncio
+import time
+from typing import NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from core import config
+from core.invalidation import Keys, Topic, cache_lookups, subscribe
+from core.session import async_session
+from models.machine import Machine
+from models.machine_usage import MachineUsage
+from schemas.responses import (
+    AllMachinesStatusResponse,
+    MachineStatus,
+    MachineStatusGroup,
+)
+
+STATUS_TOPICS = (
+    Topic.MACHINES,
+    Topic.MACHINE_GROUPS,
+    Topic.MACHINE_TYPES,
+    Topic.MACHINE_USAGES,
+    Topic.USERS,
+)
+
+
+class _Snapshot(NamedTuple):
+    status: AllMachinesStatusResponse
+    body: bytes
+    # Monotonic time the snapshot was built
+    built_at: float
+
+
+_snapshot: _Snapshot | None = None
+
+# Bumped on every eviction, so a rebuild that raced an eviction won't be stored.
+_snapshot_generation = 0
+
+# Only one request rebuilds the snapshot, the others wait for its result
+_rebuild_lock = asyncio.Lock()
+
+
+def _evict_snapshot(keys: Keys) -> None:
+    global _snapshot, _snapshot_generation
+    _snapshot_generation += 1
+    _snapshot = None
+
+
+for topic in STATUS_TOPICS:
+    subscribe(topic, _evict_snapshot)
+
+
+def _machine_status(machine: Machine) -> MachineStatus:
+    usage = machine.active_usage
+    return MachineStatus.model_validate(
+        {
+            "in_use": usage is not None,
+            "group_id": machine.group_id,
+            "type_id": machine.type_id,
+            "failed": usage.failed if usage else False,
+            "failed_at": usage.failed_at if usage else None,
+            "usage_start": usage.time_started if usage else None,
+            "usage_duration": usage.duration_seconds if usage else None,
+            "user_id": usage.user.id if usage and usage.user else None,
+            "user_name": (
+                f"{usage.user.first_name} {usage.user.last_name[0]}."
+                if usage and usage.user
+                else None
+            ),
+            **machine.__dict__,
+        }
+    )
+
+
+async def build_machines_status(session: AsyncSession) -> AllMachinesStatusResponse:
+    """Load every machine and group them the way the status page shows them."""
+
+    machines = (
+        await session.scalars(
+            select(Machine)
+            .options(selectinload(Machine.active_usage).selectinload(MachineUsage.user))
+            .options(selectinload(Machine.group))
+            .order_by(Machine.name)
+        )
+    ).all()
+
+    group_dict: dict[object, list[Machine]] = {}
+    for machine in machines:
+        key = machine.group_id if machine.group_id is not None else ""
+        group_dict.setdefault(key, []).append(machine)
+
+    group_list = []
+    loner_list = []
+    for group in group_dict.values():
+        machine_statuses = [_machine_status(machine) for machine in group]
+
+        first_machine = group[0]
+        if first_machine.group is None:
+            loner_list = machine_statuses
+        else:
+            group_list.append(
+                MachineStatusGroup(
+                    name=first_machine.group.name,
+                    machines=machine_statuses,
+                )
+            )
+
+    return AllMachinesStatusResponse(groups=group_list, loners=loner_list)
+
+
+async def get_machines_status() -> AllMachinesStatusResponse:
+    """Return the current machine status, rebuilding it only if it was evicted or expired."""
+    return (await _get_snapshot()).status
+
+
+async def get_machines_status_snapshot() -> bytes:
+    """Same as `get_machines_status`, already serialized to JSON."""
+    return (await _get_snapshot()).body
+
+
+def _is_fresh(snapshot: _Snapshot | None) -> bool:
+    return (
+        snapshot is not None
+        and time.monotonic() - snapshot.built_at
+        < config.settings.MACHINE_STATUS_MAX_AGE_SECONDS
+    )
+
+
+async def _get_snapshot() -> _Snapshot:
+    if _is_fresh(_snapshot):
+        cache_lookups.inc(cache="machine_status", result="hit")
+        return _snapshot
+
+    async with _rebuild_lock:
+        # Someone else may have rebuilt it while we waited
+        if _is_fresh(_snapshot):
+            cache_lookups.inc(cache="machine_status", result="hit")
+            return _snapshot
+
+        cache_lookups.inc(cache="machine_status", result="miss")
+        return await _rebuild_snapshot()
+
+
+async def _rebuild_snapshot() -> _Snapshot:
+    global _snapshot
+
+    generation = _snapshot_generation
+    built_at = time.monotonic()
+    async with async_session() as session:
+        status = await build_machines_status(session)
+    snapshot = _Snapshot(status, status.model_dump_json().encode(), built_at)
+
+    if generation == _snapshot_generation:
+        _snapshot = snapshot
+    return snapshot
@@ -0,0 +1,180 @@
+"""
+Offset and keyset (cursor) pagination for list endpoints.
+
+List endpoints take a `limit` and either an `offset`, returning a plain list
+like they always have, or a `cursor`, returning a `CursorPage` of
+`{"items": [...], "next_cursor": ...}`. An empty `cursor` gets the first page,
+the `next_cursor` of a page gets the page after it, until it is null.
+
+A cursor holds the sort key values of the last row of its page, ending with its
+id as a tiebreaker. The next page starts where the sort keys are past those
+values, which an index on the sort keys answers directly instead of skipping
+`offset` rows, and rows added or removed while paging don't shift later pages.
+A cursor is only valid with the `order_by` and `descending` it was made with.
+
+https://use-the-index-luke.com/no-offset
+"""
+
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Annotated, NamedTuple
+
+from fastapi import HTTPException, Query, status
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import ColumnElement, Select, and_, false, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from schemas.responses import CursorPage
+
+INVALID_CURSOR_ERROR = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail="Invalid cursor, it may be from a different ordering",
+)
+
+# `limit` and `offset` of list endpoints. Some pages fetch up to 1000 rows at once.
+PageLimit = Annotated[int, Query(ge=1, le=1000)]
+PageOffset = Annotated[int, Query(ge=0)]
+
+
+class SortKey(NamedTuple):
+    expression: ColumnElement
+    # Can be NULL, e.g. through an outer join. Postgres sorts NULL after every value.
+    nullable: bool = False
+
+
+@lru_cache
+def _adapter(python_type: type) -> TypeAdapter:
+    return TypeAdapter(python_type)
+
+
+def _encode_cursor(scope: str, keys: Sequence[SortKey], values: Sequence) -> str:
+    encoded = [
+        (
+            None
+            if value is None
+            else _adapter(key.expression.type.python_type).dump_python(
+                value, mode="json"
+            )
+        )
+        for key, value in zip(keys, values)
+    ]
+    payload = json.dumps({"s": scope, "k": encoded}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, scope: str, keys: Sequence[SortKey]) -> list:
+    try:
+        payload = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        if payload["s"] != scope or len(payload["k"]) != len(keys):
+            raise INVALID_CURSOR_ERROR
+        return [
+            (
+                None
+                if value is None
+                else _adapter(key.expression.type.python_type).validate_python(value)
+            )
+            for key, value in zip(keys, payload["k"])
+        ]
+    except (binascii.Error, ValueError, KeyError, TypeError, ValidationError):
+        raise INVALID_CURSOR_ERROR
+
+
+def _past(key: SortKey, value, descending: bool) -> ColumnElement[bool]:
+    """Rows whose `key` sorts after `value`."""
+
+    column = key.expression
+    if descending:
+        # NULLs come first
+        return column.is_not(None) if value is None else column < value
+    if value is None:
+        return false()
+    return or_(column > value, column.is_(None)) if key.nullable else column > value
+
+
+def _after(
+    keys: Sequence[SortKey], values: Sequence, descending: bool
+) -> ColumnElement[bool]:
+    """Rows that sort after the row with the given key values."""
+
+    if not any(key.nullable for key in keys):
+        # One row comparison, which Postgres matches against a composite index
+        columns = tuple_(*(key.expression for key in keys))
+        return columns < tuple(values) if descending else columns > tuple(values)
+
+    # (k1 past v1) or (k1 = v1 and k2 past v2) or ...
+    conditions = []
+    for index, (key, value) in enumerate(zip(keys, values)):
+        equal = [
+            (
+                previous.expression.is_(None)
+                if previous_value is None
+                else previous.expression == previous_value
+            )
+            for previous, previous_value in zip(keys[:index], values[:index])
+        ]
+        conditions.append(and_(*equal, _past(key, value, descending)))
+    return or_(*conditions)
+
+
+async def fetch_page(
+    session: AsyncSession,
+    query: Select,
+    keys: Sequence[SortKey | ColumnElement],
+    *,
+    scope: str,
+    descending: bool,
+    limit: int,
+    offset: int,
+    cursor: str | None,
+) -> tuple[list[tuple], str | None]:
+    """Run a list query for one page, ordered by `keys`.
+
+    `keys` must end with a unique, non-null column, normally the id. `scope`
+    names the ordering, normally `order_by`, so cursors can't be used with
+    another one or the other direction.
+    Returns the rows, with the columns of `query`, and the cursor of the next
+    page: None in offset mode or on the last page.
+    """
+
+    keys = [key if isinstance(key, SortKey) else SortKey(key) for key in keys]
+    scope = f"{scope}:{'desc' if descending else 'asc'}"
+    width = len(query.column_descriptions)
+    ordering = [key.expression.desc() if descending else key.expression for key in keys]
+
+    if cursor is None:
+        rows = (
+            await session.execute(query.order_by(*ordering).offset(offset).limit(limit))
+        ).all()
+        return [row[:width] for row in rows], None
+
+    if cursor:
+        query = query.where(
+            _after(keys, _decode_cursor(cursor, scope, keys), descending)
+        )
+    # One extra row tells whether there is a next page
+    rows = (
+        await session.execute(
+            query.add_columns(*(key.expression for key in keys))
+            .order_by(*ordering)
+            .limit(limit + 1)
+        )
+    ).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(scope, keys, rows[-1][width:])
+    return [row[:width] for row in rows], next_cursor
+
+
+def page_response(items: list, next_cursor: str | None, cursor: str | None):
+    """The response of a list endpoint: a plain list in offset mode, else a `CursorPage`."""
+
+    if cursor is None:
+        return items
+    return CursorPage(items=items, next_cursor=next_cursor)
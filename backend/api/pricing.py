@@ -0,0 +1,233 @@
+"""
+Compiled pricing plans for machine types.
+
+A plan is everything needed to validate and price a usage of a machine type:
+its hourly rate and its resource slots, with the valid resources of each slot
+indexed by id. Plans are compiled once per type and cached until a type, slot
+or resource is changed, so quoting a usage is dictionary lookups and Decimal
+math only.
+
+Money is only ever handled as Decimal. Time on a machine is rounded to the cent
+with banker's rounding, resource costs are exact.
+"""
+
+from dataclasses import dataclass
+from decimal import ROUND_HALF_EVEN, Decimal
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from core import config
+from core.invalidation import Keys, Topic, cache_lookups, subscribe
+from models.machine import Machine
+from models.machine_type import MachineType
+from models.resource_slot import ResourceSlot
+from schemas.requests import MachineUsageRequest
+from schemas.responses import UsageQuoteLine, UsageQuoteResponse
+
+CENT = Decimal("0.01")
+SECONDS_PER_HOUR = Decimal(3600)
+
+
+@dataclass(frozen=True, slots=True)
+class ResourcePlan:
+    id: UUID
+    name: str
+    units: str
+    cost: Decimal
+
+
+@dataclass(frozen=True, slots=True)
+class SlotPlan:
+    id: UUID
+    allow_own_material: bool
+    allow_empty: bool
+    resources: dict[UUID, ResourcePlan]
+
+
+@dataclass(frozen=True, slots=True)
+class PricingPlan:
+    machine_type_id: UUID
+    cost_per_hour: Decimal
+    slots: dict[UUID, SlotPlan]
+    required_slot_ids: frozenset[UUID]
+
+    def quote(
+        self, machine_id: UUID, request: MachineUsageRequest
+    ) -> UsageQuoteResponse:
+        """Validate a usage request against this plan and price it."""
+
+        # Check that required resource slot ids is subset of the provided resource slots
+        if not self.required_slot_ids <= request.resource_usages.keys():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="One or more required resource slots not populated",
+            )
+
+        # Check that no non-existent slots were provided
+        if not request.resource_usages.keys() <= self.slots.keys():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="One or more provided resource slots not found",
+            )
+
+        machine_cost = (
+            Decimal(request.duration_seconds) * self.cost_per_hour / SECONDS_PER_HOUR
+        ).quantize(CENT, rounding=ROUND_HALF_EVEN)
+
+        lines: list[UsageQuoteLine] = []
+        for resource_slot_id, usage_info in request.resource_usages.items():
+            slot = self.slots[resource_slot_id]
+            resource = slot.resources.get(usage_info.resource_id)
+            if not resource:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Resource ID {usage_info.resource_id} not found",
+                )
+
+            if usage_info.is_own_material and not slot.allow_own_material:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Resource Slot {resource_slot_id} is marked as own material but cannot be",
+                )
+
+            lines.append(
+                UsageQuoteLine(
+                    resource_slot_id=resource_slot_id,
+                    resource_id=resource.id,
+                    resource_name=resource.name,
+                    units=resource.units,
+                    amount=usage_info.amount,
+                    is_own_material=usage_info.is_own_material,
+                    unit_cost=resource.cost,
+                    cost=(
+                        Decimal(0)
+                        if usage_info.is_own_material
+                        else usage_info.amount * resource.cost
+                    ),
+                )
+            )
+
+        return UsageQuoteResponse(
+            machine_id=machine_id,
+            duration_seconds=request.duration_seconds,
+            machine_cost=machine_cost,
+            resources=lines,
+            total_cost=machine_cost + sum((line.cost for line in lines), Decimal(0)),
+        )
+
+
+def compile_plan(machine_type: MachineType) -> PricingPlan:
+    """Build the plan of a type, its slots and their valid resources must be loaded."""
+
+    slots = {
+        slot.id: SlotPlan(
+            id=slot.id,
+            allow_own_material=slot.allow_own_material,
+            allow_empty=slot.allow_empty,
+            resources={
+                resource.id: ResourcePlan(
+                    id=resource.id,
+                    name=resource.name,
+                    units=resource.units,
+                    cost=resource.cost,
+                )
+                for resource in slot.valid_resources
+            },
+        )
+        for slot in machine_type.resource_slots
+    }
+    return PricingPlan(
+        machine_type_id=machine_type.id,
+        cost_per_hour=machine_type.cost_per_hour,
+        slots=slots,
+        required_slot_ids=frozenset(
+            slot.id for slot in slots.values() if not slot.allow_empty
+        ),
+    )
+
+
+# Compiled plans per machine type id
+_plan_cache: dict[UUID, PricingPlan] = {}
+_plan_cache_generation = 0
+
+# (type id, disabled) per machine id, so quotes don't need to read the machine
+_machine_cache: dict[UUID, tuple[UUID, bool]] = {}
+_machine_cache_generation = 0
+
+
+def _evict_plans(keys: Keys) -> None:
+    global _plan_cache_generation
+    _plan_cache_generation += 1
+    _plan_cache.clear()
+
+
+def _evict_machines(keys: Keys) -> None:
+    global _machine_cache_generation
+    _machine_cache_generation += 1
+    _machine_cache.clear()
+
+
+for topic in (Topic.MACHINE_TYPES, Topic.RESOURCE_SLOTS, Topic.RESOURCES):
+    subscribe(topic, _evict_plans)
+# Claims and clears only change which usage a machine is running
+subscribe(Topic.MACHINE_CATALOG, _evict_machines)
+
+
+async def get_pricing_plan(session: AsyncSession, machine_type_id: UUID) -> PricingPlan:
+    """Return the pricing plan of a machine type, compiling it if it isn't cached."""
+
+    plan = _plan_cache.get(machine_type_id)
+    if plan is not None:
+        cache_lookups.inc(cache="pricing_plans", result="hit")
+        return plan
+    cache_lookups.inc(cache="pricing_plans", result="miss")
+
+    generation = _plan_cache_generation
+    machine_type = await session.scalar(
+        select(MachineType)
+        .where(MachineType.id == machine_type_id)
+        .options(
+            selectinload(MachineType.resource_slots).selectinload(
+                ResourceSlot.valid_resources
+            )
+        )
+    )
+    plan = compile_plan(machine_type)
+
+    if generation == _plan_cache_generation:
+        if len(_plan_cache) >= config.settings.PRICING_PLAN_CACHE_SIZE:
+            del _plan_cache[next(iter(_plan_cache))]
+        _plan_cache[machine_type_id] = plan
+    return plan
+
+
+async def get_machine_type_id(
+    session: AsyncSession, machine_id: UUID
+) -> tuple[UUID, bool] | None:
+    """Return the type id of a machine and whether it is disabled, or None if it doesn't exist."""
+
+    cached = _machine_cache.get(machine_id)
+    if cached is not None:
+        cache_lookups.inc(cache="pricing_machines", result="hit")
+        return cached
+    cache_lookups.inc(cache="pricing_machines", result="miss")
+
+    generation = _machine_cache_generation
+    row = (
+        await session.execute(
+            select(Machine.type_id, Machine.disabled).where(Machine.id == machine_id)
+        )
+    ).one_or_none()
+    if row is None:
+        return None
+
+    cached = (row.type_id, row.disabled)
+    if generation == _machine_cache_generation:
+        if len(_machine_cache) >= config.settings.PRICING_PLAN_CACHE_SIZE:
+            del _machine_cache[next(iter(_machine_cache))]
+        _machine_cache[machine_id] = cached
+    return cached
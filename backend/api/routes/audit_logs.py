@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import Annotated, Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from core.permissions import to_mask
+from models.user import User
+from schemas.enums import EntityType, LogType, Permissions
+from schemas.responses import AuditLogModel, CursorPage
+
+from ..audit_logs import audit_logs_query, ndjson_lines, page_audit_logs
+from ..deps import (
+    DBSession,
+    ReadOnlyDBSession,
+    check_permission_mask,
+    get_current_user,
+)
+from ..utils import get_user_permission_mask
+
+router = APIRouter()
+
+AUDIT_LOGS_MASK = to_mask({Permissions.CAN_SEE_AUDIT_LOGS})
+FAILURE_LOGS_MASK = to_mask({Permissions.CAN_VIEW_FAILURE_LOGS})
+
+
+@router.get("/auditlogs")
+async def get_audit_logs(
+    session: DBSession,
+    read_session: ReadOnlyDBSession,
+    current_user: Annotated[User, Depends(get_current_user)],
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    cursor: str | None = None,
+    types: Annotated[list[LogType] | None, Query()] = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    user_rcsid: str | None = None,
+    entity_type: EntityType | None = None,
+    entity_id: UUID | None = None,
+    format: Literal["json", "ndjson"] = "json",
+) -> CursorPage[AuditLogModel]:
+    """Browse the audit log, newest first. Pass `next_cursor` back as `cursor` with the same filters for the next page.
+
+    With `format=ndjson`, every matching log is streamed instead, one per line, ignoring `limit` and `cursor`.
+    Users who can only view failure logs only get MACHINE_USAGE_FAILED logs.
+    """
+
+    user_mask = await get_user_permission_mask(session, current_user.id)
+    try:
+        check_permission_mask(user_mask, AUDIT_LOGS_MASK)
+    except HTTPException:
+        check_permission_mask(user_mask, FAILURE_LOGS_MASK)
+        if types and set(types) != {LogType.MACHINE_USAGE_FAILED}:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="User lacks required permissions",
+            )
+        types = [LogType.MACHINE_USAGE_FAILED]
+
+    query = audit_logs_query(types, since, until, user_rcsid, entity_type, entity_id)
+
+    if format == "ndjson":
+        return StreamingResponse(
+            # On the same database as read_session, which is closed before the export ends
+            ndjson_lines(
+                query, async_sessionmaker(read_session.bind, expire_on_commit=False)
+            ),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": 'attachment; filename="audit_logs.ndjson"'},
+        )
+
+    items, next_cursor = await page_audit_logs(read_session, query, limit, cursor)
+    return CursorPage(items=items, next_cursor=next_cursor)
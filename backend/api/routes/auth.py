@@ -1,25 +1,31 @@
 """ User authentication endpoints. """
 
-from decimal import Decimal
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import and_, func, select
+from sqlalchemy import select
 
-from models.machine_usage import MachineUsage
 from models.state import State
 from models.user import User
 from schemas.enums import Permissions
 from schemas.responses import AccessTokenResponse, UserNoHash
 
+from ..balances import get_semester_balance
 from ..deps import DBSession, PermittedUserChecker
-from ..utils import get_user_permissions
-
-from core.security import create_token_response, verify_password
+from ..utils import get_user_permission_mask, get_user_permissions
+
+from core import config
+from core.permissions import PERMISSION_SCHEMA
+from core.security import (
+    PermissionClaims,
+    create_token_response,
+    verify_password_async,
+)
 
 
 router = APIRouter()
 
+
 AUTH_FAILED_ERROR = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
     detail="Incorrect username or password",
@@ -33,6 +39,22 @@ ACCOUNT_DISABLED_ERROR = HTTPException(
 )
 
 
+async def get_permission_claims(
+    session: DBSession, user: User
+) -> PermissionClaims | None:
+    """Resolve the permission claims to sign into a new token for the provided user."""
+
+    if not config.settings.JWT_PERMISSION_CLAIMS:
+        return None
+
+    return PermissionClaims(
+        uid=user.id,
+        perms=await get_user_permission_mask(session, user.id),
+        epoch=user.permission_epoch,
+        perm_schema=PERMISSION_SCHEMA,
+    )
+
+
 @router.post("/login")
 async def login_user(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()], session: DBSession
@@ -40,7 +62,9 @@ async def login_user(
     """Check if user credentials are valid. If they are, create and return an access token."""
 
     user = await session.scalar(select(User).where(User.RCSID == form_data.username))
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(
+        form_data.password, user.hashed_password
+    ):
         raise AUTH_FAILED_ERROR
 
     user_permissions = await get_user_permissions(session, user.id)
@@ -51,17 +75,22 @@ async def login_user(
         # Provided user is locked out. Their credentials are right, but refuse login anyway.
         raise ACCOUNT_DISABLED_ERROR
 
-    return create_token_response(user.RCSID)
+    return create_token_response(
+        user.RCSID, await get_permission_claims(session, user)
+    )
 
 
 @router.get("/refresh")
 async def refresh_auth(
-    current_user: Annotated[User, Depends(PermittedUserChecker(set()))]
+    session: DBSession,
+    current_user: Annotated[User, Depends(PermittedUserChecker(set()))],
 ):
     """If the user has a valid access token, create and return a fresh one."""
 
     # Auth and permissions check is handled by the dependency injection, so we can just return a fresh token.
-    return create_token_response(current_user.RCSID)
+    return create_token_response(
+        current_user.RCSID, await get_permission_claims(session, current_user)
+    )
 
 
 @router.get("/me")
@@ -74,23 +103,12 @@ async def get_current_user(
     current_semester_id = await session.scalar(select(State.active_semester_id))
     
     current_user_permissions = await get_user_permissions(session, current_user.id)
+    # Permissions may come from cache, so the roles for display_role aren't loaded
+    # as a side effect, and lazy loading fails under asyncio
+    await session.refresh(current_user, ["roles"])
 
-    semester_balance = (
-        (
-            await session.scalar(
-                select(func.sum(MachineUsage.cost))
-                .select_from(MachineUsage)
-                .where(
-                    and_(
-                        MachineUsage.user_id == current_user.id,
-                        MachineUsage.semester_id == current_semester_id,
-                    )
-                )
-            )
-        )
-        or 0.0
-        if current_semester_id
-        else 0.0
+    semester_balance = await get_semester_balance(
+        session, current_user.id, current_semester_id
     )
 
     return UserNoHash(
@@ -112,5 +130,5 @@ async def get_current_user(
             ""
         ),
         is_graduating=current_user.is_graduating,
-        semester_balance=Decimal(semester_balance),
+        semester_balance=semester_balance,
     )
@@ -3,7 +3,7 @@
 from typing import Annotated
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import and_, select
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
 from models.audit_log import AuditLog
@@ -11,16 +11,24 @@ from models.machine import Machine
 from models.machine_group import MachineGroup
 from schemas.requests import MachineGroupCreateRequest, MachineGroupEditRequest
 from schemas.responses import (
-    AuditLogModel,
     CreateResponse,
     MachineInfo,
     MachineInfoGroup,
     MachineInfoGroupDetails,
 )
 
-from ..deps import DBSession, PermittedUserChecker
+from ..audit_logs import latest_audit_logs
+from ..deps import (
+    DBSession,
+    PermittedTokenChecker,
+    PermittedUserChecker,
+    VersionedETag,
+)
+from ..pagination import PageLimit, PageOffset, fetch_page, page_response
+from core.invalidation import Topic
+from core.security import JWTTokenPayload
 from models.user import User
-from schemas.enums import LogType, Permissions
+from schemas.enums import EntityType, LogType, Permissions
 
 router = APIRouter()
 
@@ -77,8 +85,9 @@ async def create_machine_group(
 async def get_machine_group(
     group_id: UUID,
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_MACHINE_GROUPS}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_MACHINE_GROUPS})),
     ],
 ):
     """Fetch the machine group with the provided ID."""
@@ -94,20 +103,12 @@ async def get_machine_group(
             detail="Machine group with provided ID not found",
         )
 
-    audit_logs = (
-        await session.scalars(
-            select(AuditLog)
-            .where(
-                and_(
-                    AuditLog.content.has_key("machine_group_id"),
-                    AuditLog.content["machine_group_id"].astext == str(group_id),
-                )
-            )
-            .order_by(AuditLog.time_created.desc())
-        )
-    ).all()
+    audit_logs, audit_logs_cursor = await latest_audit_logs(
+        session, EntityType.MACHINE_GROUP, group_id
+    )
     return MachineInfoGroupDetails(
-        audit_logs=[AuditLogModel.model_validate(log) for log in audit_logs],
+        audit_logs=audit_logs,
+        audit_logs_cursor=audit_logs_cursor,
         machine_ids=[machine.id for machine in machine_group.machines],
         num_machines=len(machine_group.machines),
         **machine_group.__dict__,
@@ -117,32 +118,47 @@ async def get_machine_group(
 @router.get("/machinegroups")
 async def get_all_machine_groups(
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_MACHINE_GROUPS}))
+    etag: Annotated[
+        str,
+        Depends(
+            VersionedETag(
+                Topic.MACHINE_GROUPS, Topic.MACHINE_CATALOG, authenticated=True
+            )
+        ),
     ],
-    limit: int = 20,
-    offset: int = 0,
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_MACHINE_GROUPS})),
+    ],
+    limit: PageLimit = 20,
+    offset: PageOffset = 0,
+    cursor: str | None = None,
 ):
-    """Fetch all machine groups."""
-
-    machine_groups = (
-        await session.scalars(
-            select(MachineGroup)
-            .options(selectinload(MachineGroup.machines))
-            .order_by(MachineGroup.name)
-            .offset(offset)
-            .fetch(limit)
-        )
-    ).all()
+    """Fetch all machine groups. Pass `cursor` to page with cursors, see `api.pagination`."""
+
+    rows, next_cursor = await fetch_page(
+        session,
+        select(MachineGroup).options(selectinload(MachineGroup.machines)),
+        [MachineGroup.name, MachineGroup.id],
+        scope="name",
+        descending=False,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
 
-    return [
-        MachineInfoGroup(
-            machine_ids=[machine.id for machine in machine_group.machines],
-            num_machines=len(machine_group.machines),
-            **machine_group.__dict__,
-        )
-        for machine_group in machine_groups
-    ]
+    return page_response(
+        [
+            MachineInfoGroup(
+                machine_ids=[machine.id for machine in machine_group.machines],
+                num_machines=len(machine_group.machines),
+                **machine_group.__dict__,
+            )
+            for machine_group, in rows
+        ],
+        next_cursor,
+        cursor,
+    )
 
 
 @router.post("/machinegroups/{group_id}")
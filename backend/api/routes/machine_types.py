@@ -3,7 +3,7 @@
 from typing import Annotated, Literal
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import and_, func, ScalarSelect, select
+from sqlalchemy import func, ScalarSelect, select
 from decimal import Decimal
 from sqlalchemy.orm import InstrumentedAttribute, joinedload, selectinload
 
@@ -13,7 +13,6 @@ from models.machine_type import MachineType, MachineTypeSlotAssociation
 from models.resource_slot import ResourceSlot
 from schemas.requests import MachineTypeCreateRequest, MachineTypeEditRequest
 from schemas.responses import (
-    AuditLogModel,
     CreateResponse,
     MachineTypeDetails,
     MachineTypeInfo,
@@ -21,9 +20,18 @@ from schemas.responses import (
     ResourceSlotInfo,
 )
 
-from ..deps import DBSession, PermittedUserChecker
+from ..audit_logs import latest_audit_logs
+from ..deps import (
+    DBSession,
+    PermittedTokenChecker,
+    PermittedUserChecker,
+    VersionedETag,
+)
+from ..pagination import PageLimit, PageOffset, fetch_page, page_response
+from core.invalidation import Topic
+from core.security import JWTTokenPayload
 from models.user import User
-from schemas.enums import LogType, Permissions
+from schemas.enums import EntityType, LogType, Permissions
 
 router = APIRouter()
 
@@ -85,8 +93,9 @@ async def create_machine_type(
 async def get_machine_type(
     type_id: UUID,
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_MACHINE_TYPES}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_MACHINE_TYPES})),
     ],
 ):
     """Fetch the machine type with the provided ID."""
@@ -106,18 +115,9 @@ async def get_machine_type(
             detail="Machine type with provided ID not found",
         )
 
-    audit_logs = (
-        await session.scalars(
-            select(AuditLog)
-            .where(
-                and_(
-                    AuditLog.content.has_key("machine_type_id"),
-                    AuditLog.content["machine_type_id"].astext == str(type_id),
-                )
-            )
-            .order_by(AuditLog.time_created.desc())
-        )
-    ).all()
+    audit_logs, audit_logs_cursor = await latest_audit_logs(
+        session, EntityType.MACHINE_TYPE, type_id
+    )
 
     num_machines = (
         await session.scalar(
@@ -128,7 +128,8 @@ async def get_machine_type(
     ) or 0
 
     return MachineTypeDetails(
-        audit_logs=[AuditLogModel.model_validate(log) for log in audit_logs],
+        audit_logs=audit_logs,
+        audit_logs_cursor=audit_logs_cursor,
         resource_slot_ids=[
             resource_slot.id for resource_slot in machine_type.resource_slots
         ],
@@ -148,55 +149,68 @@ async def get_machine_type(
 @router.get("/machinetypes")
 async def get_all_machine_types(
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_MACHINE_TYPES}))
+    etag: Annotated[
+        str,
+        Depends(
+            VersionedETag(
+                Topic.MACHINE_TYPES,
+                Topic.MACHINE_CATALOG,
+                Topic.RESOURCE_SLOTS,
+                Topic.RESOURCES,
+                authenticated=True,
+            )
+        ),
     ],
-    limit: int = 20,
-    offset: int = 0,
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_MACHINE_TYPES})),
+    ],
+    limit: PageLimit = 20,
+    offset: PageOffset = 0,
+    cursor: str | None = None,
     order_by: Literal["name", "num_machines", "slots"] = "name",
     descending: bool = False,
 ):
-    """Fetch all machine types."""
+    """Fetch all machine types. Pass `cursor` to page with cursors, see `api.pagination`."""
 
     attr_key_map: dict[str, InstrumentedAttribute | ScalarSelect] = {
         "name": MachineType.name,
         "num_machines": select(func.count())
         .select_from(Machine)
         .where(Machine.type_id == MachineType.id)
-        .as_scalar(),
+        .scalar_subquery(),
         "slots": select(func.count())
         .select_from(MachineTypeSlotAssociation)
         .where(MachineTypeSlotAssociation.machine_type_id == MachineType.id)
-        .as_scalar(),
+        .scalar_subquery(),
     }
-    order_determinant = attr_key_map[order_by]
-    if descending:
-        order_determinant = order_determinant.desc()
 
-    machine_types = (
-        await session.scalars(
-            select(MachineType)
-            .options(
-                selectinload(MachineType.resource_slots).selectinload(
-                    ResourceSlot.valid_resources
-                )
+    rows, next_cursor = await fetch_page(
+        session,
+        select(MachineType).options(
+            selectinload(MachineType.resource_slots).selectinload(
+                ResourceSlot.valid_resources
             )
-            .order_by(MachineType.name)
-            .offset(offset)
-            .fetch(limit)
-        )
-    ).all()
+        ),
+        [attr_key_map[order_by], MachineType.id],
+        scope=order_by,
+        descending=descending,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
+    machine_types = [machine_type for machine_type, in rows]
 
     num_machines_result = (
         await session.execute(
-            select(Machine.type_id, func.count(Machine.type_id)).group_by(
-                Machine.type_id
-            )
+            select(Machine.type_id, func.count(Machine.type_id))
+            .where(Machine.type_id.in_(machine_type.id for machine_type in machine_types))
+            .group_by(Machine.type_id)
         )
     ).all()
     num_machines = {item[0]: item[1] for item in num_machines_result}
 
-    return [
+    infos = [
         MachineTypeInfo(
             resource_slot_ids=[
                 resource_slot.id for resource_slot in machine_type.resource_slots
@@ -214,6 +228,7 @@ async def get_all_machine_types(
         )
         for machine_type in machine_types
     ]
+    return page_response(infos, next_cursor, cursor)
 
 
 @router.post("/machinetypes/{type_id}")
@@ -3,13 +3,14 @@
 from typing import Annotated, Literal
 from fastapi import APIRouter, Depends
 from sqlalchemy import select
-from sqlalchemy.orm import InstrumentedAttribute, selectinload
+from sqlalchemy.orm import selectinload
 
 from models.machine import Machine
 from models.machine_usage import MachineUsage
 from schemas.responses import UsageResponse
 
 from ..deps import DBSession, PermittedUserChecker
+from ..pagination import PageLimit, PageOffset, fetch_page, page_response
 from models.user import User
 
 router = APIRouter()
@@ -20,8 +21,9 @@ async def get_my_usages(
     current_user: Annotated[
         User, Depends(PermittedUserChecker(set()))
     ],
-    limit: int = 20,
-    offset: int = 0,
+    limit: PageLimit = 20,
+    offset: PageOffset = 0,
+    cursor: str | None = None,
     order_by: Literal[
         "time_started",
         "cost",
@@ -29,41 +31,44 @@ async def get_my_usages(
     ] = "time_started",
     descending: bool = False,
 ):
-    """Fetch machine usage records for current user."""
+    """Fetch machine usage records for current user. Pass `cursor` to page with cursors, see `api.pagination`."""
 
-    attr_key_map: dict[str, InstrumentedAttribute] = {
+    attr_key_map = {
         "time_started": MachineUsage.time_started,
         "duration": MachineUsage.duration_seconds,
         "cost": MachineUsage.cost,
         "name": Machine.name,
     }
-    order_determinant = attr_key_map[order_by]
-    if descending:
-        order_determinant = order_determinant.desc()
 
-    machine_usages = (
-        await session.scalars(
-            select(MachineUsage)
-            .join(MachineUsage.machine)
-            .options(selectinload(MachineUsage.machine))
-            .options(selectinload(MachineUsage.semester))
-            .where(MachineUsage.user_id == current_user.id)
-            .order_by(order_determinant)
-            .offset(offset)
-            .fetch(limit)
-        )
-    ).all()
+    rows, next_cursor = await fetch_page(
+        session,
+        select(MachineUsage)
+        .join(MachineUsage.machine)
+        .options(selectinload(MachineUsage.machine))
+        .options(selectinload(MachineUsage.semester))
+        .where(MachineUsage.user_id == current_user.id),
+        [attr_key_map[order_by], MachineUsage.id],
+        scope=order_by,
+        descending=descending,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
 
-    return [
-        UsageResponse(
-            machine_name=usage.machine.name,
-            semester=f"{usage.semester.semester_type} {usage.semester.calendar_year}" if usage.semester else None,
-            time_started=usage.time_started,
-            duration=usage.duration_seconds,
-            cost=usage.cost,
-        )
-        for usage in machine_usages
-    ]
+    return page_response(
+        [
+            UsageResponse(
+                machine_name=usage.machine.name,
+                semester=f"{usage.semester.semester_type} {usage.semester.calendar_year}" if usage.semester else None,
+                time_started=usage.time_started,
+                duration=usage.duration_seconds,
+                cost=usage.cost,
+            )
+            for usage, in rows
+        ],
+        next_cursor,
+        cursor,
+    )
 
 
 @router.get("/usages/current/me")
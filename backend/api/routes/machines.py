@@ -3,8 +3,8 @@
 from typing import Annotated, Literal
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import and_, select
-from sqlalchemy.orm import InstrumentedAttribute, joinedload, selectinload
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
 
 from models.audit_log import AuditLog
 from models.machine import Machine
@@ -12,11 +12,14 @@ from models.machine_group import MachineGroup
 from models.machine_type import MachineType
 from models.machine_usage import MachineUsage
 from schemas.requests import MachineCreateRequest, MachineEditRequest
-from schemas.responses import AuditLogModel, CreateResponse, MachineDetails, MachineInfo
+from schemas.responses import CreateResponse, MachineDetails, MachineInfo
 
-from ..deps import DBSession, PermittedUserChecker
+from ..audit_logs import latest_audit_logs
+from ..deps import DBSession, PermittedTokenChecker, PermittedUserChecker
+from ..pagination import PageLimit, PageOffset, SortKey, fetch_page, page_response
+from core.security import JWTTokenPayload
 from models.user import User
-from schemas.enums import LogType, Permissions
+from schemas.enums import EntityType, LogType, Permissions
 
 router = APIRouter()
 
@@ -81,8 +84,9 @@ async def create_machine(
 async def get_machine(
     machine_id: UUID,
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_MACHINES}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_MACHINES})),
     ],
 ):
     """Fetch the machine with the provided ID."""
@@ -99,23 +103,13 @@ async def get_machine(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Machine with provided ID not found",
         )
-    audit_logs = (
-        await session.scalars(
-            select(AuditLog)
-            .where(
-                and_(
-                    AuditLog.content.has_key("machine_id"),
-                    AuditLog.content["machine_id"].astext == str(machine_id),
-                )
-            )
-            .order_by(AuditLog.time_created.desc())
-        )
-    ).all()
+    audit_logs, audit_logs_cursor = await latest_audit_logs(
+        session, EntityType.MACHINE, machine_id
+    )
 
-    print("DEBUG: ", machine.active_usage)
-    
     return MachineDetails(
-        audit_logs=[AuditLogModel.model_validate(log) for log in audit_logs],
+        audit_logs=audit_logs,
+        audit_logs_cursor=audit_logs_cursor,
         **machine.__dict__,
         group_name=machine.group.name if machine.group else None,
         type_name=machine.type.name,
@@ -125,11 +119,13 @@ async def get_machine(
 @router.get("/machines")
 async def get_all_machines(
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_MACHINES}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_MACHINES})),
     ],
-    limit: int = 20,
-    offset: int = 0,
+    limit: PageLimit = 20,
+    offset: PageOffset = 0,
+    cursor: str | None = None,
     order_by: Literal[
         "name",
         "type",
@@ -139,39 +135,44 @@ async def get_all_machines(
     ] = "name",
     descending: bool = False,
 ):
-    """Fetch all machines."""
-
-    attr_key_map: dict[str, InstrumentedAttribute] = {
-        "name": Machine.name,
-        "type": MachineType.name,
-        "group": MachineGroup.name,
-        "maintenance_mode": Machine.maintenance_mode,
-        "disabled": Machine.disabled,
+    """Fetch all machines. Pass `cursor` to page with cursors, see `api.pagination`."""
+
+    attr_key_map: dict[str, SortKey] = {
+        "name": SortKey(Machine.name),
+        "type": SortKey(MachineType.name),
+        "group": SortKey(MachineGroup.name, nullable=True),
+        "maintenance_mode": SortKey(Machine.maintenance_mode),
+        "disabled": SortKey(Machine.disabled),
     }
-    order_determinant = attr_key_map[order_by]
-    if descending:
-        order_determinant = order_determinant.desc()
-
-    machines = (
-        await session.scalars(
-            select(Machine)
-            .options(selectinload(Machine.active_usage))
-            .options(selectinload(Machine.group))
-            .options(selectinload(Machine.type))
-            .order_by(order_determinant)
-            .offset(offset)
-            .fetch(limit)
-        )
-    ).all()
 
-    return [
-        MachineInfo(
-            group_name=machine.group.name if machine.group else None,
-            type_name=machine.type.name,
-            **machine.__dict__,
-        )
-        for machine in machines
-    ]
+    rows, next_cursor = await fetch_page(
+        session,
+        select(Machine)
+        .join(Machine.type)
+        .outerjoin(Machine.group)
+        .options(selectinload(Machine.active_usage))
+        .options(selectinload(Machine.group))
+        .options(selectinload(Machine.type)),
+        [attr_key_map[order_by], Machine.id],
+        scope=order_by,
+        descending=descending,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
+
+    return page_response(
+        [
+            MachineInfo(
+                group_name=machine.group.name if machine.group else None,
+                type_name=machine.type.name,
+                **machine.__dict__,
+            )
+            for machine, in rows
+        ],
+        next_cursor,
+        cursor,
+    )
 
 
 @router.post("/machines/{machine_id}")
@@ -266,12 +267,12 @@ async def delete_machine(
             detail="Machine with provided ID not found",
         )
 
-    usages = (
-        await session.scalars(
-            select(MachineUsage).where(MachineUsage.machine_id == machine.id)
-        )
-    ).all()
-    if len(usages):
+    usages_of_machine = await session.scalar(
+        select(func.count())
+        .select_from(MachineUsage)
+        .where(MachineUsage.machine_id == machine.id)
+    )
+    if usages_of_machine:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Can't delete a machine with usages",
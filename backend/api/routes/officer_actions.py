@@ -1,13 +1,13 @@
-from decimal import Decimal
+import hashlib
 from datetime import datetime
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import UUID4
-from sqlalchemy import and_, select, func
+from sqlalchemy import and_, select
 from sqlalchemy.orm import selectinload
 
 from models.audit_log import AuditLog
-from models.machine_usage import MachineUsage
 from models.semester import Semester
 from models.state import State
 from models.user import User
@@ -15,7 +15,18 @@ from schemas.enums import LogType, Permissions, SemesterType
 from schemas.requests import ActivateSemesterRequest, GetChargeSheetsRequest
 from schemas.responses import CreateResponse, UserChargeResponse
 
-from ..deps import DBSession, PermittedUserChecker
+from ..charge_sheets import (
+    charges_query,
+    csv_chunks,
+    freeze_charge_sheet,
+    json_chunks,
+    snapshot_query,
+    stream_charges,
+    thaw_charge_sheet,
+    xlsx_chunks,
+)
+from ..deps import DBSession, PermittedUserChecker, etag_matches
+from ..utils import get_active_semester_id
 
 router = APIRouter()
 
@@ -59,6 +70,8 @@ async def advance_semester(
     if not next_semester:
         next_semester = Semester(semester_type=next_season, calendar_year=next_year)
 
+    if next_semester.id:
+        await thaw_charge_sheet(session, next_semester.id)
     state.active_semester = next_semester
     session.add(state)
     await session.commit()
@@ -102,6 +115,7 @@ async def set_semester(
             detail="Could not find a semester with the provided ID",
         )
 
+    await thaw_charge_sheet(session, new_semester.id)
     state.active_semester = new_semester
     session.add(state)
     await session.commit()
@@ -114,9 +128,10 @@ async def set_semester(
     await session.commit()
 
 
-@router.post("/exec/get_charges")
+@router.post("/exec/get_charges", response_model=list[UserChargeResponse])
 async def get_charge_sheet(
     request: GetChargeSheetsRequest,
+    http_request: Request,
     session: DBSession,
     current_user: Annotated[
         User, Depends(PermittedUserChecker({Permissions.CAN_GET_CHARGES}))
@@ -133,44 +148,47 @@ async def get_charge_sheet(
             detail="Could not find a semester with the provided ID",
         )
 
-    users = (
-        await session.scalars(
-            select(User)
-            .join(MachineUsage, MachineUsage.user_id == User.id)
-            .where(MachineUsage.semester_id == semester.id)
-            .options(selectinload(User.roles))
-            .distinct()
+    headers: dict[str, str] = {}
+    if semester.id == await get_active_semester_id(session):
+        query = charges_query(semester.id, request.graduating)
+    else:
+        # Charges of other semesters are settled, serve them from their snapshot
+        content_hash = await freeze_charge_sheet(session, semester.id)
+        await session.commit()
+        # The same rows make a different body for every format and option
+        variant = hashlib.blake2b(
+            request.model_dump_json().encode(), digest_size=6
+        ).hexdigest()
+        headers["ETag"] = f'"{content_hash}-{variant}"'
+        if etag_matches(http_request, headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        query = snapshot_query(semester.id, request.graduating)
+
+    if request.format == "json":
+        return StreamingResponse(
+            json_chunks(stream_charges(query)),
+            media_type="application/json",
+            headers=headers,
         )
-    ).all()
-
-    semester_balances = (
-        (
-            await session.execute(
-                select(User.id, func.sum(MachineUsage.cost))
-                .join(MachineUsage.user)
-                .where(MachineUsage.semester_id == semester.id)
-                .group_by(User.id)
-            )
-        ).all()
-    )
 
-    return [
-        UserChargeResponse(
-            RIN=user.RIN,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            is_graduating=user.is_graduating,
-            semester_balance=Decimal(
-                next(
-                    (balance.tuple()[1]
-                     for balance in semester_balances
-                     if balance.tuple()[0] == user.id),
-                    0.0
-                )
-                if semester_balances and len(semester_balances) > 0
-                else 0.0
-            ),
+    filename = f"{semester.semester_type.name.title()}_{semester.calendar_year}_Forge_Charges"
+    if request.graduating is not None:
+        filename += "_Graduating" if request.graduating else "_Not_Graduating"
+
+    if request.format == "csv":
+        return StreamingResponse(
+            csv_chunks(stream_charges(query), request.membership_charge),
+            media_type="text/csv",
+            headers={
+                **headers,
+                "Content-Disposition": f'attachment; filename="{filename}.csv"',
+            },
         )
-        for user in users
-    ]
-
+    return StreamingResponse(
+        xlsx_chunks(stream_charges(query), request.membership_charge),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={
+            **headers,
+            "Content-Disposition": f'attachment; filename="{filename}.xlsx"',
+        },
+    )
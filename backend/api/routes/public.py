@@ -1,94 +1,51 @@
-from fastapi import APIRouter
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from typing import Annotated
 
-from models.machine import Machine
-from models.machine_usage import MachineUsage
-from schemas.responses import (
-    AllMachinesStatusResponse,
-    MachineInfo,
-    MachineStatus,
-    MachineStatusGroup,
-)
-from ..deps import DBSession
+from fastapi import APIRouter, Depends, Header, Response
+from fastapi.responses import StreamingResponse
 
-from itertools import groupby
+from core import config
+from schemas.responses import AllMachinesStatusResponse
+from ..deps import VersionedETag
+from ..machine_status import STATUS_TOPICS, get_machines_status_snapshot
+from ..status_stream import stream_events
 
 router = APIRouter()
 
 
-@router.get("/machinestatus")
+@router.get("/machinestatus", response_model=AllMachinesStatusResponse)
 async def get_machines_status(
-    session: DBSession,
+    etag: Annotated[
+        str,
+        Depends(
+            VersionedETag(
+                *STATUS_TOPICS,
+                max_age_seconds=config.settings.MACHINE_STATUS_MAX_AGE_SECONDS,
+            )
+        ),
+    ],
 ):
     "Fetch all machines."
 
-    machines = (
-        await session.scalars(
-            select(Machine)
-            .options(selectinload(Machine.active_usage).selectinload(MachineUsage.user))
-            .options(selectinload(Machine.group))
-            .options(selectinload(Machine.type))
-        )
-    ).all()
-
-    group_dict = {}
-    for machine in machines:
-        key = machine.group_id if machine.group_id is not None else ""
-        group_dict.setdefault(key, []).append(machine)
+    # Served from the in-memory snapshot, which is already serialized
+    return Response(
+        content=await get_machines_status_snapshot(),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
 
-    group_list = []
-    loner_list = []
-    for _, group in group_dict.items():
-        machines = list(group)
-        machines.sort(key=lambda machine: machine.name)
 
-        machine_statuses = [
-            MachineStatus.model_validate(
-                {
-                    "in_use": machine.active_usage is not None,
-                    "group_id": machine.group_id,
-                    "type_id": machine.type_id,
-                    "failed": (
-                        machine.active_usage.failed if machine.active_usage else False
-                    ),
-                    "failed_at": (
-                        machine.active_usage.failed_at if machine.active_usage else None
-                    ),
-                    "usage_start": (
-                        machine.active_usage.time_started
-                        if machine.active_usage
-                        else None
-                    ),
-                    "usage_duration": (
-                        machine.active_usage.duration_seconds
-                        if machine.active_usage
-                        else None
-                    ),
-                    "user_id": (
-                        machine.active_usage.user.id if machine.active_usage and machine.active_usage.user else None
-                    ),
-                    "user_name": (
-                        f"{machine.active_usage.user.first_name} {machine.active_usage.user.last_name[0]}."
-                        if machine.active_usage and machine.active_usage.user
-                        else None
-                    ),
-                    **machine.__dict__,
-                }
-            )
-            for machine in machines
-        ]
+@router.get("/machinestatus/stream")
+async def stream_machines_status(
+    last_event_id: Annotated[str | None, Header()] = None,
+):
+    """Stream machine status as Server-Sent Events.
 
-        first_machine = machines[0]
-        # We portray it like this just to make linter happy
-        if first_machine.group is None:
-            loner_list = machine_statuses
-        else:
-            group_list.append(
-                MachineStatusGroup(
-                    name=first_machine.group.name,
-                    machines=machine_statuses,
-                )
-            )
+    Sends a `snapshot` event shaped like `/machinestatus`, then a `delta` event
+    with the changed machines whenever a machine is used, cleared, failed or edited.
+    """
 
-    return AllMachinesStatusResponse(groups=group_list, loners=loner_list)
+    return StreamingResponse(
+        stream_events(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
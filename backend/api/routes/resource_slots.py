@@ -3,7 +3,7 @@
 from typing import Annotated, Literal
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import and_, select
+from sqlalchemy import select
 from sqlalchemy.orm import InstrumentedAttribute, selectinload
 
 from models.audit_log import AuditLog
@@ -13,15 +13,23 @@ from models.machine_type import MachineType, MachineTypeSlotAssociation
 from models.resource_usage_quantity import ResourceUsageQuantity
 from schemas.requests import ResourceSlotCreateRequest, ResourceSlotEditRequest
 from schemas.responses import (
-    AuditLogModel,
     CreateResponse,
     ResourceSlotInfo,
     ResourceSlotDetails,
 )
 
-from ..deps import DBSession, PermittedUserChecker
+from ..audit_logs import latest_audit_logs
+from ..deps import (
+    DBSession,
+    PermittedTokenChecker,
+    PermittedUserChecker,
+    VersionedETag,
+)
+from ..pagination import PageLimit, PageOffset, fetch_page, page_response
+from core.invalidation import Topic
+from core.security import JWTTokenPayload
 from models.user import User
-from schemas.enums import LogType, Permissions
+from schemas.enums import EntityType, LogType, Permissions
 
 router = APIRouter()
 
@@ -85,8 +93,9 @@ async def create_resource_slot(
 async def get_resource_slot(
     resource_slot_id: UUID,
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_RESOURCE_SLOTS}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_RESOURCE_SLOTS})),
     ],
 ):
     "Fetch the resource slot with the provided ID."
@@ -102,21 +111,13 @@ async def get_resource_slot(
             detail="Resource Slot with provided ID not found",
         )
 
-    audit_logs = (
-        await session.scalars(
-            select(AuditLog)
-            .where(
-                and_(
-                    AuditLog.content.has_key("resource_slot_id"),
-                    AuditLog.content["resource_slot_id"].astext == str(resource_slot_id),
-                )
-            )
-            .order_by(AuditLog.time_created.desc())
-        )
-    ).all()
+    audit_logs, audit_logs_cursor = await latest_audit_logs(
+        session, EntityType.RESOURCE_SLOT, resource_slot_id
+    )
 
     return ResourceSlotDetails(
-        audit_logs=[AuditLogModel.model_validate(log) for log in audit_logs],
+        audit_logs=audit_logs,
+        audit_logs_cursor=audit_logs_cursor,
         valid_resource_ids=[resource.id for resource in resource_slot.valid_resources],
         resource_names={resource.name for resource in resource_slot.valid_resources},
         **resource_slot.__dict__,
@@ -126,11 +127,19 @@ async def get_resource_slot(
 @router.get("/resourceslots")
 async def get_all_resource_slots(
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_RESOURCE_SLOTS}))
+    etag: Annotated[
+        str,
+        Depends(
+            VersionedETag(Topic.RESOURCE_SLOTS, Topic.RESOURCES, authenticated=True)
+        ),
     ],
-    limit: int = 20,
-    offset: int = 0,
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_RESOURCE_SLOTS})),
+    ],
+    limit: PageLimit = 20,
+    offset: PageOffset = 0,
+    cursor: str | None = None,
     order_by: Literal[
         "db_name",
         "display_name",
@@ -139,7 +148,7 @@ async def get_all_resource_slots(
     ] = "db_name",
     descending: bool = False,
 ):
-    "Fetch all resource slots."
+    "Fetch all resource slots. Pass `cursor` to page with cursors, see `api.pagination`."
 
     attr_key_map: dict[str, InstrumentedAttribute] = {
         "db_name": ResourceSlot.db_name,
@@ -147,32 +156,34 @@ async def get_all_resource_slots(
         "allow_own_material": ResourceSlot.allow_own_material,
         "allow_empty": ResourceSlot.allow_empty,
     }
-    order_determinant = attr_key_map[order_by]
-    if descending:
-        order_determinant = order_determinant.desc()
 
-    resource_slots = (
-        await session.scalars(
-            select(ResourceSlot)
-            .options(selectinload(ResourceSlot.valid_resources))
-            .order_by(order_determinant)
-            .offset(offset)
-            .fetch(limit)
-        )
-    ).all()
+    rows, next_cursor = await fetch_page(
+        session,
+        select(ResourceSlot).options(selectinload(ResourceSlot.valid_resources)),
+        [attr_key_map[order_by], ResourceSlot.id],
+        scope=order_by,
+        descending=descending,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
 
-    return [
-        ResourceSlotInfo(
-            valid_resource_ids=[
-                resource.id for resource in resource_slot.valid_resources
-            ],
-            resource_names={
-                resource.name for resource in resource_slot.valid_resources
-            },
-            **resource_slot.__dict__,
-        )
-        for resource_slot in resource_slots
-    ]
+    return page_response(
+        [
+            ResourceSlotInfo(
+                valid_resource_ids=[
+                    resource.id for resource in resource_slot.valid_resources
+                ],
+                resource_names={
+                    resource.name for resource in resource_slot.valid_resources
+                },
+                **resource_slot.__dict__,
+            )
+            for resource_slot, in rows
+        ],
+        next_cursor,
+        cursor,
+    )
 
 
 @router.post("/resourceslots/{resource_slot_id}")
@@ -4,22 +4,29 @@ from typing import Annotated, Literal
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import and_, select
-from sqlalchemy.orm import InstrumentedAttribute
 
 from models.audit_log import AuditLog
 from models.resource import Resource
 from models.resource_slot import ResourceSlot, ResourceSlotAssociation
 from schemas.requests import ResourceCreateRequest, ResourceEditRequest
 from schemas.responses import (
-    AuditLogModel,
     CreateResponse,
     ResourceDetails,
     ResourceInfo,
 )
 
-from ..deps import DBSession, PermittedUserChecker
+from ..audit_logs import latest_audit_logs
+from ..deps import (
+    DBSession,
+    PermittedTokenChecker,
+    PermittedUserChecker,
+    VersionedETag,
+)
+from ..pagination import PageLimit, PageOffset, SortKey, fetch_page, page_response
+from core.invalidation import Topic
+from core.security import JWTTokenPayload
 from models.user import User
-from schemas.enums import LogType, Permissions
+from schemas.enums import EntityType, LogType, Permissions
 
 router = APIRouter()
 
@@ -74,8 +81,9 @@ async def create_resource(
 async def get_resource(
     resource_id: UUID,
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_RESOURCES}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_RESOURCES})),
     ],
 ):
     "Fetch the resource with the provided ID."
@@ -87,21 +95,13 @@ async def get_resource(
             detail="Resource with provided ID not found",
         )
 
-    audit_logs = (
-        await session.scalars(
-            select(AuditLog)
-            .where(
-                and_(
-                    AuditLog.content.has_key("resource_id"),
-                    AuditLog.content["resource_id"].astext == str(resource_id),
-                )
-            )
-            .order_by(AuditLog.time_created.desc())
-        )
-    ).all()
+    audit_logs, audit_logs_cursor = await latest_audit_logs(
+        session, EntityType.RESOURCE, resource_id
+    )
 
     return ResourceDetails(
-        audit_logs=[AuditLogModel.model_validate(log) for log in audit_logs],
+        audit_logs=audit_logs,
+        audit_logs_cursor=audit_logs_cursor,
         **resource.__dict__,
     )
 
@@ -109,41 +109,44 @@ async def get_resource(
 @router.get("/resources")
 async def get_all_resources(
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_RESOURCES}))
+    etag: Annotated[str, Depends(VersionedETag(Topic.RESOURCES, authenticated=True))],
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_RESOURCES})),
     ],
-    limit: int = 20,
-    offset: int = 0,
+    limit: PageLimit = 20,
+    offset: PageOffset = 0,
+    cursor: str | None = None,
     order_by: Literal["name", "brand", "color", "units", "cost"] = "brand",
     descending: bool = False,
 ):
-    "Fetch all resources."
-
-    attr_key_map: dict[str, InstrumentedAttribute] = {
-        "name": Resource.name,
-        "brand": Resource.brand,
-        "color": Resource.color,
-        "units": Resource.units,
-        "cost": Resource.cost,
+    "Fetch all resources. Pass `cursor` to page with cursors, see `api.pagination`."
+
+    attr_key_map: dict[str, SortKey] = {
+        "name": SortKey(Resource.name),
+        "brand": SortKey(Resource.brand, nullable=True),
+        "color": SortKey(Resource.color, nullable=True),
+        "units": SortKey(Resource.units),
+        "cost": SortKey(Resource.cost),
     }
     order_determinant = attr_key_map[order_by]
-    order_secondary = Resource.name if order_by != "name" else Resource.brand
-    order_tertiary = Resource.color if order_by != "color" else Resource.brand
-    if descending:
-        order_determinant = order_determinant.desc()
-        order_secondary = order_secondary.desc()
-        order_tertiary = order_tertiary.desc()
-
-    resources = (
-        await session.scalars(
-            select(Resource)
-            .order_by(order_determinant, order_secondary, order_tertiary)
-            .offset(offset)
-            .fetch(limit)
-        )
-    ).all()
+    order_secondary = attr_key_map["name" if order_by != "name" else "brand"]
+    order_tertiary = attr_key_map["color" if order_by != "color" else "brand"]
+
+    rows, next_cursor = await fetch_page(
+        session,
+        select(Resource),
+        [order_determinant, order_secondary, order_tertiary, Resource.id],
+        scope=order_by,
+        descending=descending,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
 
-    return [ResourceInfo(**resource.__dict__) for resource in resources]
+    return page_response(
+        [ResourceInfo(**resource.__dict__) for resource, in rows], next_cursor, cursor
+    )
 
 
 @router.post("/resources/{resource_id}")
@@ -12,15 +12,17 @@ from models.semester import Semester
 from models.state import State
 from schemas.requests import SemesterCreateRequest, SemesterEditRequest
 from schemas.responses import (
-    AuditLogModel,
     CreateResponse,
     SemesterDetails,
     SemesterInfo,
 )
 
-from ..deps import DBSession, PermittedUserChecker
+from ..audit_logs import latest_audit_logs
+from ..deps import DBSession, PermittedTokenChecker, PermittedUserChecker
+from ..pagination import PageLimit, PageOffset, fetch_page, page_response
+from core.security import JWTTokenPayload
 from models.user import User
-from schemas.enums import LogType, Permissions, SemesterType
+from schemas.enums import EntityType, LogType, Permissions, SemesterType
 
 router = APIRouter()
 
@@ -74,8 +76,9 @@ async def create_semester(
 @router.get("/semesters/current")
 async def get_current_semester(
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_SEMESTERS}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_SEMESTERS})),
     ],
 ):
     """Fetch current semester."""
@@ -102,8 +105,9 @@ async def get_current_semester(
 async def get_semester(
     semester_id: UUID,
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_SEMESTERS}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_SEMESTERS})),
     ],
 ):
     """Fetch the semester with the provided ID."""
@@ -115,21 +119,13 @@ async def get_semester(
             detail="Semester with provided ID not found",
         )
 
-    audit_logs = (
-        await session.scalars(
-            select(AuditLog)
-            .where(
-                and_(
-                    AuditLog.content.has_key("semester_id"),
-                    AuditLog.content["semester_id"].astext == str(semester_id),
-                )
-            )
-            .order_by(AuditLog.time_created.desc())
-        )
-    ).all()
+    audit_logs, audit_logs_cursor = await latest_audit_logs(
+        session, EntityType.SEMESTER, semester_id
+    )
 
     return SemesterDetails(
-        audit_logs=[AuditLogModel.model_validate(log) for log in audit_logs],
+        audit_logs=audit_logs,
+        audit_logs_cursor=audit_logs_cursor,
         **semester.__dict__,
     )
 
@@ -137,15 +133,17 @@ async def get_semester(
 @router.get("/semesters")
 async def get_all_semesters(
     session: DBSession,
-    current_user: Annotated[
-        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_SEMESTERS}))
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_SEE_SEMESTERS})),
     ],
-    limit: int = 20,
-    offset: int = 0,
+    limit: PageLimit = 20,
+    offset: PageOffset = 0,
+    cursor: str | None = None,
     order_by: Literal["season", "year"] = "year",
     descending: bool = False,
 ):
-    """Fetch all semesters."""
+    """Fetch all semesters. Pass `cursor` to page with cursors, see `api.pagination`."""
 
     attr_key_map: dict[str, InstrumentedAttribute | Case] = {
         "season": case(
@@ -159,20 +157,21 @@ async def get_all_semesters(
     order_secondary = (
         Semester.calendar_year if order_by == "season" else attr_key_map["season"]
     )
-    if descending:
-        order_determinant = order_determinant.desc()
-        order_secondary = order_secondary.desc()
-
-    semesters = (
-        await session.scalars(
-            select(Semester)
-            .order_by(order_determinant, order_secondary)
-            .offset(offset)
-            .fetch(limit)
-        )
-    ).all()
 
-    return [SemesterInfo(**semester.__dict__) for semester in semesters]
+    rows, next_cursor = await fetch_page(
+        session,
+        select(Semester),
+        [order_determinant, order_secondary, Semester.id],
+        scope=order_by,
+        descending=descending,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
+
+    return page_response(
+        [SemesterInfo(**semester.__dict__) for semester, in rows], next_cursor, cursor
+    )
 
 
 @router.post("/semesters/{semester_id}")
@@ -1,31 +1,39 @@
-from decimal import Decimal
 from typing import Annotated
-from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, status
+from uuid import UUID, uuid4
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 
 from models.audit_log import AuditLog
 from models.machine_usage import MachineUsage
-from schemas.responses import MachineUsageSchema, ResourceInfo, ResourceSlotSchema
+from schemas.responses import MachineUsageSchema, UsageQuoteResponse
 
-from ..utils import has_permissions_any
+from ..pricing import get_machine_type_id, get_pricing_plan
+from ..usage_schema import build_usage_schema, get_machine_header
+from ..utils import get_active_semester_id, has_permissions_any
 from models.machine import Machine
-from models.machine_type import MachineType
-from models.resource_slot import ResourceSlot
 from models.resource_usage_quantity import ResourceUsageQuantity
-from models.state import State
 from schemas.requests import MachineUsageRequest
 
-from ..deps import DBSession, PermittedUserChecker
+from ..deps import DBSession, PermittedTokenChecker, PermittedUserChecker
+from core.security import JWTTokenPayload
 from models.user import User
 from schemas.enums import LogType, Permissions
 
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import joinedload
 
 router = APIRouter()
 
+# Postgres error raised by NOWAIT when the row is already locked
+LOCK_NOT_AVAILABLE = "55P03"
 
-@router.get("/use/{machine_id}/schema")
+MACHINE_IN_USE_ERROR = HTTPException(
+    status_code=status.HTTP_409_CONFLICT,
+    detail="Machine is in use",
+)
+
+
+@router.get("/use/{machine_id}/schema", response_model=MachineUsageSchema)
 async def get_usage_schema(
     machine_id: UUID,
     session: DBSession,
@@ -35,21 +43,10 @@ async def get_usage_schema(
 ):
     """Retrieve the relevant information for using the machine with the provided ID."""
 
-    machine = await session.scalar(
-        select(Machine)
-        .where(Machine.id == machine_id)
-        .options(selectinload(Machine.group))
-        .options(
-            selectinload(Machine.type)
-            .selectinload(MachineType.resource_slots)
-            .selectinload(ResourceSlot.valid_resources)
-        )
-        .options(selectinload(Machine.active_usage))
-    )
-
-    if not machine or (
-        machine.disabled
-        and not has_permissions_any(
+    header = await get_machine_header(session, machine_id)
+    if not header or (
+        header.disabled
+        and not await has_permissions_any(
             session,
             current_user.id,
             {Permissions.CAN_EDIT_MACHINES, Permissions.IS_SUPERUSER},
@@ -60,26 +57,40 @@ async def get_usage_schema(
             detail="Machine with provided ID not found",
         )
 
-    return MachineUsageSchema(
-        group_name=machine.group.name if machine.group else None,
-        type_name=machine.type.name,
-        resource_slots=[
-            ResourceSlotSchema.model_validate(
-                {
-                    **slot.__dict__,
-                    "resource_slot_id": slot.id,
-                    "valid_resources": [
-                        ResourceInfo.model_validate(resource.__dict__)
-                        for resource in slot.valid_resources
-                    ],
-                }
-            )
-            for slot in machine.type.resource_slots
-        ],
-        **machine.__dict__,
+    # Already serialized, from the per machine and per type caches
+    return Response(
+        content=await build_usage_schema(session, header),
+        media_type="application/json",
     )
 
 
+@router.post("/use/{machine_id}/quote")
+async def quote_machine_usage(
+    machine_id: UUID,
+    request: MachineUsageRequest,
+    session: DBSession,
+    token_data: Annotated[
+        JWTTokenPayload,
+        Depends(PermittedTokenChecker({Permissions.CAN_USE_MACHINES})),
+    ],
+) -> UsageQuoteResponse:
+    """Price a usage of the provided machine without logging it.
+
+    Served from cached pricing plans, so it is cheap enough to call on every
+    change to the usage form. Disabled machines can't be quoted.
+    """
+
+    machine = await get_machine_type_id(session, machine_id)
+    if not machine or machine[1]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Machine with provided ID not found",
+        )
+
+    plan = await get_pricing_plan(session, machine[0])
+    return plan.quote(machine_id, request)
+
+
 @router.post("/use/{machine_id}")
 async def use_a_machine(
     machine_id: UUID,
@@ -91,26 +102,28 @@ async def use_a_machine(
 ):
     """Log a machine usage for the provided machine ID."""
 
-    machine = await session.scalar(
-        select(Machine)
-        .where(Machine.id == machine_id)
-        .options(
-            selectinload(Machine.type)
-            .selectinload(MachineType.resource_slots)
-            .selectinload(ResourceSlot.valid_resources)
+    # The machine row stays locked until commit, so concurrent claims can't both
+    # see it free. NOWAIT makes them fail right away instead of queueing on the lock.
+    try:
+        machine = await session.scalar(
+            select(Machine)
+            .where(Machine.id == machine_id)
+            .options(joinedload(Machine.active_usage))
+            .with_for_update(nowait=True, of=Machine)
         )
-        .options(selectinload(Machine.active_usage))
-    )
+    except DBAPIError as error:
+        if getattr(error.orig, "sqlstate", None) == LOCK_NOT_AVAILABLE:
+            raise MACHINE_IN_USE_ERROR
+        raise
 
-    can_edit_machines_permissions = await has_permissions_any(
+    # Permissions and the active semester are served from cache
+    if not machine or (
+        machine.disabled
+        and not await has_permissions_any(
             session,
             current_user.id,
             {Permissions.CAN_EDIT_MACHINES, Permissions.IS_SUPERUSER},
         )
-
-    if not machine or (
-        machine.disabled
-        and not can_edit_machines_permissions
     ):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -118,116 +131,47 @@ async def use_a_machine(
         )
 
     if machine.active_usage:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Machine is in use",
-        )
-
-    state = await session.scalar(
-        select(State).options(selectinload(State.active_semester))
-    )
-    current_semester = state.active_semester
+        raise MACHINE_IN_USE_ERROR
 
-    between_semesters_permission = await has_permissions_any(
+    current_semester_id = await get_active_semester_id(session)
+    if not current_semester_id and not await has_permissions_any(
         session=session,
         user_id=current_user.id,
         permissions={
             Permissions.CAN_USE_MACHINES_BETWEEN_SEMESTERS,
             Permissions.IS_SUPERUSER,
         },
-    )
-    
-    if not current_semester and not between_semesters_permission:
+    ):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have permission to log machine usages between semesters",
         )
-        
-    required_resource_slot_ids = {
-        resource_slot.id
-        for resource_slot in machine.type.resource_slots
-        if not resource_slot.allow_empty
-    }
-    all_resource_slot_ids = {
-        resource_slot.id for resource_slot in machine.type.resource_slots
-    }
-
-    # Check that required resource slot ids is subset of the provided resource slots
-    if not required_resource_slot_ids <= request.resource_usages.keys():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="One or more required resource slots not populated",
-        )
-
-    # Check that no non-existent slots were provided
-    if not request.resource_usages.keys() <= all_resource_slot_ids:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="One or more provided resource slots not found",
-        )
-        
-    resource_usage_quantities: list[ResourceUsageQuantity] = []
-    total_cost = 0
-
-    total_cost += round(
-        Decimal(request.duration_seconds / 3600) * (machine.type.cost_per_hour), 2
-    )
-    
-    for resource_slot_id, usage_info in request.resource_usages.items():
-        resource_slot = next(
-            resource_slot
-            for resource_slot in machine.type.resource_slots
-            if resource_slot.id == resource_slot_id
-        )
-        valid_resources = resource_slot.valid_resources
-
-        resource_used = next(
-            (
-                resource
-                for resource in valid_resources
-                if resource.id == usage_info.resource_id
-            ),
-            None,
-        )
-        if not resource_used:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Resource ID {usage_info.resource_id} not found",
-            )
-
-        if usage_info.is_own_material and not resource_slot.allow_own_material:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Resource Slot {resource_slot_id} is marked as own material but cannot be",
-            )
-
-        resource_usage_quantities.append(
-            ResourceUsageQuantity(
-                resource=resource_used,
-                is_own_material=usage_info.is_own_material,
-                amount=usage_info.amount,
-                cpu_at_usage=resource_used.cost,
-            )
-        )
 
-        if not usage_info.is_own_material:
-            total_cost += usage_info.amount * resource_used.cost
+    # Validates the requested slots and resources, and prices them
+    plan = await get_pricing_plan(session, machine.type_id)
+    quote = plan.quote(machine.id, request)
 
+    # Id assigned here, so the audit log can reference it without a refresh
     machine_usage = MachineUsage(
+        id=uuid4(),
         machine=machine,
-        semester=current_semester,
-        user=current_user,
+        semester_id=current_semester_id,
+        user_id=current_user.id,
         duration_seconds=request.duration_seconds,
-        cost=total_cost,
-        resources_used=resource_usage_quantities,
+        cost=quote.total_cost,
+        resources_used=[
+            ResourceUsageQuantity(
+                resource_id=line.resource_id,
+                is_own_material=line.is_own_material,
+                amount=line.amount,
+                cpu_at_usage=line.unit_cost,
+            )
+            for line in quote.resources
+        ],
     )
     machine.active_usage = machine_usage
-
     session.add(machine_usage)
-    session.add(machine)
-    await session.commit()
-    await session.refresh(machine_usage)
-    
+
     audit_log = AuditLog(
         type=LogType.MACHINE_USED,
         content={
@@ -237,4 +181,10 @@ async def use_a_machine(
         },
     )
     session.add(audit_log)
-    await session.commit()
+
+    # Usage, machine and audit log are written in a single transaction
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Another usage took the machine without going through the lock
+        raise MACHINE_IN_USE_ERROR
@@ -2,56 +2,30 @@ from decimal import Decimal
 from typing import Annotated, Literal
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import ScalarSelect, and_, func, or_, select
-from sqlalchemy.orm import selectinload, InstrumentedAttribute
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import StringConstraints
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import selectinload
 
 from models.state import State
 
-from ..deps import DBSession, PermittedUserChecker
-from ..utils import get_user_permissions
+from ..balances import get_semester_balance
+from ..deps import DBSession, PermittedUserChecker, ReadOnlyDBSession
+from ..pagination import PageLimit, PageOffset, SortKey, fetch_page, page_response
+from ..utils import get_user_permission_masks, get_user_permissions
 
-from models.machine_usage import MachineUsage
+from models.user_semester_balance import UserSemesterBalance
 from models.role import Role
 from models.user import User
 from schemas.enums import Permissions
 from schemas.requests import UserCreateRequest
 from schemas.responses import BasicUserResponse, UserNoHash
 
-from core.security import get_password_hash
+from core.permissions import from_mask
+from core.security import get_password_hash_async
 
 router = APIRouter()
 
-async def get_semester_balance(
-    session: DBSession,
-    user_id: UUID,
-    semester_id: str
-) -> Decimal:
-    """Calculate the semester balance for a user and semester."""
-    
-    if not semester_id:
-        return Decimal(0)
-    
-    semester_balance = (
-        (
-            await session.scalar(
-                select(func.sum(MachineUsage.cost))
-                .select_from(MachineUsage)
-                .where(
-                    and_(
-                        MachineUsage.user_id == user_id,
-                        MachineUsage.semester_id == semester_id,
-                    )
-                )
-            )
-        )
-        or 0.0
-        if semester_id
-        else 0.0
-    )
-
-    return Decimal(semester_balance)
-
 @router.post("/signup")
 async def register_user(
     request: UserCreateRequest, session: DBSession
@@ -76,7 +50,7 @@ async def register_user(
         pronouns=request.pronouns,
         is_rpi_staff=False,
         is_graduating=False,
-        hashed_password=get_password_hash(request.password),
+        hashed_password=await get_password_hash_async(request.password),
     )
     session.add(new_user)
     await session.commit()
@@ -172,14 +146,70 @@ async def get_user_by_rin(
     )
 
 
+@router.get("/users/search", tags=["users"])
+async def search_users(
+    session: ReadOnlyDBSession,
+    current_user: Annotated[
+        User, Depends(PermittedUserChecker({Permissions.CAN_SEE_USERS}))
+    ],
+    # Stripped before the length check, a blank query would match everyone
+    q: Annotated[
+        str,
+        StringConstraints(strip_whitespace=True, min_length=2, max_length=64),
+        Query(),
+    ],
+    limit: Annotated[int, Query(ge=1, le=50)] = 10,
+) -> list[BasicUserResponse]:
+    """Find users by part of their RCSID or name, or the start of their RIN. Best matches first."""
+
+    if q.isdigit():
+        # Everything from the prefix up to the prefix with its last digit bumped, in
+        # byte order so ix_users_rin_prefix finds and orders them, even in a generic plan
+        upper_bound = q[:-1] + chr(ord(q[-1]) + 1)
+        rin = User.RIN.collate("C")
+        query = select(User).where(rin >= q, rin < upper_bound).order_by(rin)
+    else:
+        # Every word has to be in the RCSID or a name. Trigram indexes answer
+        # ILIKE '%word%' without scanning the table.
+        words = q.split()[:4]
+        full_name = func.concat_ws(" ", User.first_name, User.last_name)
+        query = (
+            select(User)
+            .where(
+                *(
+                    or_(
+                        User.RCSID.icontains(word, autoescape=True),
+                        User.first_name.icontains(word, autoescape=True),
+                        User.last_name.icontains(word, autoescape=True),
+                    )
+                    for word in words
+                )
+            )
+            .order_by(
+                func.greatest(
+                    func.similarity(User.RCSID, q), func.similarity(full_name, q)
+                ).desc(),
+                User.RCSID,
+            )
+        )
+
+    users = await session.scalars(query.limit(limit))
+    return [
+        BasicUserResponse.model_validate(user, strict=False, from_attributes=True)
+        for user in users
+    ]
+
+
 @router.get("/users", tags=["users"])
 async def get_all_users(
-    session: DBSession,
+    session: ReadOnlyDBSession,
+    primary_session: DBSession,
     current_user: Annotated[
         User, Depends(PermittedUserChecker({Permissions.CAN_SEE_USERS}))
     ],
-    limit: int = 20,
-    offset: int = 0,
+    limit: PageLimit = 20,
+    offset: PageOffset = 0,
+    cursor: str | None = None,
     order_by: Literal[
         "RCSID",
         "RIN",
@@ -194,62 +224,51 @@ async def get_all_users(
     ] = "RCSID",
     descending: bool = False,
 ):
-    """Returns a list of all users. Provide query parameters to cap and re-order the output."""
+    """Returns a list of all users. Provide query parameters to cap and re-order the output.
+
+    Pass `cursor` to page with cursors, see `api.pagination`.
+    """
 
     current_semester_id = await session.scalar(select(State.active_semester_id))
 
-    attr_key_map: dict[str, InstrumentedAttribute | ScalarSelect] = {
-        "RCSID": User.RCSID,
-        "RIN": User.RIN,
-        "first_name": User.first_name,
-        "last_name": User.last_name,
-        "is_rpi_staff": User.is_rpi_staff,
-        "semester_balance": select(func.sum(MachineUsage.cost))
-        .where(
-            and_(
-                MachineUsage.user_id == User.id,
-                MachineUsage.semester_id == current_semester_id,
-            )
-        )
-        .as_scalar(),
-        "is_graduating": User.is_graduating,
-        "gender_identity": User.gender_identity,
-        "pronouns": User.pronouns,
-        "major": User.major,
+    attr_key_map: dict[str, SortKey] = {
+        "RCSID": SortKey(User.RCSID),
+        "RIN": SortKey(User.RIN),
+        "first_name": SortKey(User.first_name),
+        "last_name": SortKey(User.last_name),
+        "is_rpi_staff": SortKey(User.is_rpi_staff),
+        "semester_balance": SortKey(UserSemesterBalance.balance, nullable=True),
+        "is_graduating": SortKey(User.is_graduating),
+        "gender_identity": SortKey(User.gender_identity),
+        "pronouns": SortKey(User.pronouns),
+        "major": SortKey(User.major, nullable=True),
     }
-    order_determinant = attr_key_map[order_by]
-    if descending:
-        order_determinant = order_determinant.desc()
 
-    users = (
-        await session.scalars(
-            select(User)
-            .options(selectinload(User.roles))
-            .order_by(order_determinant)
-            .limit(limit)
-            .offset(offset)
+    rows, next_cursor = await fetch_page(
+        session,
+        select(User, func.coalesce(UserSemesterBalance.balance, 0))
+        .outerjoin(
+            UserSemesterBalance,
+            and_(
+                UserSemesterBalance.user_id == User.id,
+                UserSemesterBalance.semester_id == current_semester_id,
+            ),
         )
-    ).all()
-
-    semester_balances = (
-        (
-            await session.execute(
-                select(User.id, func.sum(MachineUsage.cost))
-                .join(MachineUsage.user)
-                .where(MachineUsage.semester_id == current_semester_id)
-                .group_by(User.id)
-            )
-        ).all()
-        if current_semester_id
-        else None
+        .options(selectinload(User.roles)),
+        [attr_key_map[order_by], User.id],
+        scope=order_by,
+        descending=descending,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
     )
+    users = [user for user, _ in rows]
+    semester_balances = {user.id: balance for user, balance in rows}
 
-    user_permissions = {
-        user.id: await get_user_permissions(session, user.id) 
-        for user in users
-    }
+    # Never fills the permission cache from the replica
+    user_permissions = await get_user_permission_masks(primary_session, users)
 
-    return [
+    items = [
         UserNoHash(
             id=user.id,
             is_rpi_staff=user.is_rpi_staff,
@@ -260,7 +279,7 @@ async def get_all_users(
             major=user.major,
             gender_identity=user.gender_identity,
             pronouns=user.pronouns,
-            permissions=user_permissions[user.id],
+            permissions=from_mask(user_permissions[user.id]),
             display_role=next((
                     role.name 
                     for role in user.roles 
@@ -269,19 +288,11 @@ async def get_all_users(
                 ""
             ),
             is_graduating=user.is_graduating,
-            semester_balance=Decimal(
-                next(
-                    (balance.tuple()[1]
-                     for balance in semester_balances
-                     if balance.tuple()[0] == user.id),
-                    0.0
-                )
-                if semester_balances and len(semester_balances) > 0
-                else 0.0
-            ),
+            semester_balance=Decimal(semester_balances[user.id]),
         )
         for user in users
     ]
+    return page_response(items, next_cursor, cursor)
 
 
 # GET ALL USERS
@@ -0,0 +1,238 @@
+"""
+Server-Sent Events stream of machine status changes.
+
+Subscribers get one full snapshot, then a delta with only the machines that
+changed every time the status snapshot is invalidated. Events carry an id of
+the form `<instance>-<version>`, so a client reconnecting with `Last-Event-ID`
+is replayed what it missed from a short ring buffer, or sent a fresh snapshot
+if the buffer doesn't reach back that far or the id came from another process.
+
+Each subscriber has a small bounded queue. A subscriber that falls that far
+behind is disconnected instead of slowing down everyone else, and its client
+catches up through `Last-Event-ID` when it reconnects.
+
+https://html.spec.whatwg.org/multipage/server-sent-events.html
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from collections.abc import AsyncIterator
+from typing import Any
+
+from core import config, metrics
+from core.invalidation import INSTANCE_ID, Keys, subscribe
+from schemas.responses import AllMachinesStatusResponse
+from .machine_status import STATUS_TOPICS, get_machines_status
+
+logger = logging.getLogger(__name__)
+
+# Put in a subscriber's queue once it has been dropped, ending its stream
+_DISCONNECT = b""
+
+_subscribers: set[asyncio.Queue[bytes]] = set()
+
+# Version of the last published event, and the state it describes
+_version = 0
+_machines: dict[str, dict[str, Any]] | None = None
+_layout: list[tuple[str | None, list[str]]] | None = None
+_status: AllMachinesStatusResponse | None = None
+
+# (version, encoded event) of the most recent events, for Last-Event-ID replay
+_replay: deque[tuple[int, bytes]] = deque(
+    maxlen=config.settings.STATUS_STREAM_REPLAY_SIZE
+)
+
+# Serializes refreshes, so versions are published in order
+_refresh_lock = asyncio.Lock()
+_refresh_task: asyncio.Task | None = None
+_refresh_requested = False
+# Set when the status changed while no one was subscribed
+_stale = True
+
+status_stream_subscribers = metrics.gauge(
+    "forge_status_stream_subscribers",
+    "Clients connected to the machine status stream",
+    callback=lambda: len(_subscribers),
+)
+status_stream_dropped = metrics.counter(
+    "forge_status_stream_dropped",
+    "Status stream subscribers disconnected for falling behind",
+)
+
+
+def _encode_event(event: str, version: int, data: str) -> bytes:
+    return f"id: {INSTANCE_ID}-{version}\nevent: {event}\ndata: {data}\n\n".encode()
+
+
+def _flatten(
+    status: AllMachinesStatusResponse,
+) -> tuple[dict[str, dict[str, Any]], list[tuple[str | None, list[str]]]]:
+    """Split a status into per-machine entries and the group layout around them."""
+
+    machines: dict[str, dict[str, Any]] = {}
+    layout: list[tuple[str | None, list[str]]] = []
+    for name, group in [
+        *((group.name, group.machines) for group in status.groups),
+        (None, status.loners),
+    ]:
+        ids = []
+        for machine in group:
+            machines[str(machine.id)] = machine.model_dump(mode="json")
+            ids.append(str(machine.id))
+        layout.append((name, ids))
+    return machines, layout
+
+
+def _publish(event: bytes) -> None:
+    _replay.append((_version, event))
+    for queue in list(_subscribers):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            _drop(queue)
+
+
+def _drop(queue: asyncio.Queue[bytes]) -> None:
+    _subscribers.discard(queue)
+    status_stream_dropped.inc()
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(_DISCONNECT)
+
+
+async def refresh() -> None:
+    """Rebuild the status and publish whatever changed since the last event."""
+
+    global _version, _machines, _layout, _status, _stale
+
+    async with _refresh_lock:
+        _stale = False
+        status = await get_machines_status()
+        machines, layout = _flatten(status)
+
+        if _machines is None:
+            # First build, no one can be waiting for a delta yet
+            _version += 1
+        elif layout != _layout:
+            # Machines were added, removed or moved between groups
+            _version += 1
+            _publish(_encode_event("snapshot", _version, status.model_dump_json()))
+        else:
+            changed = [
+                machine
+                for machine_id, machine in machines.items()
+                if _machines[machine_id] != machine
+            ]
+            if not changed:
+                return
+            _version += 1
+            _publish(
+                _encode_event("delta", _version, json.dumps({"machines": changed}))
+            )
+
+        _machines, _layout, _status = machines, layout, status
+
+
+async def _refresh_loop() -> None:
+    global _refresh_requested, _refresh_task
+
+    try:
+        while _refresh_requested:
+            _refresh_requested = False
+            try:
+                await refresh()
+            except Exception:
+                logger.exception("Failed to refresh the machine status stream")
+    finally:
+        _refresh_task = None
+
+
+def _schedule_refresh(keys: Keys) -> None:
+    global _refresh_requested, _refresh_task, _stale
+
+    if not _subscribers:
+        # Nothing to push to, the next subscriber refreshes first
+        _stale = True
+        return
+
+    _refresh_requested = True
+    if _refresh_task is None:
+        try:
+            _refresh_task = asyncio.get_running_loop().create_task(_refresh_loop())
+        except RuntimeError:
+            # Committed outside of an event loop, catch up on the next subscribe
+            _stale = True
+
+
+for topic in STATUS_TOPICS:
+    subscribe(topic, _schedule_refresh)
+
+
+def _parse_event_id(last_event_id: str | None) -> int | None:
+    """Return the version in an event id issued by this process, if it is one."""
+
+    if not last_event_id:
+        return None
+    instance, _, version = last_event_id.rpartition("-")
+    if instance != INSTANCE_ID or not version.isdigit():
+        return None
+    return int(version)
+
+
+async def open_subscription(
+    last_event_id: str | None = None,
+) -> tuple[asyncio.Queue[bytes], list[bytes]]:
+    """Register a subscriber, returning its queue and the events to send it first.
+
+    The first events are either what was missed since `last_event_id` or a full snapshot.
+    """
+
+    if _stale or _status is None:
+        await refresh()
+
+    # No awaits from here on, so no event can be published between picking the
+    # first events and registering the queue
+    queue: asyncio.Queue[bytes] = asyncio.Queue(
+        maxsize=config.settings.STATUS_STREAM_QUEUE_SIZE
+    )
+    retry = f"retry: {config.settings.STATUS_STREAM_RETRY_MILLISECONDS}\n\n".encode()
+
+    seen_version = _parse_event_id(last_event_id)
+    oldest_replayable = _replay[0][0] if _replay else _version + 1
+    if seen_version is not None and (
+        seen_version == _version or oldest_replayable <= seen_version + 1 <= _version
+    ):
+        first_events = [event for version, event in _replay if version > seen_version]
+    else:
+        first_events = [_encode_event("snapshot", _version, _status.model_dump_json())]
+
+    _subscribers.add(queue)
+    return queue, [retry, *first_events]
+
+
+def close_subscription(queue: asyncio.Queue[bytes]) -> None:
+    _subscribers.discard(queue)
+
+
+async def stream_events(last_event_id: str | None = None) -> AsyncIterator[bytes]:
+    """Yield encoded events for one client until it disconnects or is dropped."""
+
+    queue, first_events = await open_subscription(last_event_id)
+    keepalive = config.settings.STATUS_STREAM_KEEPALIVE_SECONDS
+    try:
+        for event in first_events:
+            yield event
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive)
+            except TimeoutError:
+                # Comment line, keeps proxies from closing an idle connection
+                yield b": keepalive\n\n"
+                continue
+            if event == _DISCONNECT:
+                return
+            yield event
+    finally:
+        close_subscription(queue)
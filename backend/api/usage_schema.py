@@ -0,0 +1,153 @@
+"""
+Cached usage schemas, the form behind the UseAMachine tab.
+
+Almost all of a schema comes from the machine type: its name and its resource
+slots with their valid resources. That part is serialized once per type and
+kept until a type, slot or resource changes. The few fields that belong to the
+machine itself are cached per machine, so serving a schema is two dictionary
+lookups and a byte join.
+"""
+
+import json
+from typing import NamedTuple
+from uuid import UUID
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from core import config
+from core.invalidation import Keys, Topic, cache_lookups, subscribe
+from models.machine import Machine
+from models.machine_type import MachineType
+from models.resource_slot import ResourceSlot
+from schemas.responses import ResourceInfo, ResourceSlotSchema
+
+_resource_slots_adapter = TypeAdapter(list[ResourceSlotSchema])
+
+
+class MachineHeader(NamedTuple):
+    type_id: UUID
+    disabled: bool
+    # Serialized machine fields of the schema, without the surrounding braces
+    fields: bytes
+
+
+# Serialized type fields of the schema per machine type id, without the surrounding braces
+_type_cache: dict[UUID, bytes] = {}
+_type_cache_generation = 0
+
+_machine_cache: dict[UUID, MachineHeader] = {}
+_machine_cache_generation = 0
+
+
+def _evict_types(keys: Keys) -> None:
+    global _type_cache_generation
+    _type_cache_generation += 1
+    _type_cache.clear()
+
+
+def _evict_machines(keys: Keys) -> None:
+    global _machine_cache_generation
+    _machine_cache_generation += 1
+    _machine_cache.clear()
+
+
+for topic in (Topic.MACHINE_TYPES, Topic.RESOURCE_SLOTS, Topic.RESOURCES):
+    subscribe(topic, _evict_types)
+for topic in (Topic.MACHINES, Topic.MACHINE_GROUPS):
+    subscribe(topic, _evict_machines)
+
+
+def _store(cache: dict, key, value) -> None:
+    if len(cache) >= config.settings.USAGE_SCHEMA_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    cache[key] = value
+
+
+async def get_machine_header(
+    session: AsyncSession, machine_id: UUID
+) -> MachineHeader | None:
+    """Return the machine specific part of a usage schema, or None if the machine doesn't exist."""
+
+    header = _machine_cache.get(machine_id)
+    if header is not None:
+        cache_lookups.inc(cache="usage_schema_machines", result="hit")
+        return header
+    cache_lookups.inc(cache="usage_schema_machines", result="miss")
+
+    generation = _machine_cache_generation
+    machine = await session.scalar(
+        select(Machine)
+        .where(Machine.id == machine_id)
+        .options(joinedload(Machine.group))
+    )
+    if not machine:
+        return None
+
+    fields = json.dumps(
+        {
+            "name": machine.name,
+            "group_id": str(machine.group_id) if machine.group_id else None,
+            "group_name": machine.group.name if machine.group else None,
+            "type_id": str(machine.type_id),
+            "maintenance_mode": machine.maintenance_mode,
+        }
+    ).encode()[1:-1]
+    header = MachineHeader(machine.type_id, machine.disabled, fields)
+
+    if generation == _machine_cache_generation:
+        _store(_machine_cache, machine_id, header)
+    return header
+
+
+async def get_type_fields(session: AsyncSession, machine_type_id: UUID) -> bytes:
+    """Return the machine type part of a usage schema, serialized."""
+
+    fields = _type_cache.get(machine_type_id)
+    if fields is not None:
+        cache_lookups.inc(cache="usage_schema_types", result="hit")
+        return fields
+    cache_lookups.inc(cache="usage_schema_types", result="miss")
+
+    generation = _type_cache_generation
+    machine_type = await session.scalar(
+        select(MachineType)
+        .where(MachineType.id == machine_type_id)
+        .options(
+            selectinload(MachineType.resource_slots).selectinload(
+                ResourceSlot.valid_resources
+            )
+        )
+    )
+    resource_slots = [
+        ResourceSlotSchema.model_validate(
+            {
+                **slot.__dict__,
+                "resource_slot_id": slot.id,
+                "valid_resources": [
+                    ResourceInfo.model_validate(resource.__dict__)
+                    for resource in slot.valid_resources
+                ],
+            }
+        )
+        for slot in machine_type.resource_slots
+    ]
+    fields = (
+        b'"type_name":'
+        + json.dumps(machine_type.name).encode()
+        + b',"resource_slots":'
+        + _resource_slots_adapter.dump_json(resource_slots)
+    )
+
+    if generation == _type_cache_generation:
+        _store(_type_cache, machine_type_id, fields)
+    return fields
+
+
+async def build_usage_schema(session: AsyncSession, header: MachineHeader) -> bytes:
+    """Serialize the full `MachineUsageSchema` of a machine."""
+
+    type_fields = await get_type_fields(session, header.type_id)
+    return b"{" + header.fields + b"," + type_fields + b"}"
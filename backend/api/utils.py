@@ -1,56 +1,285 @@
-from typing import Dict, Set
+import time
+from collections.abc import Iterable
+from typing import Set
 from uuid import UUID
 
-from sqlalchemy import select
+from sqlalchemy import event, inspect, select, update
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import Session, selectinload
 
-from models.role import Role
+from core import config
+from core.invalidation import Keys, Topic, cache_lookups, mark_changed, subscribe
+from core.permissions import PERMISSION_BITS, from_mask, resolve_mask, to_mask
+from models.role import Role, UserRoleAssociation
+from models.state import State
 from models.user import User
 from schemas.enums import Permissions
 
+# Effective permission masks per user id, filled lazily by `get_user_permission_mask`.
+_permission_cache: dict[UUID, int] = {}
 
-async def get_user_permissions(session: AsyncSession, user_id: UUID):
+# Permission epochs per user id, with the monotonic time they were read.
+_epoch_cache: dict[UUID, tuple[int, float]] = {}
+
+# Bumped on every eviction, so a lookup that raced an eviction won't store what it read.
+_permission_cache_generation = 0
+
+
+def _evict_permissions(user_ids: Keys) -> None:
+    global _permission_cache_generation
+    _permission_cache_generation += 1
+
+    if user_ids is None:
+        _permission_cache.clear()
+        _epoch_cache.clear()
+        return
+    for user_id in user_ids:
+        _permission_cache.pop(user_id, None)
+        _epoch_cache.pop(user_id, None)
+
+
+subscribe(Topic.PERMISSIONS, _evict_permissions)
+
+# Id of the active semester, None between semesters, or _UNSET if it must be read again.
+_UNSET = object()
+_active_semester_id: UUID | None | object = _UNSET
+_active_semester_generation = 0
+
+
+def _evict_active_semester(keys: Keys) -> None:
+    global _active_semester_id, _active_semester_generation
+    _active_semester_generation += 1
+    _active_semester_id = _UNSET
+
+
+subscribe(Topic.STATE, _evict_active_semester)
+subscribe(Topic.SEMESTERS, _evict_active_semester)
+
+
+async def get_active_semester_id(session: AsyncSession) -> UUID | None:
+    """Return the id of the active semester, or None between semesters."""
+
+    global _active_semester_id
+
+    if _active_semester_id is not _UNSET:
+        cache_lookups.inc(cache="active_semester", result="hit")
+        return _active_semester_id  # type: ignore
+    cache_lookups.inc(cache="active_semester", result="miss")
+
+    generation = _active_semester_generation
+    semester_id = await session.scalar(select(State.active_semester_id))
+    if generation == _active_semester_generation:
+        _active_semester_id = semester_id
+    return semester_id
+
+
+def peek_active_semester_id() -> UUID | None:
+    """Return the cached id of the active semester, or None if it isn't cached.
+
+    Never queries, for flush hooks that can't wait on the database.
+    """
+
+    if _active_semester_id is _UNSET:
+        return None
+    return _active_semester_id  # type: ignore
+
+
+async def get_user_permission_mask(session: AsyncSession, user_id: UUID) -> int:
+    """Return the effective permission bitmask of a user, from the cache when possible."""
+
+    mask = _permission_cache.get(user_id)
+    if mask is not None:
+        cache_lookups.inc(cache="permissions", result="hit")
+        return mask
+    cache_lookups.inc(cache="permissions", result="miss")
+
+    generation = _permission_cache_generation
     user = (
         await session.scalars(
             select(User).where(User.id == user_id).options(selectinload(User.roles))
         )
     ).one()
-    permission_set: Dict[Permissions, int] = {}
-    for role in user.roles:
-        permissions = [Permissions(permission) for permission in role.permissions]
-        for permission in permissions:
-            if (
-                permission not in permission_set
-                or permission_set[permission] < role.priority
-            ):
-                permission_set[permission] = role.priority
+    mask = resolve_mask(user.roles)
+
+    if generation == _permission_cache_generation:
+        if len(_permission_cache) >= config.settings.PERMISSION_CACHE_SIZE:
+            # Drop the oldest entry, dicts keep insertion order
+            del _permission_cache[next(iter(_permission_cache))]
+        _permission_cache[user_id] = mask
+
+    return mask
 
-        for inverse_permission in role.inverse_permissions:
-            if (
-                inverse_permission in permission_set
-                and permission_set[inverse_permission] < role.priority
-            ):
-                del permission_set[inverse_permission]
 
-    return set(permission_set.keys())
+async def get_user_permission_masks(
+    session: AsyncSession, users: Iterable[User | UUID]
+) -> dict[UUID, int]:
+    """Return the effective permission masks of many users at once, by user id.
+
+    Users can be given as ids or as `User` objects. Masks come from the cache,
+    then from the roles of users that have them loaded, and all the rest from
+    one query over their role assignments. Ids without any roles, including
+    ids of users that don't exist, get an empty mask.
+    """
+
+    masks: dict[UUID, int] = {}
+    missing: set[UUID] = set()
+    for user in users:
+        user_id = user.id if isinstance(user, User) else user
+        mask = _permission_cache.get(user_id)
+        if mask is not None:
+            masks[user_id] = mask
+        elif isinstance(user, User) and "roles" not in inspect(user).unloaded:
+            masks[user_id] = resolve_mask(user.roles)
+        else:
+            missing.add(user_id)
+
+    cache_lookups.inc(len(missing), cache="permissions", result="miss")
+    cache_lookups.inc(len(masks), cache="permissions", result="hit")
+    if not missing:
+        return masks
+
+    generation = _permission_cache_generation
+    roles: dict[UUID, list[Role]] = {user_id: [] for user_id in missing}
+    for user_id, role in await session.execute(
+        select(UserRoleAssociation.user_id, Role)
+        .join(Role, Role.id == UserRoleAssociation.role_id)
+        .where(UserRoleAssociation.user_id.in_(missing))
+    ):
+        roles[user_id].append(role)
+
+    for user_id, user_roles in roles.items():
+        masks[user_id] = mask = resolve_mask(user_roles)
+        if generation == _permission_cache_generation:
+            if len(_permission_cache) >= config.settings.PERMISSION_CACHE_SIZE:
+                del _permission_cache[next(iter(_permission_cache))]
+            _permission_cache[user_id] = mask
+
+    return masks
+
+
+async def get_user_permissions(session: AsyncSession, user_id: UUID):
+    """Return the effective permissions of a user as a set of `Permissions`."""
+
+    return set(from_mask(await get_user_permission_mask(session, user_id)))
+
+
+async def get_permission_epoch(session: AsyncSession, user_id: UUID) -> int | None:
+    """Return the current permission epoch of a user, or None if they don't exist.
+
+    Epochs change in this process through cache eviction, and are re-read at least
+    every PERMISSION_EPOCH_CACHE_SECONDS to pick up changes made by other processes.
+    """
+
+    now = time.monotonic()
+    cached = _epoch_cache.get(user_id)
+    if (
+        cached is not None
+        and now - cached[1] < config.settings.PERMISSION_EPOCH_CACHE_SECONDS
+    ):
+        cache_lookups.inc(cache="permission_epochs", result="hit")
+        return cached[0]
+    cache_lookups.inc(cache="permission_epochs", result="miss")
+
+    generation = _permission_cache_generation
+    epoch = await session.scalar(
+        select(User.permission_epoch).where(User.id == user_id)
+    )
+
+    if epoch is not None and generation == _permission_cache_generation:
+        if len(_epoch_cache) >= config.settings.PERMISSION_CACHE_SIZE:
+            del _epoch_cache[next(iter(_epoch_cache))]
+        _epoch_cache[user_id] = (epoch, now)
+
+    return epoch
 
 
 async def has_permission(
     session: AsyncSession, user_id: UUID, permission: Permissions
 ) -> bool:
-    return permission in await get_user_permissions(session, user_id)
+    return bool(
+        await get_user_permission_mask(session, user_id) & PERMISSION_BITS[permission]
+    )
 
 
 async def has_permissions_all(
     session: AsyncSession, user_id: UUID, permissions: Set[Permissions]
 ) -> bool:
-    return permissions.issubset(await get_user_permissions(session, user_id))
+    required_mask = to_mask(permissions)
+    user_mask = await get_user_permission_mask(session, user_id)
+    return user_mask & required_mask == required_mask
 
 
 async def has_permissions_any(
     session: AsyncSession, user_id: UUID, permissions: Set[Permissions]
 ) -> bool:
-    user_permissions = await get_user_permissions(session, user_id)
-    return any(permission in user_permissions for permission in permissions)
+    return bool(await get_user_permission_mask(session, user_id) & to_mask(permissions))
+
+
+@event.listens_for(Session, "before_flush")
+def _track_permission_changes(session: Session, flush_context, instances) -> None:
+    """Bump permission epochs and queue cache evictions for role changes.
+
+    Covers role edits and deletes (every holder of the role) and role
+    assignment changes (only the users involved). Runs on every flush so that
+    no route has to remember to do it. Epochs are bumped in the same
+    transaction, cache evictions only happen once it commits.
+    """
+
+    changed_user_ids: set[UUID | None] = set()
+    changed_role_ids: set[UUID] = set()
+
+    for obj in session.deleted:
+        if isinstance(obj, Role):
+            changed_role_ids.add(obj.id)
+        elif isinstance(obj, User):
+            changed_user_ids.add(obj.id)
+        elif isinstance(obj, UserRoleAssociation):
+            changed_user_ids.add(obj.user_id)
+
+    for obj in session.new:
+        if isinstance(obj, UserRoleAssociation):
+            changed_user_ids.add(obj.user_id)
+        elif isinstance(obj, Role):
+            changed_user_ids.update(
+                user.id for user in inspect(obj).attrs.users.history.added
+            )
+
+    for obj in session.dirty:
+        if isinstance(obj, Role):
+            attrs = inspect(obj).attrs
+            if any(
+                attrs[name].history.has_changes()
+                for name in ("permissions", "inverse_permissions", "priority")
+            ):
+                changed_role_ids.add(obj.id)
+            history = attrs.users.history
+            changed_user_ids.update(
+                user.id for user in (*history.added, *history.deleted)
+            )
+        elif isinstance(obj, User) and inspect(obj).attrs.roles.history.has_changes():
+            changed_user_ids.add(obj.id)
+
+    # Users that haven't been flushed yet have no id, and nothing cached either
+    changed_user_ids.discard(None)
+    if not changed_user_ids and not changed_role_ids:
+        return
+
+    users = User.__table__
+    bump_epoch = update(users).values(permission_epoch=users.c.permission_epoch + 1)
+    if changed_user_ids:
+        session.execute(bump_epoch.where(users.c.id.in_(changed_user_ids)))
+    if changed_role_ids:
+        session.execute(
+            bump_epoch.where(
+                users.c.id.in_(
+                    select(UserRoleAssociation.user_id).where(
+                        UserRoleAssociation.role_id.in_(changed_role_ids)
+                    )
+                )
+            )
+        )
+
+    mark_changed(
+        session, Topic.PERMISSIONS, None if changed_role_ids else changed_user_ids
+    )
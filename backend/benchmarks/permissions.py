@@ -0,0 +1,115 @@
+"""
+Micro-benchmark of permission resolution and checking.
+
+Compares the original dict/set merge from `get_user_permissions` against the
+bitmask merge in `core.permissions`, for users holding many roles. Only the
+in-process work is timed, the role query is identical for both.
+
+Run from the backend folder:
+
+    python -m benchmarks.permissions
+"""
+
+import random
+import timeit
+from typing import Dict
+
+from core.permissions import from_mask, resolve_mask, to_mask
+from models.role import Role
+from schemas.enums import Permissions
+
+ROLE_COUNTS = (1, 5, 20, 50)
+ITERATIONS = 2000
+
+REQUIRED = {Permissions.CAN_USE_MACHINES, Permissions.CAN_SEE_MACHINES}
+
+
+def legacy_permissions(roles: list[Role]) -> set[Permissions]:
+    """The merge loop `get_user_permissions` ran before masks were introduced."""
+
+    permission_set: Dict[Permissions, int] = {}
+    for role in roles:
+        permissions = [Permissions(permission) for permission in role.permissions]
+        for permission in permissions:
+            if (
+                permission not in permission_set
+                or permission_set[permission] < role.priority
+            ):
+                permission_set[permission] = role.priority
+
+        for inverse_permission in role.inverse_permissions:
+            if (
+                inverse_permission in permission_set
+                and permission_set[inverse_permission] < role.priority
+            ):
+                del permission_set[inverse_permission]
+
+    return set(permission_set.keys())
+
+
+def legacy_check(roles: list[Role]) -> bool:
+    user_permissions = legacy_permissions(roles)
+    if Permissions.IS_SUPERUSER in user_permissions:
+        return True
+    if Permissions.LOCKOUT in user_permissions:
+        return False
+    return REQUIRED.issubset(user_permissions)
+
+
+REQUIRED_MASK = to_mask(REQUIRED)
+
+
+def mask_check(roles: list[Role]) -> bool:
+    user_mask = resolve_mask(roles)
+    return user_mask & REQUIRED_MASK == REQUIRED_MASK
+
+
+def cached_mask_check(user_mask: int) -> bool:
+    return user_mask & REQUIRED_MASK == REQUIRED_MASK
+
+
+def make_roles(count: int, rng: random.Random) -> list[Role]:
+    everything = [
+        permission
+        for permission in Permissions
+        if permission not in {Permissions.IS_SUPERUSER, Permissions.LOCKOUT}
+    ]
+    roles = [
+        Role(
+            name=f"role-{index}",
+            permissions=rng.sample(everything, rng.randint(1, 12)),
+            inverse_permissions=rng.sample(everything, rng.randint(0, 3)),
+            display_role=False,
+            priority=index,
+        )
+        for index in range(count)
+    ]
+    # The legacy loop only matches the priority ordered merge when roles arrive in priority order
+    return sorted(roles, key=lambda role: role.priority)
+
+
+def main() -> None:
+    rng = random.Random(2024)
+    print(f"{'roles':>6} {'legacy (us)':>12} {'mask (us)':>10} {'cached (us)':>12}")
+    for count in ROLE_COUNTS:
+        roles = make_roles(count, rng)
+        assert legacy_permissions(roles) == set(from_mask(resolve_mask(roles)))
+        assert legacy_check(roles) == mask_check(roles)
+
+        user_mask = resolve_mask(roles)
+        timings = [
+            timeit.timeit(lambda: legacy_check(roles), number=ITERATIONS),
+            timeit.timeit(lambda: mask_check(roles), number=ITERATIONS),
+            timeit.timeit(lambda: cached_mask_check(user_mask), number=ITERATIONS),
+        ]
+        print(
+            f"{count:>6} "
+            + " ".join(
+                f"{timing / ITERATIONS * 1e6:>{width}.2f}"
+                for timing, width in zip(timings, (12, 10, 12))
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Database round-trips per logged machine usage, and concurrent claiming throughput.
+
+Runs the original `use_a_machine` flow (kept below) and the current route
+handler against the test database, and counts the statements, transaction
+begins and commits each one sends. Authentication is left out, it is the same
+for both. Permission and active semester caches are warm, as they are for
+every request but the first.
+
+Then fires CLAIMS_PER_MACHINE simultaneous claims at each of MACHINES free
+machines, each in its own session as separate requests would be, through the
+current handler and a single connection pool.
+
+Needs the test database from `.env` to be reachable, its tables are recreated.
+Run from the backend folder:
+
+    python -m benchmarks.use_a_machine
+
+On a local Postgres 18, averaged over 50 usages each:
+
+        flow  statements  begins  commits  round-trips      ms
+      legacy        13.0     2.0      2.0         17.0    8.56
+     current         7.0     1.0      1.0          9.0    4.47
+
+Every statement the current flow sends, in order:
+
+    SELECT ... FROM machines ... FOR UPDATE NOWAIT     the claimed machine
+    INSERT INTO audit_logs
+    INSERT INTO machine_usages
+    UPDATE machines SET active_usage_id
+    INSERT INTO resource_usage_quantities
+    INSERT INTO user_semester_balances ... ON CONFLICT DO UPDATE
+    SELECT pg_notify(...)                              cache invalidation
+
+Usages of the active semester don't lock the semester or drop its charge sheet
+snapshot, see `api.balances`. Without that shortcut, the same run measured 8.0
+statements, 10.0 round-trips and 5.03 ms.
+
+Concurrent claims on the same database, with the default pool of 5 connections
+plus 10 overflow:
+
+    300 claims on 5 machines: 5 won, 295 got 409 in 470 ms, 638 claims/s
+"""
+
+import os
+
+os.environ["ENVIRONMENT"] = "PYTEST"
+
+import asyncio
+import time
+from collections import Counter
+from decimal import Decimal
+
+from fastapi import HTTPException, status
+from sqlalchemy import event, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+# Registers the ledger's flush hooks, which the app gets through its other routes
+import api.balances
+from api.routes.use_a_machine import use_a_machine
+from api.utils import has_permissions_any
+from core.session import async_engine, async_session
+from models import (
+    AuditLog,
+    Base,
+    Machine,
+    MachineType,
+    MachineUsage,
+    Resource,
+    ResourceSlot,
+    ResourceUsageQuantity,
+    Role,
+    Semester,
+    State,
+    User,
+)
+from schemas.enums import (
+    GenderStatsType,
+    LogType,
+    Permissions,
+    PronounType,
+    SemesterType,
+)
+from schemas.requests import MachineUsageRequest, ResourceUsage
+
+ITERATIONS = 50
+MACHINES = 5
+CLAIMS_PER_MACHINE = 60
+
+
+async def legacy_use_a_machine(
+    session: AsyncSession,
+    machine_id,
+    request: MachineUsageRequest,
+    current_user: User,
+) -> None:
+    """The database access pattern of `use_a_machine` before it was reworked."""
+
+    machine = await session.scalar(
+        select(Machine)
+        .where(Machine.id == machine_id)
+        .options(
+            selectinload(Machine.type)
+            .selectinload(MachineType.resource_slots)
+            .selectinload(ResourceSlot.valid_resources)
+        )
+        .options(selectinload(Machine.active_usage))
+    )
+    await has_permissions_any(
+        session,
+        current_user.id,
+        {Permissions.CAN_EDIT_MACHINES, Permissions.IS_SUPERUSER},
+    )
+    state = await session.scalar(
+        select(State).options(selectinload(State.active_semester))
+    )
+
+    slots = {slot.id: slot for slot in machine.type.resource_slots}
+    quantities = []
+    for slot_id, usage_info in request.resource_usages.items():
+        resource = next(
+            resource
+            for resource in slots[slot_id].valid_resources
+            if resource.id == usage_info.resource_id
+        )
+        quantities.append(
+            ResourceUsageQuantity(
+                resource=resource,
+                is_own_material=usage_info.is_own_material,
+                amount=usage_info.amount,
+                cpu_at_usage=resource.cost,
+            )
+        )
+
+    machine_usage = MachineUsage(
+        machine=machine,
+        semester=state.active_semester,
+        user=current_user,
+        duration_seconds=request.duration_seconds,
+        cost=Decimal(1),
+        resources_used=quantities,
+    )
+    machine.active_usage = machine_usage
+    session.add(machine_usage)
+    session.add(machine)
+    await session.commit()
+    await session.refresh(machine_usage)
+
+    session.add(
+        AuditLog(
+            type=LogType.MACHINE_USED,
+            content={"machine_usage_id": str(machine_usage.id)},
+        )
+    )
+    await session.commit()
+
+
+async def setup() -> tuple[User, Machine, MachineUsageRequest]:
+    async with async_engine.begin() as conn:
+        # machines and machine_usages reference each other, which drop_all can't order
+        tables = ", ".join(f'"{name}"' for name in Base.metadata.tables)
+        await conn.execute(text(f"DROP TABLE IF EXISTS {tables} CASCADE"))
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with async_session() as session:
+        # Resource usage quantities are keyed by the usage alone, so one slot per type
+        slots = [
+            ResourceSlot(
+                db_name=f"slot-{index}",
+                display_name=f"Slot {index}",
+                allow_own_material=True,
+                allow_empty=False,
+                valid_resources=[
+                    Resource(
+                        name=f"Resource {index}.{resource}",
+                        units="g",
+                        cost=Decimal("0.05"),
+                    )
+                    for resource in range(3)
+                ],
+            )
+            for index in range(1)
+        ]
+        machine = Machine(
+            name="Benchmark printer",
+            type=MachineType(
+                name="Benchmark type", cost_per_hour=Decimal(2), resource_slots=slots
+            ),
+        )
+        user = User(
+            RCSID="bench",
+            RIN="000000001",
+            first_name="Bench",
+            last_name="Mark",
+            major="CS",
+            gender_identity=GenderStatsType.NOTDISCLOSED,
+            pronouns=PronounType.NOT_SHOWN,
+            hashed_password="",
+            is_graduating=False,
+            is_rpi_staff=False,
+            roles=[
+                Role(
+                    name="Member",
+                    permissions=[Permissions.CAN_USE_MACHINES],
+                    inverse_permissions=[],
+                    display_role=False,
+                    priority=1,
+                )
+            ],
+        )
+        semester = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+        session.add_all([machine, user, semester, State(active_semester=semester)])
+        await session.commit()
+
+    request = MachineUsageRequest(
+        resource_usages={
+            slot.id: ResourceUsage(
+                resource_id=slot.valid_resources[0].id,
+                amount=Decimal(10),
+                is_own_material=False,
+            )
+            for slot in slots
+        },
+        duration_seconds=3600,
+        as_org_id=None,
+    )
+    return user, machine, request
+
+
+async def measure(run) -> tuple[Counter, float]:
+    counts: Counter = Counter()
+
+    def on_statement(*args):
+        counts["statements"] += 1
+
+    def on_begin(conn):
+        counts["begins"] += 1
+
+    def on_commit(conn):
+        counts["commits"] += 1
+
+    sync_engine = async_engine.sync_engine
+    listeners = (
+        ("before_cursor_execute", on_statement),
+        ("begin", on_begin),
+        ("commit", on_commit),
+    )
+    total = 0.0
+    for _ in range(ITERATIONS):
+        for name, listener in listeners:
+            event.listen(sync_engine, name, listener)
+        started = time.perf_counter()
+        try:
+            await run()
+        finally:
+            total += time.perf_counter() - started
+            for name, listener in listeners:
+                event.remove(sync_engine, name, listener)
+
+        # Free the machine for the next run, outside of the measurement
+        async with async_engine.begin() as conn:
+            await conn.execute(update(Machine).values(active_usage_id=None))
+
+    return counts, total / ITERATIONS
+
+
+async def claim_concurrently(
+    user: User, machine: Machine, request: MachineUsageRequest
+) -> tuple[int, float]:
+    """Claim new machines of `machine`'s type all at once. Returns wins and seconds."""
+
+    async with async_session() as session:
+        machines = [
+            Machine(name=f"Contended printer {index}", type_id=machine.type_id)
+            for index in range(MACHINES)
+        ]
+        session.add_all(machines)
+        await session.commit()
+
+    async def claim(machine_id) -> bool:
+        async with async_session() as session:
+            current_user = await session.get(User, user.id)
+            try:
+                await use_a_machine(machine_id, request, session, current_user)
+            except HTTPException as error:
+                if error.status_code != status.HTTP_409_CONFLICT:
+                    raise
+                return False
+            return True
+
+    claims = [
+        claim(contended.id) for _ in range(CLAIMS_PER_MACHINE) for contended in machines
+    ]
+    started = time.perf_counter()
+    results = await asyncio.gather(*claims)
+    return sum(results), time.perf_counter() - started
+
+
+async def main() -> None:
+    user, machine, request = await setup()
+
+    async def run_legacy():
+        async with async_session() as session:
+            current_user = await session.get(User, user.id)
+            await legacy_use_a_machine(session, machine.id, request, current_user)
+
+    async def run_current():
+        async with async_session() as session:
+            current_user = await session.get(User, user.id)
+            await use_a_machine(machine.id, request, session, current_user)
+
+    # Warm the permission and active semester caches
+    for run in (run_legacy, run_current):
+        await run()
+        async with async_engine.begin() as conn:
+            await conn.execute(update(Machine).values(active_usage_id=None))
+
+    print(
+        f"{'flow':>8} {'statements':>11} {'begins':>7} {'commits':>8}"
+        f" {'round-trips':>12} {'ms':>7}"
+    )
+    for name, run in (("legacy", run_legacy), ("current", run_current)):
+        counts, seconds = await measure(run)
+        # The user lookup stands in for authentication, don't count it
+        statements = counts["statements"] / ITERATIONS - 1
+        begins = counts["begins"] / ITERATIONS
+        commits = counts["commits"] / ITERATIONS
+        print(
+            f"{name:>8} {statements:>11.1f} {begins:>7.1f} {commits:>8.1f}"
+            f" {statements + begins + commits:>12.1f} {seconds * 1000:>7.2f}"
+        )
+
+    wins, seconds = await claim_concurrently(user, machine, request)
+    claims = MACHINES * CLAIMS_PER_MACHINE
+    print(
+        f"\n{claims} claims on {MACHINES} machines: {wins} won, {claims - wins} got 409"
+        f" in {seconds * 1000:.0f} ms, {claims / seconds:.0f} claims/s"
+    )
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
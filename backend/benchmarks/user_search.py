@@ -0,0 +1,170 @@
+"""
+Latency of `/users/search` on a large user table.
+
+Fills the test database with USERS members, then runs typical volunteer
+lookups through the route handler: part of a name, a first and last name, part
+of an RCSID, RIN prefixes and a full RIN. Each query is timed with the search
+indexes and again after dropping them, so the scans they save show up.
+Authentication is left out, it is the same for every query.
+
+Needs the test database from `.env` to be reachable, its tables are recreated.
+Run from the backend folder:
+
+    python -m benchmarks.user_search
+
+On a local Postgres 18 with 50,000 users, milliseconds per search:
+
+                   query           q  found  median     p95  no index     p95
+               last name      garcia     10    2.36    2.52     16.71   19.30
+     first and last name   maria gar     10    0.99    1.16     15.90   16.84
+        part of an RCSID      garcim     10    0.80    0.95     15.62   17.33
+              RIN prefix       66001     10    0.40    0.59      5.14    5.42
+                full RIN   660012345      1    0.31    0.37      2.89    3.15
+       unused RIN prefix          99      0    0.27    0.30      2.26    2.41
+
+"garcia" matches about 700 users, all of them ranked by similarity for the top
+10. Without the prefix index, RIN searches fall back to scanning the unique RIN
+index in order, which only works because that database uses the C collation.
+"""
+
+import os
+
+os.environ["ENVIRONMENT"] = "PYTEST"
+
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import insert, text
+
+from api.routes.users import search_users
+from core.session import async_engine, async_session
+from models import Base, User
+from schemas.enums import GenderStatsType, PronounType
+
+USERS = 50_000
+ITERATIONS = 200
+CHUNK_SIZE = 5_000
+
+FIRST_NAMES = (
+    "Aaliyah Adam Aiden Alex Amelia Ava Benjamin Caleb Charlotte Chloe Daniel "
+    "David Elijah Ella Emily Emma Ethan Evelyn Gabriel Grace Harper Henry Isaac "
+    "Isabella Jack Jacob James Jayden John Joseph Julia Liam Lily Logan Lucas "
+    "Maria Mason Mia Michael Noah Olivia Owen Priya Ryan Samuel Sofia Sophia "
+    "Wei William Zoe"
+).split()
+LAST_NAMES = (
+    "Adams Allen Anderson Baker Brown Campbell Carter Chen Clark Collins Cruz "
+    "Davis Diaz Edwards Evans Flores Garcia Gomez Gonzalez Green Hall Harris "
+    "Hernandez Hill Jackson Johnson Jones Kim King Lee Lewis Lopez Martin "
+    "Martinez Miller Mitchell Moore Morales Murphy Nelson Nguyen Parker Patel "
+    "Perez Phillips Ramirez Reyes Rivera Roberts Robinson Rodriguez Sanchez "
+    "Scott Shah Singh Smith Taylor Thomas Thompson Torres Turner Walker Wang "
+    "White Williams Wilson Wright Young Zhang"
+).split()
+
+QUERIES = (
+    ("last name", "garcia"),
+    ("first and last name", "maria gar"),
+    ("part of an RCSID", "garcim"),
+    ("RIN prefix", "66001"),
+    ("full RIN", "660012345"),
+    ("unused RIN prefix", "99"),
+)
+
+# The indexes /users/search relies on, see `models.user`
+SEARCH_INDEXES = (
+    "ix_users_rcsid_trgm",
+    "ix_users_first_name_trgm",
+    "ix_users_last_name_trgm",
+    "ix_users_rin_prefix",
+)
+
+
+def make_users(rng: random.Random) -> list[dict]:
+    users = []
+    taken: dict[str, int] = {}
+    for index in range(USERS):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        # RCSIDs are up to five letters of the last name, the first initial and a number
+        base = (last_name[:5] + first_name[0]).lower()
+        taken[base] = taken.get(base, 0) + 1
+        users.append(
+            {
+                "RCSID": f"{base}{taken[base]}",
+                "RIN": f"66{index:07d}",
+                "first_name": first_name,
+                "last_name": last_name,
+                "major": "CS",
+                "gender_identity": GenderStatsType.NOTDISCLOSED,
+                "pronouns": PronounType.NOT_SHOWN,
+                "hashed_password": "",
+                "is_graduating": False,
+                "is_rpi_staff": False,
+            }
+        )
+    return users
+
+
+async def setup() -> None:
+    async with async_engine.begin() as conn:
+        # machines and machine_usages reference each other, which drop_all can't order
+        tables = ", ".join(f'"{name}"' for name in Base.metadata.tables)
+        await conn.execute(text(f"DROP TABLE IF EXISTS {tables} CASCADE"))
+        await conn.run_sync(Base.metadata.create_all)
+
+    users = make_users(random.Random(2024))
+    async with async_engine.begin() as conn:
+        for start in range(0, USERS, CHUNK_SIZE):
+            await conn.execute(insert(User), users[start : start + CHUNK_SIZE])
+
+    # Bulk inserts pile up in the trigram indexes' pending lists, which make every
+    # search slow until merged. Autovacuum does that on a live table.
+    async with async_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE users"))
+
+
+async def measure(q: str) -> tuple[float, float, int]:
+    """Median and 95th percentile milliseconds of searching `q`, and the users found."""
+
+    timings = []
+    async with async_session() as session:
+        for _ in range(ITERATIONS):
+            started = time.perf_counter()
+            found = await search_users(session, None, q)  # type: ignore
+            timings.append((time.perf_counter() - started) * 1000)
+    percentiles = statistics.quantiles(timings, n=20)
+    return statistics.median(timings), percentiles[-1], len(found)
+
+
+async def main() -> None:
+    await setup()
+
+    indexed = [await measure(q) for _, q in QUERIES]
+
+    async with async_engine.begin() as conn:
+        for name in SEARCH_INDEXES:
+            await conn.execute(text(f"DROP INDEX {name}"))
+        await conn.execute(text("ANALYZE users"))
+    unindexed = [await measure(q) for _, q in QUERIES]
+
+    print(
+        f"{'query':>20} {'q':>11} {'found':>6} {'median':>7} {'p95':>7}"
+        f" {'no index':>9} {'p95':>7}"
+    )
+    for (kind, q), (median, p95, found), (scan_median, scan_p95, _) in zip(
+        QUERIES, indexed, unindexed
+    ):
+        print(
+            f"{kind:>20} {q:>11} {found:>6} {median:>7.2f} {p95:>7.2f}"
+            f" {scan_median:>9.2f} {scan_p95:>7.2f}"
+        )
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
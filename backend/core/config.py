@@ -36,9 +36,88 @@ class Settings(BaseSettings):
     ENVIRONMENT: Literal["DEV", "PYTEST", "STG", "PRD"] = "DEV"
     SECURITY_BCRYPT_ROUNDS: int = 12
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    # Embed the user's permissions in access tokens, so read-only endpoints can
+    # authorize without touching the database
+    JWT_PERMISSION_CLAIMS: bool = False
     BACKEND_CORS_ORIGINS: list[AnyHttpUrl] = []
     ALLOWED_HOSTS: list[str] = ["localhost", "127.0.0.1"]
 
+    # PASSWORD HASHING
+    # Threads running bcrypt, each hash keeps one busy for SECURITY_BCRYPT_ROUNDS worth of CPU
+    PASSWORD_HASH_WORKERS: int = 4
+    # Jobs allowed to wait for a free worker before login and signup answer 503
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    # Sent as Retry-After when the queue is full
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = 2
+
+    # CACHING
+    # Upper bound on the number of users whose effective permissions are kept in memory
+    PERMISSION_CACHE_SIZE: int = 4096
+    # How long a user's permission epoch is trusted before it is re-read from the database
+    PERMISSION_EPOCH_CACHE_SECONDS: int = 30
+    # Safety net for the machine status snapshot, which is otherwise only rebuilt after changes
+    MACHINE_STATUS_MAX_AGE_SECONDS: int = 60
+    # Versioned ETags change at least this often, even if an invalidation was missed
+    ETAG_MAX_AGE_SECONDS: int = 300
+    # Compiled machine type pricing plans, and machine to type lookups, kept in memory
+    PRICING_PLAN_CACHE_SIZE: int = 1024
+    # Serialized usage schema parts, per machine type and per machine
+    USAGE_SCHEMA_CACHE_SIZE: int = 1024
+    # Share cache invalidations between workers through Postgres LISTEN/NOTIFY
+    INVALIDATION_NOTIFY: bool = True
+    INVALIDATION_CHANNEL: str = "forge_invalidation"
+    # How often the LISTEN connection is checked, a dead one is replaced and all caches flushed
+    INVALIDATION_HEALTHCHECK_SECONDS: int = 30
+
+    # MACHINE STATUS STREAM
+    # Events buffered per subscriber before it is considered too slow and disconnected
+    STATUS_STREAM_QUEUE_SIZE: int = 32
+    # Recent events kept for clients resuming with Last-Event-ID
+    STATUS_STREAM_REPLAY_SIZE: int = 256
+    STATUS_STREAM_KEEPALIVE_SECONDS: int = 15
+    # Reconnect delay suggested to clients
+    STATUS_STREAM_RETRY_MILLISECONDS: int = 3000
+
+    # MONITORING
+    # Hosts /metrics answers to. The app-wide ALLOWED_HOSTS check runs first, so a host
+    # must be in both. Keep it to names only reachable from inside the deployment, e.g.
+    # the backend's docker-compose service name.
+    METRICS_ALLOWED_HOSTS: list[str] = ["localhost", "127.0.0.1"]
+    # How often the event loop is checked for lag, see `core.monitoring`
+    EVENT_LOOP_LAG_CHECK_SECONDS: float = 0.5
+
+    # CONNECTION POOL
+    # Every worker process has its own pool, so Postgres needs max_connections of at least
+    # workers * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW), plus one per worker for
+    # INVALIDATION_NOTIFY. Watch forge_db_pool_* in `core.metrics` to size them.
+    DATABASE_POOL_SIZE: int = 5
+    # Extra connections opened under load and closed again when returned
+    DATABASE_MAX_OVERFLOW: int = 10
+    # How long a request waits for a free connection before failing
+    DATABASE_POOL_TIMEOUT_SECONDS: float = 30
+    # Connections older than this are replaced on checkout, -1 to keep them forever
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800
+    # Test each connection with a round trip on checkout. Catches connections dropped
+    # by a database restart, at the cost of a round trip per checkout.
+    DATABASE_POOL_PRE_PING: bool = True
+    # Postgres cancels statements running longer than this, 0 for no limit
+    DATABASE_STATEMENT_TIMEOUT_MILLISECONDS: int = 0
+    # Statements running longer than this are logged with their route, 0 to log none.
+    # See `core.query_stats`.
+    SLOW_QUERY_MILLISECONDS: int = 200
+
+    # READ REPLICA
+    # Optional streaming replica of the default database, as a postgresql+asyncpg:// URI.
+    # Heavy read-only endpoints read from it when set, see `core.replica`.
+    REPLICA_DATABASE_URI: str | None = None
+    TEST_REPLICA_DATABASE_URI: str | None = None
+    # Reads go back to the primary while the replica is further behind than this
+    REPLICA_MAX_LAG_SECONDS: float = 5
+    # How long a lag measurement is trusted
+    REPLICA_LAG_CHECK_SECONDS: float = 1
+    # After a client writes, its reads stay on the primary for this long so it sees its changes
+    READ_YOUR_WRITES_SECONDS: int = 10
+
     # POSTGRESQL DEFAULT DATABASE
     DEFAULT_DATABASE_HOSTNAME: str
     DEFAULT_DATABASE_USER: str
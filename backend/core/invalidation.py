@@ -0,0 +1,236 @@
+"""
+Transaction-aware invalidation of in-process caches.
+
+Caches subscribe a handler to a topic. Code that changes the rows behind a
+cache calls `mark_changed` on the session doing the work, and the handlers run
+once that session commits. Changes that are rolled back never evict anything,
+and a reader can't refill a cache from rows that are about to change.
+
+Models registered in `TRACKED_MODELS` don't need explicit calls: any flush that
+adds, edits or deletes one marks its topic as changed. Those in
+`CATALOG_TOPICS` also mark a narrower topic, unless all that changed is an
+attribute that changes all the time, like which usage a machine is running.
+
+With INVALIDATION_NOTIFY enabled, the same changes are published with
+`pg_notify` inside the committing transaction, so other processes hear about
+them exactly when they become visible. See `core.invalidation_listener`.
+
+https://docs.sqlalchemy.org/en/20/orm/session_events.html
+"""
+
+import json
+import secrets
+from collections.abc import Callable, Iterable
+from enum import StrEnum
+from uuid import UUID
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import (
+    Machine,
+    MachineGroup,
+    MachineType,
+    MachineUsage,
+    Resource,
+    ResourceSlot,
+    ResourceSlotAssociation,
+    ResourceUsageQuantity,
+    Semester,
+    State,
+    User,
+)
+from models.machine_type import MachineTypeSlotAssociation
+from . import config, metrics
+
+cache_lookups = metrics.counter(
+    "forge_cache_lookups",
+    "Lookups in in-process caches, by cache and whether they were a hit or a miss",
+    ["cache", "result"],
+)
+
+# Identifies this process, e.g. to tell whether a client's cached state came from it.
+INSTANCE_ID = secrets.token_hex(4)
+
+
+class Topic(StrEnum):
+    # Effective permissions of users. Keys are user ids.
+    PERMISSIONS = "permissions"
+
+    # Whole tables, invalidated without keys by any flush that touches them.
+    MACHINES = "machines"
+    MACHINE_GROUPS = "machine_groups"
+    MACHINE_TYPES = "machine_types"
+    MACHINE_USAGES = "machine_usages"
+    RESOURCES = "resources"
+    RESOURCE_SLOTS = "resource_slots"
+    SEMESTERS = "semesters"
+    STATE = "state"
+    USERS = "users"
+
+    # Machines without their active usage, so claiming and clearing don't change it.
+    MACHINE_CATALOG = "machine_catalog"
+
+
+TRACKED_MODELS: dict[type, Topic] = {
+    Machine: Topic.MACHINES,
+    MachineGroup: Topic.MACHINE_GROUPS,
+    MachineType: Topic.MACHINE_TYPES,
+    MachineTypeSlotAssociation: Topic.MACHINE_TYPES,
+    MachineUsage: Topic.MACHINE_USAGES,
+    ResourceUsageQuantity: Topic.MACHINE_USAGES,
+    Resource: Topic.RESOURCES,
+    ResourceSlot: Topic.RESOURCE_SLOTS,
+    ResourceSlotAssociation: Topic.RESOURCE_SLOTS,
+    Semester: Topic.SEMESTERS,
+    State: Topic.STATE,
+    User: Topic.USERS,
+}
+
+# Narrower topics of tracked models, with the attributes whose changes they ignore.
+CATALOG_TOPICS: dict[type, tuple[Topic, frozenset[str]]] = {
+    Machine: (Topic.MACHINE_CATALOG, frozenset({"active_usage_id", "active_usage"})),
+}
+
+
+# A set of keys to evict, or None to evict everything under a topic.
+Keys = frozenset[UUID] | None
+Handler = Callable[[Keys], None]
+
+_handlers: dict[Topic, list[Handler]] = {}
+
+# Bumped every time a topic is invalidated, so readers can tell whether anything changed.
+_versions: dict[Topic, int] = dict.fromkeys(Topic, 0)
+
+_PENDING_INFO_KEY = "pending_invalidations"
+
+# NOTIFY payloads must be shorter than 8000 bytes
+_MAX_MESSAGE_BYTES = 7900
+
+
+def subscribe(topic: Topic, handler: Handler) -> None:
+    """Run `handler` whenever `topic` is invalidated."""
+    _handlers.setdefault(topic, []).append(handler)
+
+
+def topic_version(topic: Topic) -> int:
+    """Return a counter that changes whenever `topic` is invalidated in this process."""
+    return _versions[topic]
+
+
+def invalidate(topic: Topic, keys: Iterable[UUID] | None = None) -> None:
+    """Evict `keys` (or everything) under `topic` right away."""
+    _versions[topic] += 1
+    frozen_keys = frozenset(keys) if keys is not None else None
+    for handler in _handlers.get(topic, []):
+        handler(frozen_keys)
+
+
+def invalidate_all() -> None:
+    """Evict everything from every cache, e.g. after rows were changed behind the ORM's back."""
+    for topic in Topic:
+        invalidate(topic)
+
+
+def mark_changed(
+    session: Session | AsyncSession,
+    topic: Topic,
+    keys: Iterable[UUID] | None = None,
+) -> None:
+    """Invalidate `keys` (or everything) under `topic` once `session` commits."""
+    if isinstance(session, AsyncSession):
+        session = session.sync_session
+
+    pending: dict[Topic, set[UUID] | None] = session.info.setdefault(
+        _PENDING_INFO_KEY, {}
+    )
+    if keys is None:
+        pending[topic] = None
+    elif topic not in pending:
+        pending[topic] = set(keys)
+    elif pending[topic] is not None:
+        pending[topic].update(keys)
+
+
+def encode_message(pending: dict[Topic, set[UUID] | None]) -> str:
+    """Serialize pending invalidations for other processes, tagged with INSTANCE_ID."""
+
+    topics = {
+        topic.value: sorted(map(str, keys)) if keys is not None else None
+        for topic, keys in pending.items()
+    }
+    message = json.dumps({"i": INSTANCE_ID, "t": topics}, separators=(",", ":"))
+    if len(message.encode()) > _MAX_MESSAGE_BYTES:
+        # Too many keys to list, evict the whole topics instead
+        topics = dict.fromkeys(topics)
+        message = json.dumps({"i": INSTANCE_ID, "t": topics}, separators=(",", ":"))
+    return message
+
+
+def apply_message(message: str) -> None:
+    """Apply invalidations published by another process. Our own messages are ignored."""
+
+    decoded = json.loads(message)
+    if decoded["i"] == INSTANCE_ID:
+        # Already applied locally on commit
+        return
+    try:
+        topics = [(Topic(name), keys) for name, keys in decoded["t"].items()]
+    except ValueError:
+        # Published by a newer version of the app, we can't tell what it covers
+        invalidate_all()
+        return
+    for topic, keys in topics:
+        invalidate(topic, map(UUID, keys) if keys is not None else None)
+
+
+@event.listens_for(Session, "before_commit")
+def _publish_pending(session: Session) -> None:
+    if not config.settings.INVALIDATION_NOTIFY:
+        return
+
+    # Commit flushes after this hook runs, so flush now to see everything it would mark
+    session.flush()
+    pending = session.info.get(_PENDING_INFO_KEY)
+    if pending:
+        session.execute(
+            select(
+                func.pg_notify(
+                    config.settings.INVALIDATION_CHANNEL, encode_message(pending)
+                )
+            )
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session: Session) -> None:
+    for topic, keys in session.info.pop(_PENDING_INFO_KEY, {}).items():
+        invalidate(topic, keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_INFO_KEY, None)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_model_changes(session: Session, flush_context, instances) -> None:
+    for obj in (*session.new, *session.deleted):
+        topic = TRACKED_MODELS.get(type(obj))
+        if topic is not None:
+            mark_changed(session, topic)
+        catalog = CATALOG_TOPICS.get(type(obj))
+        if catalog is not None:
+            mark_changed(session, catalog[0])
+    for obj in session.dirty:
+        topic = TRACKED_MODELS.get(type(obj))
+        if topic is not None and session.is_modified(obj):
+            mark_changed(session, topic)
+        catalog = CATALOG_TOPICS.get(type(obj))
+        if catalog is not None and any(
+            attr.history.has_changes()
+            for attr in inspect(obj).attrs
+            if attr.key not in catalog[1]
+        ):
+            mark_changed(session, catalog[0])
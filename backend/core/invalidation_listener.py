@@ -0,0 +1,76 @@
+"""
+Cross-process cache invalidation through Postgres LISTEN/NOTIFY.
+
+Every process publishes its committed invalidations on INVALIDATION_CHANNEL
+(see `core.invalidation`) and holds one connection listening on it, applying
+what other processes publish to its own caches.
+
+Notifications sent while a process isn't listening are lost, so every time the
+listening connection is (re)established all local caches are flushed.
+
+https://www.postgresql.org/docs/current/sql-notify.html
+"""
+
+import asyncio
+import logging
+
+from . import config
+from .invalidation import apply_message, invalidate_all
+from .session import async_engine
+
+logger = logging.getLogger(__name__)
+
+# Delay before reconnecting after the listening connection failed
+_RECONNECT_DELAY_SECONDS = 1
+
+
+def _on_notification(connection, pid: int, channel: str, payload: str) -> None:
+    try:
+        apply_message(payload)
+    except Exception:
+        logger.exception("Bad invalidation message, flushing all caches")
+        invalidate_all()
+
+
+async def _listen_once() -> None:
+    """Listen on one connection until it is lost."""
+
+    # Taken out of the pool for good, it's only used for LISTEN
+    connection = await async_engine.raw_connection()
+    # Read before detaching, the pool connection forgets it afterwards
+    driver_connection = connection.driver_connection
+    connection.detach()
+    lost = asyncio.Event()
+    try:
+        driver_connection.add_termination_listener(lambda _: lost.set())
+        await driver_connection.add_listener(
+            config.settings.INVALIDATION_CHANNEL, _on_notification
+        )
+        # Anything could have changed while nobody was listening
+        invalidate_all()
+
+        timeout = config.settings.INVALIDATION_HEALTHCHECK_SECONDS
+        while True:
+            try:
+                await asyncio.wait_for(lost.wait(), timeout)
+                return
+            except TimeoutError:
+                # A half-open connection doesn't fire the termination listener
+                await asyncio.wait_for(driver_connection.execute("SELECT 1"), timeout)
+    finally:
+        if not driver_connection.is_closed():
+            driver_connection.terminate()
+
+
+async def listen_for_invalidations() -> None:
+    """Apply invalidations published by other processes, reconnecting forever."""
+
+    while True:
+        try:
+            await _listen_once()
+            logger.warning("Invalidation listener connection lost, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Invalidation listener failed, reconnecting")
+        await asyncio.sleep(_RECONNECT_DELAY_SECONDS)
@@ -0,0 +1,107 @@
+"""
+Request and event loop metrics, and the `/metrics` endpoint that exposes them.
+
+`RequestMetricsMiddleware` counts requests and times them, labelled by route
+template (e.g. `GET /machines/{machine_id}`) and status code, and tracks how
+many are in flight. `monitor_event_loop` runs for the lifetime of the app and
+measures how late the event loop wakes up from a sleep: anything blocking it,
+like synchronous work in an async endpoint, shows up as lag.
+
+`metrics_app` serves everything in `core.metrics.REGISTRY`, including the pool,
+password hashing and cache metrics of other modules, for Prometheus to scrape.
+`main` mounts it behind its own `TrustedHostMiddleware`, limited to
+METRICS_ALLOWED_HOSTS, inside the app-wide one for ALLOWED_HOSTS: only hosts in
+both lists get through.
+"""
+
+import asyncio
+import time
+
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import config, metrics
+
+http_requests = metrics.counter(
+    "forge_http_requests",
+    "HTTP requests handled, by route and status code",
+    ["route", "status"],
+)
+http_request_duration_seconds = metrics.histogram(
+    "forge_http_request_duration_seconds",
+    "Time from receiving a request to the end of its response, by route and status code",
+    ["route", "status"],
+)
+http_requests_in_flight = metrics.gauge(
+    "forge_http_requests_in_flight", "HTTP requests being handled"
+)
+event_loop_lag_seconds = metrics.histogram(
+    "forge_event_loop_lag_seconds",
+    "How late the event loop woke up from a sleep",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+def route_label(scope: Scope) -> str:
+    """Method and path template of the route a request matched, to label metrics with.
+
+    Templates keep the number of label values bounded, unlike raw paths.
+    """
+
+    route = scope.get("route")
+    if route is not None:
+        path = route.path
+    elif "endpoint" in scope:
+        # Plain Starlette routes, like /metrics, have no parameters
+        path = scope["path"]
+    else:
+        path = "unmatched"
+    return f"{scope['method']} {path}"
+
+
+class RequestMetricsMiddleware:
+    """Counts, times and tracks in-flight requests."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = "500"
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = route_label(scope)
+            http_requests.inc(route=route, status=status)
+            http_request_duration_seconds.observe(
+                time.perf_counter() - started, route=route, status=status
+            )
+
+
+async def monitor_event_loop() -> None:
+    """Measure event loop lag every EVENT_LOOP_LAG_CHECK_SECONDS, until cancelled."""
+
+    loop = asyncio.get_running_loop()
+    interval = config.settings.EVENT_LOOP_LAG_CHECK_SECONDS
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(0.0, loop.time() - started - interval))
+
+
+async def metrics_app(scope: Scope, receive: Receive, send: Send) -> None:
+    response = Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+    await response(scope, receive, send)
@@ -0,0 +1,155 @@
+"""
+Per-request database statistics.
+
+`QueryStatsMiddleware` gives every request a `RequestStats`, kept in a context
+variable, and engine events add each statement the request runs to it:
+how many there were, the time spent in them and the slowest one. When the
+request is done they are recorded in per-route histograms in `core.metrics`,
+and outside production they are also sent back in a `Server-Timing` header,
+so browser dev tools show them next to the request.
+
+Statements slower than SLOW_QUERY_MILLISECONDS are logged on the
+`core.query_stats.slow` logger with the route and the SQL, normalized so no
+parameter values or literals end up in the log.
+
+https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+https://docs.sqlalchemy.org/en/20/core/events.html#sqlalchemy.events.ConnectionEvents
+"""
+
+import logging
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import config, metrics
+from .monitoring import route_label
+
+slow_query_logger = logging.getLogger(f"{__name__}.slow")
+
+request_db_statements = metrics.histogram(
+    "forge_request_db_statements",
+    "SQL statements run per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+request_db_seconds = metrics.histogram(
+    "forge_request_db_seconds",
+    "Time spent running SQL statements per request",
+    ["route"],
+)
+slow_queries = metrics.counter(
+    "forge_slow_queries",
+    "Statements slower than SLOW_QUERY_MILLISECONDS",
+    ["route"],
+)
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+# Bound parameters, and lists of them from expanded IN clauses
+_PLACEHOLDERS = re.compile(r"\$\d+(?:\s*,\s*\$\d+)*|%\(\w+\)s")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(statement: str) -> str:
+    """One line of SQL with every parameter and literal replaced by `?`."""
+
+    statement = " ".join(statement.split())
+    statement = _STRINGS.sub("?", statement)
+    statement = _PLACEHOLDERS.sub("?", statement)
+    return _NUMBERS.sub("?", statement)
+
+
+@dataclass(slots=True)
+class RequestStats:
+    scope: Scope
+    started: float = field(default_factory=time.perf_counter)
+    statements: int = 0
+    db_seconds: float = 0
+    slowest_seconds: float = 0
+
+    @property
+    def route(self) -> str:
+        """Method and path template of the route, once the request has been routed."""
+
+        return route_label(self.scope)
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.statements} statements", '
+            f"db-slowest;dur={self.slowest_seconds * 1000:.1f}, "
+            f"app;dur={(time.perf_counter() - self.started) * 1000:.1f}"
+        )
+
+
+_current_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def current_stats() -> RequestStats | None:
+    """Statistics of the request being handled, if any."""
+
+    return _current_stats.get()
+
+
+# Listening on the Engine class covers every engine, primary and replica.
+# The async engines run these in a greenlet that shares the request's context.
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+        stats.slowest_seconds = max(stats.slowest_seconds, elapsed)
+
+    threshold = config.settings.SLOW_QUERY_MILLISECONDS
+    if threshold and elapsed * 1000 >= threshold:
+        route = stats.route if stats is not None else "-"
+        slow_queries.inc(route=route)
+        slow_query_logger.warning(
+            "Slow query on %s, %.1f ms: %s",
+            route,
+            elapsed * 1000,
+            normalize_sql(statement),
+        )
+
+
+class QueryStatsMiddleware:
+    """Collects a `RequestStats` per request and records it once the request is done."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.server_timing = config.settings.ENVIRONMENT != "PRD"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current_stats.set(stats)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and self.server_timing:
+                MutableHeaders(scope=message).append(
+                    "server-timing", stats.server_timing()
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            request_db_statements.observe(stats.statements, route=stats.route)
+            request_db_seconds.observe(stats.db_seconds, route=stats.route)
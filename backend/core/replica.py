@@ -0,0 +1,136 @@
+"""
+Routing of read-only sessions to an optional read replica.
+
+Endpoints that take a `ReadOnlyDBSession` (see `api.deps`) read from the
+replica set by REPLICA_DATABASE_URI, falling back to the primary:
+
+- when no replica is configured,
+- while the replica can't be reached or is more than REPLICA_MAX_LAG_SECONDS
+  behind, measured at most every REPLICA_LAG_CHECK_SECONDS,
+- for READ_YOUR_WRITES_SECONDS after the client made a request that could have
+  written, so it sees its own changes. `ReadYourWritesMiddleware` marks those
+  clients with a short-lived cookie, which works across worker processes.
+
+In-process caches are invalidated when the primary commits, so they must never
+be filled from a replica session: a lagging replica would put stale rows back.
+
+https://www.postgresql.org/docs/current/hot-standby.html
+"""
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import config, metrics
+from .session import async_session, replica_engine, replica_session
+
+logger = logging.getLogger(__name__)
+
+READ_PRIMARY_COOKIE = "forge_read_primary"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Seconds since the last replayed transaction, 0 when the replica has replayed
+# everything it received or isn't replicating at all
+LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+# A replica that takes longer than this to answer is treated as down
+_LAG_QUERY_TIMEOUT_SECONDS = 2
+
+replica_lag_seconds = metrics.gauge(
+    "forge_db_replica_lag_seconds",
+    "Replication lag of the read replica at the last check, -1 if it was unreachable",
+)
+read_sessions = metrics.counter(
+    "forge_db_read_sessions",
+    "Read-only sessions, by the database they were routed to",
+    ["target"],
+)
+
+_lag_lock = asyncio.Lock()
+_lag_checked_at = float("-inf")
+_replica_usable = False
+
+
+async def _measure_lag() -> float:
+    async with replica_engine.connect() as connection:
+        return float(await connection.scalar(LAG_QUERY))
+
+
+async def replica_usable() -> bool:
+    """Whether the replica is reachable and close enough behind the primary."""
+
+    global _lag_checked_at, _replica_usable
+
+    if time.monotonic() - _lag_checked_at < config.settings.REPLICA_LAG_CHECK_SECONDS:
+        return _replica_usable
+    if _lag_lock.locked():
+        # Another request is measuring, go with the last answer meanwhile
+        return _replica_usable
+
+    async with _lag_lock:
+        try:
+            lag = await asyncio.wait_for(_measure_lag(), _LAG_QUERY_TIMEOUT_SECONDS)
+        except (OSError, SQLAlchemyError, TimeoutError):
+            logger.warning("Read replica unreachable, reading from the primary")
+            replica_lag_seconds.set(-1)
+            _replica_usable = False
+        else:
+            replica_lag_seconds.set(lag)
+            _replica_usable = lag <= config.settings.REPLICA_MAX_LAG_SECONDS
+        _lag_checked_at = time.monotonic()
+    return _replica_usable
+
+
+async def read_session_maker(request: Request) -> async_sessionmaker:
+    """The sessionmaker a read-only request should use."""
+
+    if (
+        replica_session is None
+        or READ_PRIMARY_COOKIE in request.cookies
+        or not await replica_usable()
+    ):
+        read_sessions.inc(target="primary")
+        return async_session
+    read_sessions.inc(target="replica")
+    return replica_session
+
+
+class ReadYourWritesMiddleware:
+    """Keeps clients on the primary for a while after a request that could have written."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.cookie = (
+            f"{READ_PRIMARY_COOKIE}=1; Max-Age={config.settings.READ_YOUR_WRITES_SECONDS}; "
+            "Path=/; HttpOnly; SameSite=Lax"
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or replica_session is None
+            or scope["method"] in SAFE_METHODS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append("set-cookie", self.cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -1,12 +1,17 @@
 """Black-box security shortcuts to generate JWT tokens and password hashing and verifcation."""
 
+import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+from uuid import UUID
 
 import jwt
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 from pydantic import BaseModel, SecretStr
 
-from . import config
+from . import config, metrics
 from schemas.responses import AccessTokenResponse
 
 JWT_ALGORITHM = "HS256"
@@ -17,19 +22,99 @@ PWD_CONTEXT = CryptContext(
     bcrypt__rounds=config.settings.SECURITY_BCRYPT_ROUNDS,
 )
 
+# bcrypt releases the GIL while hashing, so a thread pool is enough to keep the event loop free
+_password_executor = ThreadPoolExecutor(
+    max_workers=config.settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash",
+)
+# Jobs submitted to the pool and not finished yet, running or waiting for a worker
+_password_jobs_pending = 0
+
+PASSWORD_HASH_BUSY_ERROR = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many login attempts in progress, try again shortly",
+    headers={"Retry-After": str(config.settings.PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+)
+
+password_hash_queue_depth = metrics.gauge(
+    "forge_password_hash_queue_depth",
+    "Password hashing jobs waiting for a free worker",
+    callback=lambda: max(
+        0, _password_jobs_pending - config.settings.PASSWORD_HASH_WORKERS
+    ),
+)
+password_hash_in_progress = metrics.gauge(
+    "forge_password_hash_in_progress",
+    "Password hashing jobs running or queued",
+    callback=lambda: _password_jobs_pending,
+)
+password_hash_seconds = metrics.histogram(
+    "forge_password_hash_seconds",
+    "Time spent hashing or verifying a password on a worker",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0),
+)
+password_hash_wait_seconds = metrics.histogram(
+    "forge_password_hash_wait_seconds",
+    "Time a password hashing job waited for a free worker",
+    ["operation"],
+)
+password_hash_rejected = metrics.counter(
+    "forge_password_hash_rejected",
+    "Password hashing jobs refused because the queue was full",
+    ["operation"],
+)
+
+T = TypeVar("T")
+
+
+class PermissionClaims(BaseModel):
+    """Resolved permissions of a user, signed into their access token.
+
+    Only trusted while `epoch` matches the user's current permission epoch
+    and `perm_schema` matches the running permission bit layout.
+    """
+
+    uid: UUID
+    perms: int
+    epoch: int
+    perm_schema: str
+
 
 class JWTTokenPayload(BaseModel):
     sub: str | int
     issued_at: int
     expires_at: int
 
-
-def create_jwt_token(subject: str | int, exp_secs: int) -> tuple[str, int, int]:
+    # Only present on tokens issued with JWT_PERMISSION_CLAIMS enabled
+    uid: UUID | None = None
+    perms: int | None = None
+    epoch: int | None = None
+    perm_schema: str | None = None
+
+    @property
+    def permission_claims(self) -> PermissionClaims | None:
+        if None in (self.uid, self.perms, self.epoch, self.perm_schema):
+            return None
+        return PermissionClaims(
+            uid=self.uid,
+            perms=self.perms,
+            epoch=self.epoch,
+            perm_schema=self.perm_schema,
+        )
+
+
+def create_jwt_token(
+    subject: str | int,
+    exp_secs: int,
+    permission_claims: PermissionClaims | None = None,
+) -> tuple[str, int, int]:
     """Creates jwt access token for user.
 
     Args:
         subject: anything unique to user, id or email etc.
         exp_secs: expire time in seconds
+        permission_claims: resolved permissions to embed in the token, if any
     """
 
     issued_at = int(time.time())
@@ -40,6 +125,8 @@ def create_jwt_token(subject: str | int, exp_secs: int) -> tuple[str, int, int]:
         "expires_at": expires_at,
         "sub": subject,
     }
+    if permission_claims is not None:
+        to_encode.update(permission_claims.model_dump(mode="json"))
     encoded_jwt = jwt.encode(
         to_encode,
         key=config.settings.SECRET_KEY,
@@ -48,9 +135,13 @@ def create_jwt_token(subject: str | int, exp_secs: int) -> tuple[str, int, int]:
     return encoded_jwt, expires_at, issued_at
 
 
-def create_token_response(subject: str) -> AccessTokenResponse:
+def create_token_response(
+    subject: str, permission_claims: PermissionClaims | None = None
+) -> AccessTokenResponse:
     token, expires_at, issued_at = create_jwt_token(
-        subject=subject, exp_secs=ACCESS_TOKEN_EXPIRE_SECS
+        subject=subject,
+        exp_secs=ACCESS_TOKEN_EXPIRE_SECS,
+        permission_claims=permission_claims,
     )
     return AccessTokenResponse(
         token_type="bearer",
@@ -76,3 +167,53 @@ def get_password_hash(password: SecretStr) -> str:
     It takes about 0.3s for default 12 rounds of SECURITY_BCRYPT_DEFAULT_ROUNDS.
     """
     return PWD_CONTEXT.hash(password.get_secret_value())
+
+
+def _release_password_job(_) -> None:
+    global _password_jobs_pending
+    _password_jobs_pending -= 1
+
+
+async def _run_password_job(operation: str, func: Callable[..., T], *args) -> T:
+    """Run `func` on the password pool, or raise 503 if its queue is full."""
+
+    global _password_jobs_pending
+    settings = config.settings
+    if (
+        _password_jobs_pending
+        >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_SIZE
+    ):
+        password_hash_rejected.inc(operation=operation)
+        raise PASSWORD_HASH_BUSY_ERROR
+
+    submitted_at = time.perf_counter()
+
+    def job() -> T:
+        started_at = time.perf_counter()
+        password_hash_wait_seconds.observe(
+            started_at - submitted_at, operation=operation
+        )
+        try:
+            return func(*args)
+        finally:
+            password_hash_seconds.observe(
+                time.perf_counter() - started_at, operation=operation
+            )
+
+    _password_jobs_pending += 1
+    future = asyncio.wrap_future(_password_executor.submit(job))
+    # Released when the job actually finishes, even if the request is cancelled first
+    future.add_done_callback(_release_password_job)
+    return await asyncio.shield(future)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Same as `verify_password`, but runs on the password pool instead of blocking the event loop."""
+    return await _run_password_job(
+        "verify", verify_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password: SecretStr) -> str:
+    """Same as `get_password_hash`, but runs on the password pool instead of blocking the event loop."""
+    return await _run_password_job("hash", get_password_hash, password)
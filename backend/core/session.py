@@ -1,19 +1,133 @@
 """
 SQLAlchemy async engine and sessions tools
 
+The connection pool is sized and timed out through `core.config.Settings`, and
+reports its state to `core.metrics`: connections checked out and in overflow,
+how long checkouts wait for a free connection, and how many connections were
+invalidated (dropped after an error, e.g. the database restarting).
+
 https://docs.sqlalchemy.org/en/20/orm/extensions/asyncio.html
+https://docs.sqlalchemy.org/en/20/core/pooling.html
 """
 
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from . import config, metrics
+
+pool_size = metrics.gauge(
+    "forge_db_pool_size", "Connections the pool keeps open", ["pool"]
+)
+pool_checked_out = metrics.gauge(
+    "forge_db_pool_checked_out", "Connections currently in use", ["pool"]
+)
+pool_overflow = metrics.gauge(
+    "forge_db_pool_overflow",
+    "Connections open beyond the pool size",
+    ["pool"],
+)
+pool_checkout_wait_seconds = metrics.histogram(
+    "forge_db_pool_checkout_wait_seconds",
+    "Time spent getting a connection from the pool, including opening new ones",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+pool_checkout_timeouts = metrics.counter(
+    "forge_db_pool_checkout_timeouts",
+    "Checkouts that gave up waiting for a free connection",
+    ["pool"],
+)
+pool_invalidated = metrics.counter(
+    "forge_db_pool_invalidated",
+    "Connections invalidated after an error or a failed pre-ping",
+    ["pool"],
+)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """The default async pool, timing every checkout and counting connections in use.
+    Named by `pool_logging_name`."""
+
+    def _do_get(self):
+        name = self._orig_logging_name
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            pool_checkout_timeouts.inc(pool=name)
+            raise
+        finally:
+            pool_checkout_wait_seconds.observe(time.perf_counter() - started, pool=name)
+        self._update_usage()
+        return record
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        # The checkin event fires before this, while the connection still counts as out
+        self._update_usage()
+
+    def _update_usage(self):
+        name = self._orig_logging_name
+        pool_checked_out.set(self.checkedout(), pool=name)
+        pool_overflow.set(max(0, self.overflow()), pool=name)
+
+
+def create_pooled_engine(url: str, name: str) -> AsyncEngine:
+    """An engine with a pool configured and instrumented from the settings."""
+
+    settings = config.settings
+    server_settings = {}
+    if settings.DATABASE_STATEMENT_TIMEOUT_MILLISECONDS:
+        server_settings["statement_timeout"] = str(
+            settings.DATABASE_STATEMENT_TIMEOUT_MILLISECONDS
+        )
+
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_logging_name=name,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        connect_args={"server_settings": server_settings},
+    )
+    pool_size.set(settings.DATABASE_POOL_SIZE, pool=name)
+
+    # Listeners on the engine follow its pool across dispose()
+    def count_invalidation(*args):
+        pool_invalidated.inc(pool=name)
+
+    event.listen(engine.sync_engine, "invalidate", count_invalidation)
+    event.listen(engine.sync_engine, "soft_invalidate", count_invalidation)
+    return engine
 
-from . import config
 
 if config.settings.ENVIRONMENT == "PYTEST":
     sqlalchemy_database_uri = config.settings.TEST_SQLALCHEMY_DATABASE_URI
 else:
     sqlalchemy_database_uri = config.settings.DEFAULT_SQLALCHEMY_DATABASE_URI
 
-print(f"Using database URI: {sqlalchemy_database_uri}")
-
-async_engine = create_async_engine(sqlalchemy_database_uri, pool_pre_ping=True)
+async_engine = create_pooled_engine(sqlalchemy_database_uri, "primary")
 async_session = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# Optional read replica, see `core.replica`
+if config.settings.ENVIRONMENT == "PYTEST":
+    replica_database_uri = config.settings.TEST_REPLICA_DATABASE_URI
+else:
+    replica_database_uri = config.settings.REPLICA_DATABASE_URI
+
+replica_engine = (
+    create_pooled_engine(replica_database_uri, "replica")
+    if replica_database_uri
+    else None
+)
+replica_session = (
+    async_sessionmaker(replica_engine, expire_on_commit=False)
+    if replica_engine
+    else None
+)
@@ -1,17 +1,54 @@
 """Main FastAPI app instance declaration."""
 
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
 from api.api import api_router
 from core import config
+from core.invalidation_listener import listen_for_invalidations
+from core.monitoring import RequestMetricsMiddleware, metrics_app, monitor_event_loop
+from core.query_stats import QueryStatsMiddleware
+from core.replica import ReadYourWritesMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener = None
+    if config.settings.INVALIDATION_NOTIFY:
+        listener = asyncio.create_task(listen_for_invalidations())
+    loop_monitor = asyncio.create_task(monitor_event_loop())
+
+    yield
+
+    loop_monitor.cancel()
+    with suppress(asyncio.CancelledError):
+        await loop_monitor
+    if listener is not None:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+
 
 app = FastAPI(
     root_path="/api",
+    lifespan=lifespan,
 )
 app.include_router(api_router)
 
+# Prometheus metrics, only for internal hosts
+app.add_route(
+    "/metrics",
+    TrustedHostMiddleware(
+        metrics_app, allowed_hosts=config.settings.METRICS_ALLOWED_HOSTS
+    ),
+    methods=["GET"],
+    include_in_schema=False,
+)
+
 # Sets all CORS enabled origins
 app.add_middleware(
     CORSMiddleware,
@@ -21,5 +58,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Keeps clients reading from the primary right after they write
+app.add_middleware(ReadYourWritesMiddleware)
+
 # Guards against HTTP Host Header attacks
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=config.settings.ALLOWED_HOSTS)
+
+# Counts and times the SQL each request runs, outside the other middlewares
+app.add_middleware(QueryStatsMiddleware)
+
+# Request rates, latencies and in-flight requests, see /metrics
+app.add_middleware(RequestMetricsMiddleware)
@@ -12,3 +12,5 @@ from .role import Role, UserRoleAssociation
 from .semester import Semester
 from .state import State
 from .user import User
+from .user_semester_balance import UserSemesterBalance
+from .charge_sheet_snapshot import ChargeSheetSnapshot, ChargeSheetSnapshotRow
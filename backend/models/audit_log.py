@@ -1,14 +1,28 @@
 from datetime import datetime
-from typing import Any
+from typing import Any, Optional
 from .base import Base
 
-from schemas.enums import LogType
+from schemas.enums import EntityType, LogType
 
-from sqlalchemy import UUID as DB_UUID, DateTime, func
+from sqlalchemy import (
+    UUID as DB_UUID,
+    DateTime,
+    Index,
+    String,
+    event,
+    func,
+    literal_column,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 
 from uuid import uuid4, UUID
 
+# The content key holding the id of the entity a log is about, for each type of entity
+ENTITY_ID_KEYS: dict[str, EntityType] = {
+    f"{entity_type}_id": entity_type for entity_type in EntityType
+}
+
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
@@ -21,4 +35,40 @@ class AuditLog(Base):
     type: Mapped[LogType]
 
     # Maps to JSONB
-    content: Mapped[dict[str, Any]]
\ No newline at end of file
+    content: Mapped[dict[str, Any]]
+
+    # The entity the log is about, taken from its id in content when the log is inserted.
+    # None for logs that aren't about one entity.
+    entity_type: Mapped[Optional[EntityType]]
+    entity_id: Mapped[Optional[UUID]] = mapped_column(DB_UUID(as_uuid=True))
+
+
+# An entity's history, newest first
+Index(
+    "ix_audit_logs_entity",
+    AuditLog.entity_type,
+    AuditLog.entity_id,
+    AuditLog.time_created.desc(),
+)
+
+# Browsing /auditlogs, newest first, by any of its filters. See `api.audit_logs`.
+Index("ix_audit_logs_time_created", AuditLog.time_created, AuditLog.id)
+Index("ix_audit_logs_type", AuditLog.type, AuditLog.time_created, AuditLog.id)
+
+# The RCSID of the user who acted. Written with a literal key, not a bound parameter,
+# so queries match the index expression in generic plans too.
+actor_rcsid = AuditLog.content.op("->>", return_type=String)(
+    literal_column("'user_rcsid'")
+)
+Index("ix_audit_logs_user_rcsid", actor_rcsid, AuditLog.time_created)
+
+
+@event.listens_for(AuditLog, "before_insert")
+def _set_entity(mapper, connection, audit_log: AuditLog):
+    if audit_log.entity_type is not None:
+        return
+    for key, entity_type in ENTITY_ID_KEYS.items():
+        if audit_log.content.get(key) is not None:
+            audit_log.entity_type = entity_type
+            audit_log.entity_id = UUID(str(audit_log.content[key]))
+            return
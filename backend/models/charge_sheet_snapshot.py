@@ -0,0 +1,70 @@
+from datetime import datetime
+from decimal import Decimal
+from .base import Base
+
+from uuid import UUID
+
+from sqlalchemy import (
+    DECIMAL,
+    UUID as DB_UUID,
+    DateTime,
+    ForeignKey,
+    Index,
+    String,
+    func,
+)
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class ChargeSheetSnapshot(Base):
+    """The frozen charge sheet of a semester that is no longer active.
+
+    Made when the active semester moves away from it, dropped when it becomes
+    active again or a balance in it changes. See `api.charge_sheets`.
+    """
+
+    __tablename__ = "charge_sheet_snapshots"
+
+    semester_id: Mapped[UUID] = mapped_column(
+        DB_UUID(as_uuid=True),
+        ForeignKey("semesters.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    time_created: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+
+    # SHA-256 of the rows, hex encoded. Only changes if the charges do.
+    content_hash: Mapped[str] = mapped_column(String(64))
+    row_count: Mapped[int]
+
+
+class ChargeSheetSnapshotRow(Base):
+    """A user's charges in a frozen charge sheet, as they were when it was made."""
+
+    __tablename__ = "charge_sheet_snapshot_rows"
+    __table_args__ = (
+        # Charge sheet order
+        Index(
+            "ix_charge_sheet_snapshot_rows_order",
+            "semester_id",
+            "is_graduating",
+            "last_name",
+            "first_name",
+            "RIN",
+        ),
+    )
+
+    semester_id: Mapped[UUID] = mapped_column(
+        DB_UUID(as_uuid=True),
+        ForeignKey("charge_sheet_snapshots.semester_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    user_id: Mapped[UUID] = mapped_column(DB_UUID(as_uuid=True), primary_key=True)
+
+    RIN: Mapped[str] = mapped_column(String(9))
+    first_name: Mapped[str] = mapped_column(String(64))
+    last_name: Mapped[str] = mapped_column(String(64))
+    is_graduating: Mapped[bool]
+    balance: Mapped[Decimal] = mapped_column(DECIMAL(precision=12, scale=5))
@@ -1,5 +1,5 @@
 from decimal import Decimal
-from sqlalchemy import DECIMAL, DateTime, ForeignKey, func
+from sqlalchemy import DECIMAL, DateTime, ForeignKey, Index, func
 from .base import Base
 
 from datetime import datetime
@@ -18,6 +18,13 @@ if TYPE_CHECKING:
 
 class MachineUsage(Base):
     __tablename__ = "machine_usages"
+    __table_args__ = (
+        # A user's usages, newest first, see `api.pagination`
+        Index("ix_machine_usages_user_time_started", "user_id", "time_started", "id"),
+        # A semester's usages, by user. Also serves lookups of one user in one semester.
+        Index("ix_machine_usages_semester_user", "semester_id", "user_id"),
+        Index("ix_machine_usages_machine", "machine_id"),
+    )
 
     id: Mapped[UUID] = mapped_column(
         DB_UUID(as_uuid=True), primary_key=True, default=uuid4
@@ -28,10 +35,15 @@ class MachineUsage(Base):
         back_populates="active_usage", foreign_keys=[machine_id]
     )
 
-    semester_id: Mapped[Optional[UUID]] = mapped_column(ForeignKey("semesters.id"))
+    # Old values of semester_id, user_id and cost are always loaded on change, the balance ledger needs them
+    semester_id: Mapped[Optional[UUID]] = mapped_column(
+        ForeignKey("semesters.id"), active_history=True
+    )
     semester: Mapped[Optional["Semester"]] = relationship()
 
-    user_id: Mapped[UUID] = mapped_column(ForeignKey("users.id", name="fk_used_by"))
+    user_id: Mapped[UUID] = mapped_column(
+        ForeignKey("users.id", name="fk_used_by"), active_history=True
+    )
     user: Mapped["User"] = relationship(foreign_keys=[user_id])
 
     time_started: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -41,7 +53,9 @@ class MachineUsage(Base):
     failed: Mapped[bool] = mapped_column(default=False)
     failed_at: Mapped[Optional[datetime]]
 
-    cost: Mapped[Decimal] = mapped_column(DECIMAL(precision=10, scale=5))
+    cost: Mapped[Decimal] = mapped_column(
+        DECIMAL(precision=10, scale=5), active_history=True
+    )
 
     resources_used: Mapped[list["ResourceUsageQuantity"]] = relationship(
         back_populates="machine_usage", cascade="all, delete"
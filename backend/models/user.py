@@ -1,5 +1,5 @@
 from typing import TYPE_CHECKING
-from sqlalchemy import String
+from sqlalchemy import DDL, Index, String, event
 from .base import Base
 
 from sqlalchemy import UUID as DB_UUID
@@ -16,6 +16,23 @@ if TYPE_CHECKING:
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset pagination of user lists, see `api.pagination`
+        Index("ix_users_last_name_id", "last_name", "id"),
+        Index("ix_users_first_name_id", "first_name", "id"),
+        # Partial matches in /users/search. Trigram indexes need the pg_trgm extension,
+        # created with the table below.
+        *(
+            Index(
+                f"ix_users_{column.lower()}_trgm",
+                column,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+            for column in ("RCSID", "first_name", "last_name")
+        ),
+        # RIN prefixes are indexed below, the expression needs the column
+    )
 
     # Unique table identifier for the user
     id: Mapped[UUID] = mapped_column(
@@ -56,7 +73,20 @@ class User(Base):
     # Is this user graduating in this semester? Determines which charge sheet they are added to.
     is_graduating: Mapped[bool]
 
+    # Bumped whenever the user's effective permissions may have changed (roles assigned,
+    # removed or edited). Tokens carrying permission claims from an older epoch are ignored.
+    permission_epoch: Mapped[int] = mapped_column(default=0, server_default="0")
+
     # Organizations that the user is a member of (can charge usages to the organization)
     orgs: Mapped[list["Org"]] = relationship(
         secondary="user_org_memberships", back_populates="members"
     )
+
+
+event.listen(
+    User.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+
+# RIN prefixes, in byte order. Serves both the range and the ordering of a prefix search,
+# unlike the unique index on RIN, which uses the database's collation.
+Index("ix_users_rin_prefix", User.RIN.collate("C"))
@@ -0,0 +1,37 @@
+from decimal import Decimal
+from .base import Base
+
+from uuid import UUID
+
+from sqlalchemy import DECIMAL, ForeignKey, Index, UUID as DB_UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class UserSemesterBalance(Base):
+    """Running total of a user's machine usages in a semester.
+
+    Maintained by `api.balances` whenever a usage is flushed, never written by
+    routes directly. `rebuild_balances.py` recomputes it from `machine_usages`.
+    """
+
+    __tablename__ = "user_semester_balances"
+    __table_args__ = (
+        # Sorting users by their balance in a semester
+        Index("ix_user_semester_balances_semester_balance", "semester_id", "balance"),
+    )
+
+    user_id: Mapped[UUID] = mapped_column(
+        DB_UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    semester_id: Mapped[UUID] = mapped_column(
+        DB_UUID(as_uuid=True),
+        ForeignKey("semesters.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    # Sum of the costs of the user's usages in the semester
+    balance: Mapped[Decimal] = mapped_column(DECIMAL(precision=12, scale=5), default=0)
+    # Number of usages summed into balance, users with none aren't charged
+    usage_count: Mapped[int] = mapped_column(default=0)
@@ -0,0 +1,43 @@
+"""
+Check or rebuild the user_semester_balances ledger against machine_usages.
+
+    python rebuild_balances.py --verify   # report differences, exit 1 if any
+    python rebuild_balances.py            # recompute the ledger from scratch
+"""
+
+import argparse
+import asyncio
+import sys
+
+from api.balances import find_balance_differences, rebuild_balances
+from core.session import async_session
+
+
+async def main(verify: bool) -> int:
+    async with async_session() as session:
+        differences = await find_balance_differences(session)
+        for row in differences:
+            print(
+                f"user {row.user_id} semester {row.semester_id}:"
+                f" ledger {row.ledger_balance} ({row.ledger_usage_count} usages),"
+                f" computed {row.computed_balance} ({row.computed_usage_count} usages)"
+            )
+        print(f"{len(differences)} balances differ")
+        if verify:
+            return 1 if differences else 0
+
+        rows = await rebuild_balances(session)
+        await session.commit()
+        print(f"Ledger rebuilt, {rows} balances")
+        return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="only compare the ledger with machine_usages, don't change it",
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.verify)))
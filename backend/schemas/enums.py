@@ -113,6 +113,9 @@ class Permissions(StrEnum):
 
     CAN_VIEW_FAILURE_LOGS = "canViewFailureLogs"
 
+    # For browsing and exporting the whole audit log
+    CAN_SEE_AUDIT_LOGS = "canSeeAuditLogs"
+
     # For user role management
     CAN_SEE_ROLES = "canSeeRoles"
     CAN_CREATE_ROLES = "canCreateRoles"
@@ -195,6 +198,20 @@ class LogType(StrEnum):
     ORG_DELETED = "org_deleted"
 
 
+# What an audit log is about. See `models.audit_log.ENTITY_ID_KEYS`.
+class EntityType(StrEnum):
+    MACHINE = "machine"
+    MACHINE_TYPE = "machine_type"
+    MACHINE_GROUP = "machine_group"
+    MACHINE_USAGE = "machine_usage"
+    RESOURCE = "resource"
+    RESOURCE_SLOT = "resource_slot"
+    ROLE = "role"
+    SEMESTER = "semester"
+    USER = "user"
+    ORG = "org"
+
+
 # Used to indicate no particular permission is required to access
 # an endpoint. Lockout is still checked.
 PERMISSIONS_NONE: Set[Permissions] = set()
@@ -1,5 +1,5 @@
 from decimal import Decimal
-from typing import Annotated, List, Optional
+from typing import Annotated, List, Literal, Optional
 from pydantic import UUID4, AfterValidator, BaseModel, EmailStr, Field, SecretStr, BeforeValidator
 
 from .enums import GenderStatsType, Permissions, PronounType, SemesterType
@@ -203,6 +203,12 @@ class UserDeleteRequest(BaseRequest):
 
 class GetChargeSheetsRequest(BaseRequest):
     semester_id: UUID4
+    # json returns the charges in the response body, csv and xlsx as a download
+    format: Literal["json", "csv", "xlsx"] = "json"
+    # Added to the usages charge of everyone in an export
+    membership_charge: Decimal = Field(default=Decimal(0), ge=0, max_digits=10, decimal_places=2)
+    # Only include graduating (True) or non-graduating (False) users
+    graduating: Optional[bool] = None
 
 
 class SemesterCreateRequest(BaseRequest):
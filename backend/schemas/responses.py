@@ -1,6 +1,6 @@
 from datetime import datetime
 from decimal import Decimal
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, Generic, Optional, TypeVar
 from pydantic import BaseModel, ConfigDict, UUID4, Field
 
 from .enums import GenderStatsType, LogType, PronounType, SemesterType
@@ -10,6 +10,17 @@ class BaseResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+T = TypeVar("T")
+
+
+class CursorPage(BaseModel, Generic[T]):
+    """A page of a list endpoint in cursor mode, see `api.pagination`."""
+
+    items: list[T]
+    # Pass as `cursor` to get the next page, None on the last page
+    next_cursor: Optional[str]
+
+
 class AuditLogModel(BaseResponse):
     id: UUID4
     time_created: datetime
@@ -66,7 +77,7 @@ class UserNoHash(BaseModel):
 
 class MachineStatus(BaseResponse):
     id: UUID4
-    group_id: UUID4
+    group_id: Optional[UUID4] = None
     type_id: UUID4
     name: str
     in_use: bool
@@ -98,6 +109,8 @@ class MachineInfoGroup(BaseModel):
 
 class MachineInfoGroupDetails(MachineInfoGroup):
     audit_logs: list[AuditLogModel]
+    # Cursor of older logs for /auditlogs, see `api.audit_logs`
+    audit_logs_cursor: Optional[str]
 
 
 class ResourceInfo(BaseModel):
@@ -111,6 +124,8 @@ class ResourceInfo(BaseModel):
 
 class ResourceDetails(ResourceInfo):
     audit_logs: list[AuditLogModel]
+    # Cursor of older logs for /auditlogs, see `api.audit_logs`
+    audit_logs_cursor: Optional[str]
 
 
 class SemesterInfo(BaseModel):
@@ -121,6 +136,8 @@ class SemesterInfo(BaseModel):
 
 class SemesterDetails(SemesterInfo):
     audit_logs: list[AuditLogModel]
+    # Cursor of older logs for /auditlogs, see `api.audit_logs`
+    audit_logs_cursor: Optional[str]
 
 
 class ResourceSlotInfo(BaseModel):
@@ -135,6 +152,8 @@ class ResourceSlotInfo(BaseModel):
 
 class ResourceSlotDetails(ResourceSlotInfo):
     audit_logs: list[AuditLogModel]
+    # Cursor of older logs for /auditlogs, see `api.audit_logs`
+    audit_logs_cursor: Optional[str]
 
 
 class MachineTypeInfo(BaseModel):
@@ -149,6 +168,8 @@ class MachineTypeInfo(BaseModel):
 
 class MachineTypeDetails(MachineTypeInfo):
     audit_logs: list[AuditLogModel]
+    # Cursor of older logs for /auditlogs, see `api.audit_logs`
+    audit_logs_cursor: Optional[str]
 
 
 class MachineCreateResponse(BaseResponse):
@@ -179,6 +200,27 @@ class MachineUsageSchema(BaseResponse):
 
     maintenance_mode: bool
 
+
+class UsageQuoteLine(BaseResponse):
+    resource_slot_id: UUID4
+    resource_id: UUID4
+    resource_name: str
+    units: str
+    amount: Decimal
+    is_own_material: bool
+    unit_cost: Decimal
+    cost: Decimal
+
+
+class UsageQuoteResponse(BaseResponse):
+    machine_id: UUID4
+    duration_seconds: int
+    # Time on the machine, rounded to the cent
+    machine_cost: Decimal
+    resources: list[UsageQuoteLine]
+    total_cost: Decimal
+
+
 class UsageResponse(BaseResponse):
     semester: str | None
     time_started: datetime
@@ -201,3 +243,5 @@ class MachineInfo(BaseModel):
 
 class MachineDetails(MachineInfo):
     audit_logs: list[AuditLogModel]
+    # Cursor of older logs for /auditlogs, see `api.audit_logs`
+    audit_logs_cursor: Optional[str]
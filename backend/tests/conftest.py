@@ -11,9 +11,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from core import config, security
+from core.invalidation import invalidate_all
 from core.session import async_engine, async_session
 from main import app
-from models import Base, Role, User
+from models import Base, Machine, MachineGroup, MachineType, Role, User
 from schemas.enums import GenderStatsType, Permissions, PronounType
 
 default_user_password = "welcometothefroge"
@@ -60,6 +61,8 @@ async def session(test_db_setup_sessionmaker) -> AsyncGenerator[AsyncSession, No
         for name, table in Base.metadata.tables.items():
             await session.execute(delete(table))
         await session.commit()
+        # Bulk deletes skip the ORM, so nothing noticed the caches went stale
+        invalidate_all()
 
 
 @pytest_asyncio.fixture(scope="session")
@@ -118,27 +121,66 @@ async def default_superuser(default_user: User, session: AsyncSession) -> User:
 
 
 @pytest_asyncio.fixture
-async def default_user_with_use_machine(default_user) -> User:
-    async with async_session() as session:
-        role = Role(name="test", permissions={Permissions.CAN_USE_MACHINES})
-        session.add(role)
-        session.add(default_user)
-        default_user.roles = [role]
-        await session.commit()
-        return default_user
+async def default_user_with_use_machine(
+    default_user: User, session: AsyncSession
+) -> User:
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    role = Role(
+        name="test",
+        permissions={Permissions.CAN_USE_MACHINES},
+        inverse_permissions=set(),
+        display_role=False,
+        priority=1,
+    )
+    session.add(role)
+    user.roles = [role]
+    await session.commit()
+    return default_user
 
 
 @pytest_asyncio.fixture
-async def default_user_with_clear_machine(default_user) -> User:
-    async with async_session() as session:
-        role = Role(name="test", permissions={Permissions.CAN_CLEAR_MACHINES})
-        session.add(role)
-        session.add(default_user)
-        default_user.roles = [role]
-        await session.commit()
-        return default_user
+async def default_user_with_clear_machine(
+    default_user: User, session: AsyncSession
+) -> User:
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    role = Role(
+        name="test",
+        permissions={Permissions.CAN_CLEAR_MACHINES},
+        inverse_permissions=set(),
+        display_role=False,
+        priority=1,
+    )
+    session.add(role)
+    user.roles = [role]
+    await session.commit()
+    return default_user
 
 
 @pytest.fixture
 def default_user_headers(default_user: User):
     return {"Authorization": f"Bearer {default_user_access_token}"}
+
+
+@pytest_asyncio.fixture
+async def default_machine(test_db_setup_sessionmaker) -> Machine:
+    async with async_session() as session:
+        machine = Machine(
+            name="Prusa 1",
+            type=MachineType(name="Prusa MK4", cost_per_hour=0),
+            group=MachineGroup(name="Prusas"),
+        )
+        session.add(machine)
+        await session.commit()
+        return machine
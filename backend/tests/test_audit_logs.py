@@ -0,0 +1,119 @@
+import json
+
+from httpx import AsyncClient, codes
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from main import app
+from models import AuditLog, Machine, Role, User
+from schemas.enums import LogType, Permissions
+
+
+async def test_browse_audit_logs(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_superuser: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    session.add_all(
+        AuditLog(
+            type=LogType.MACHINE_EDITED if index % 5 else LogType.MACHINE_USAGE_FAILED,
+            content={"machine_id": str(default_machine.id), "user_rcsid": "haddlg"},
+        )
+        for index in range(25)
+    )
+    await session.commit()
+
+    response = await client.get(
+        app.url_path_for("get_audit_logs"),
+        headers=default_user_headers,
+        params={"format": "ndjson"},
+    )
+    assert response.status_code == codes.OK
+    exported = [json.loads(line)["id"] for line in response.text.splitlines()]
+    assert len(exported) == 25
+
+    ids, cursor = [], None
+    while True:
+        response = await client.get(
+            app.url_path_for("get_audit_logs"),
+            headers=default_user_headers,
+            params={"limit": 10, **({"cursor": cursor} if cursor else {})},
+        )
+        assert response.status_code == codes.OK
+        ids += [log["id"] for log in response.json()["items"]]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == exported
+
+    response = await client.get(
+        app.url_path_for("get_audit_logs"),
+        headers=default_user_headers,
+        params={"types": LogType.MACHINE_USAGE_FAILED, "user_rcsid": "haddlg"},
+    )
+    assert len(response.json()["items"]) == 5
+
+    # Detail responses embed the latest logs, /auditlogs has the rest
+    response = await client.get(
+        app.url_path_for("get_machine", machine_id=default_machine.id),
+        headers=default_user_headers,
+    )
+    machine = response.json()
+    assert [log["id"] for log in machine["audit_logs"]] == exported[:20]
+    response = await client.get(
+        app.url_path_for("get_audit_logs"),
+        headers=default_user_headers,
+        params={
+            "entity_type": "machine",
+            "entity_id": str(default_machine.id),
+            "cursor": machine["audit_logs_cursor"],
+        },
+    )
+    assert [log["id"] for log in response.json()["items"]] == exported[20:]
+
+
+async def test_failure_logs_only(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_user: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    role = Role(
+        name="Mentor",
+        permissions=[Permissions.CAN_VIEW_FAILURE_LOGS],
+        inverse_permissions=[],
+        display_role=False,
+        priority=1,
+    )
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    user.roles = [role]
+    session.add_all(
+        AuditLog(type=log_type, content={"machine_id": str(default_machine.id)})
+        for log_type in (LogType.MACHINE_EDITED, LogType.MACHINE_USAGE_FAILED)
+    )
+    await session.commit()
+
+    response = await client.get(
+        app.url_path_for("get_audit_logs"), headers=default_user_headers
+    )
+    assert response.status_code == codes.OK
+    assert [log["type"] for log in response.json()["items"]] == [
+        LogType.MACHINE_USAGE_FAILED
+    ]
+
+    response = await client.get(
+        app.url_path_for("get_audit_logs"),
+        headers=default_user_headers,
+        params={"types": LogType.MACHINE_EDITED},
+    )
+    assert response.status_code == codes.FORBIDDEN
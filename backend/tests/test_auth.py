@@ -1,7 +1,12 @@
 from httpx import AsyncClient, codes
 
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from core.config import settings
 from main import app
-from models import User
+from models import Role, User
+from schemas.enums import Permissions
 from tests.conftest import default_user_object, default_user_password
 
 from freezegun import freeze_time
@@ -78,3 +83,54 @@ async def test_auth_access_token_fail_wrong_password(
 
     assert response.status_code == codes.BAD_REQUEST
     assert response.json() == {"detail": "Incorrect email or password"}
+
+
+async def test_auth_password_pool_full(
+    client: AsyncClient, default_user: User, monkeypatch
+):
+    # No workers and no queue, so every password check is refused
+    monkeypatch.setattr(settings, "PASSWORD_HASH_WORKERS", 0)
+    monkeypatch.setattr(settings, "PASSWORD_HASH_QUEUE_SIZE", 0)
+
+    response = await client.post(
+        app.url_path_for("login_user"),
+        data={
+            "username": default_user_object.RCSID,
+            "password": default_user_password,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert response.status_code == codes.SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == str(
+        settings.PASSWORD_HASH_RETRY_AFTER_SECONDS
+    )
+
+
+async def test_read_current_user_twice(
+    client: AsyncClient, default_user: User, default_user_headers, session
+):
+    # The second call gets permissions from the cache, roles must still be loaded
+    role = Role(
+        name="Volunteer",
+        permissions=[Permissions.CAN_USE_MACHINES],
+        inverse_permissions=[],
+        display_role=True,
+        priority=1,
+    )
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    user.roles = [role]
+    await session.commit()
+
+    for _ in range(2):
+        response = await client.get(
+            app.url_path_for("get_current_user"), headers=default_user_headers
+        )
+        assert response.status_code == codes.OK
+        assert response.json()["display_role"] == "Volunteer"
+        assert response.json()["permissions"] == [Permissions.CAN_USE_MACHINES]
@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.balances import (
+    find_balance_differences,
+    get_semester_balance,
+    rebuild_balances,
+)
+from models import Machine, MachineUsage, Semester, User, UserSemesterBalance
+from schemas.enums import SemesterType
+
+
+async def test_ledger_follows_usage_changes(
+    default_machine: Machine, default_user: User, session: AsyncSession
+):
+    fall = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    spring = Semester(semester_type=SemesterType.SPRING, calendar_year=2027)
+    usages = [
+        MachineUsage(
+            machine_id=default_machine.id,
+            user_id=default_user.id,
+            semester=fall,
+            duration_seconds=600,
+            cost=Decimal(cost),
+        )
+        for cost in ("1.50000", "2.25000", "0.00000")
+    ]
+    session.add_all([spring, *usages])
+    await session.commit()
+
+    assert await get_semester_balance(session, default_user.id, fall.id) == Decimal(
+        "3.75"
+    )
+    assert await get_semester_balance(session, default_user.id, spring.id) == 0
+
+    usages[0].cost = Decimal("4.00000")
+    usages[1].semester = spring
+    await session.delete(usages[2])
+    await session.commit()
+
+    balances = {
+        row.semester_id: row
+        for row in await session.scalars(select(UserSemesterBalance))
+    }
+    assert balances[fall.id].balance == Decimal(4)
+    assert balances[fall.id].usage_count == 1
+    assert balances[spring.id].balance == Decimal("2.25")
+    assert balances[spring.id].usage_count == 1
+    assert await find_balance_differences(session) == []
+
+
+async def test_rebuild_fixes_bulk_changes(
+    default_machine: Machine, default_user: User, session: AsyncSession
+):
+    fall = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    session.add(
+        MachineUsage(
+            machine_id=default_machine.id,
+            user_id=default_user.id,
+            semester=fall,
+            duration_seconds=600,
+            cost=Decimal(1),
+        )
+    )
+    await session.commit()
+
+    # Skips the ORM, so the ledger doesn't see it
+    await session.execute(update(MachineUsage).values(cost=Decimal(5)))
+    await session.commit()
+
+    [difference] = await find_balance_differences(session)
+    assert difference.ledger_balance == Decimal(1)
+    assert difference.computed_balance == Decimal(5)
+
+    assert await rebuild_balances(session) == 1
+    await session.commit()
+    assert await find_balance_differences(session) == []
+    assert await get_semester_balance(session, default_user.id, fall.id) == Decimal(5)
@@ -0,0 +1,247 @@
+import asyncio
+import csv
+import io
+import zipfile
+from decimal import Decimal
+
+from httpx import AsyncClient, Response, codes
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.charge_sheets import freeze_charge_sheet
+from api.utils import get_active_semester_id
+from core.session import async_session
+from main import app
+from models import (
+    ChargeSheetSnapshot,
+    Machine,
+    MachineUsage,
+    Semester,
+    State,
+    User,
+    UserSemesterBalance,
+)
+from schemas.enums import GenderStatsType, PronounType, SemesterType
+
+
+async def test_charge_sheet_exports(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_superuser: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    semester = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    # default_superuser belongs to another session
+    superuser = await session.get(User, default_superuser.id)
+    graduating_user = User(
+        RCSID="smithj",
+        RIN="123456789",
+        first_name="Jane",
+        last_name="Smith",
+        major="Mechanical Engineering",
+        gender_identity=GenderStatsType.FEMALE,
+        pronouns=PronounType.SHE_HER,
+        hashed_password="",
+        is_graduating=True,
+        is_rpi_staff=False,
+    )
+    session.add_all(
+        [
+            MachineUsage(
+                machine_id=default_machine.id,
+                user=user,
+                semester=semester,
+                duration_seconds=600,
+                cost=Decimal(cost),
+            )
+            for user, cost in (
+                (superuser, "1.25000"),
+                (superuser, "0.50000"),
+                (graduating_user, "3.00000"),
+            )
+        ]
+    )
+    await session.commit()
+
+    async def export(**request) -> bytes:
+        response = await client.post(
+            app.url_path_for("get_charge_sheet"),
+            headers=default_user_headers,
+            json={"semester_id": str(semester.id), **request},
+        )
+        assert response.status_code == codes.OK
+        return response.content
+
+    rows = list(
+        csv.DictReader(
+            io.StringIO((await export(format="csv", membership_charge="10")).decode())
+        )
+    )
+    assert [
+        (row["RIN"], row["Usages Charge"], row["Total Charge"], row["Is Graduating"])
+        for row in rows
+    ] == [
+        (default_superuser.RIN, "1.75", "11.75", "False"),
+        (graduating_user.RIN, "3.00", "13.00", "True"),
+    ]
+
+    rows = list(
+        csv.DictReader(
+            io.StringIO((await export(format="csv", graduating=True)).decode())
+        )
+    )
+    assert [row["RIN"] for row in rows] == [graduating_user.RIN]
+
+    workbook = zipfile.ZipFile(io.BytesIO(await export(format="xlsx")))
+    assert b'name="Not Graduating"' in workbook.read("xl/workbook.xml")
+    assert b'name="Graduating"' in workbook.read("xl/workbook.xml")
+    assert default_superuser.RIN.encode() in workbook.read("xl/worksheets/sheet1.xml")
+    assert graduating_user.RIN.encode() in workbook.read("xl/worksheets/sheet2.xml")
+
+
+async def test_closed_semesters_are_frozen(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_superuser: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    semester = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    usage = MachineUsage(
+        machine_id=default_machine.id,
+        user_id=default_superuser.id,
+        semester=semester,
+        duration_seconds=600,
+        cost=Decimal(2),
+    )
+    session.add_all([State(active_semester=semester), usage])
+    await session.commit()
+
+    async def get_charges() -> Response:
+        response = await client.post(
+            app.url_path_for("get_charge_sheet"),
+            headers=default_user_headers,
+            json={"semester_id": str(semester.id)},
+        )
+        assert response.status_code == codes.OK
+        return response
+
+    # Still open, nothing to freeze
+    assert "ETag" not in (await get_charges()).headers
+
+    response = await client.post(
+        app.url_path_for("advance_semester"), headers=default_user_headers
+    )
+    assert response.status_code == codes.OK
+    # Frozen once requested
+    assert await session.get(ChargeSheetSnapshot, semester.id) is None
+
+    response = await get_charges()
+    snapshot = await session.get(ChargeSheetSnapshot, semester.id)
+    assert snapshot.row_count == 1
+    etag = response.headers["ETag"]
+    assert etag.startswith(f'"{snapshot.content_hash}-')
+    assert Decimal(response.json()[0]["semester_balance"]) == 2
+
+    # Unchanged since the last request
+    response = await client.post(
+        app.url_path_for("get_charge_sheet"),
+        headers={**default_user_headers, "If-None-Match": etag},
+        json={"semester_id": str(semester.id)},
+    )
+    assert response.status_code == codes.NOT_MODIFIED
+    # Another format of the same rows is another body
+    response = await client.post(
+        app.url_path_for("get_charge_sheet"),
+        headers={**default_user_headers, "If-None-Match": etag},
+        json={"semester_id": str(semester.id), "format": "csv"},
+    )
+    assert response.status_code == codes.OK
+
+    # Editing a usage of the closed semester drops its snapshot
+    usage.cost = Decimal(3)
+    await session.commit()
+    session.expunge_all()
+    assert await session.get(ChargeSheetSnapshot, semester.id) is None
+
+    response = await get_charges()
+    assert response.headers["ETag"] != etag
+    assert Decimal(response.json()[0]["semester_balance"]) == 3
+
+    # Active again, charges may change
+    response = await client.post(
+        app.url_path_for("set_semester"),
+        headers=default_user_headers,
+        json={"semester_id": str(semester.id)},
+    )
+    assert response.status_code == codes.OK
+    assert await session.get(ChargeSheetSnapshot, semester.id) is None
+
+
+async def test_freeze_waits_for_usage_writes(
+    default_machine: Machine, default_superuser: User, session: AsyncSession
+):
+    semester = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    session.add(semester)
+    await session.commit()
+
+    async with async_session() as writer, async_session() as freezer:
+        # A usage written but not yet committed when the semester is closed
+        writer.add(
+            MachineUsage(
+                machine_id=default_machine.id,
+                user_id=default_superuser.id,
+                semester_id=semester.id,
+                duration_seconds=600,
+                cost=Decimal(2),
+            )
+        )
+        await writer.flush()
+
+        freeze = asyncio.create_task(freeze_charge_sheet(freezer, semester.id))
+        await asyncio.sleep(0.2)
+        assert not freeze.done()
+
+        await writer.commit()
+        await freeze
+        await freezer.commit()
+
+    snapshot = await session.get(ChargeSheetSnapshot, semester.id)
+    assert snapshot.row_count == 1
+
+
+async def test_freeze_waits_for_active_semester_usage_writes(
+    default_machine: Machine, default_superuser: User, session: AsyncSession
+):
+    semester = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    session.add_all([semester, State(active_semester=semester)])
+    await session.commit()
+
+    async with async_session() as writer, async_session() as freezer:
+        # The writer still takes the semester for the active one, and skips its lock
+        assert await get_active_semester_id(writer) == semester.id
+        for cost in (2, 3):
+            writer.add(
+                MachineUsage(
+                    machine_id=default_machine.id,
+                    user_id=default_superuser.id,
+                    semester_id=semester.id,
+                    duration_seconds=600,
+                    cost=Decimal(cost),
+                )
+            )
+            await writer.flush()
+
+            freeze = asyncio.create_task(freeze_charge_sheet(freezer, semester.id))
+            await asyncio.sleep(0.2)
+            assert not freeze.done()
+
+            await writer.commit()
+            await freeze
+            # Dropped again by the next usage, which updates the balance
+            await freezer.rollback()
+
+    balance = await session.get(
+        UserSemesterBalance, (default_superuser.id, semester.id)
+    )
+    assert balance.balance == 5
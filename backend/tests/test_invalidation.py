@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+from contextlib import suppress
+from pathlib import Path
+from uuid import uuid4
+
+import httpx
+import pytest_asyncio
+from httpx import AsyncClient, codes
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.invalidation import (
+    INSTANCE_ID,
+    Topic,
+    apply_message,
+    encode_message,
+    topic_version,
+)
+from core.invalidation_listener import listen_for_invalidations
+from main import app
+from models import Machine, MachineUsage, User
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+
+async def wait_for(condition, timeout: float = 10):
+    async with asyncio.timeout(timeout):
+        while not await condition():
+            await asyncio.sleep(0.1)
+
+
+def test_own_messages_are_ignored():
+    version = topic_version(Topic.MACHINES)
+    apply_message(encode_message({Topic.MACHINES: None}))
+    assert topic_version(Topic.MACHINES) == version
+
+
+def test_foreign_messages_are_applied():
+    version = topic_version(Topic.PERMISSIONS)
+    message = json.loads(encode_message({Topic.PERMISSIONS: {uuid4()}}))
+    message["i"] = "another-instance"
+    apply_message(json.dumps(message))
+    assert topic_version(Topic.PERMISSIONS) == version + 1
+
+
+def test_oversized_messages_drop_keys():
+    message = json.loads(
+        encode_message({Topic.PERMISSIONS: {uuid4() for _ in range(1000)}})
+    )
+    assert message == {"i": INSTANCE_ID, "t": {"permissions": None}}
+
+
+@pytest_asyncio.fixture
+async def second_instance():
+    """Another copy of the app, running in its own process against the same database."""
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        # Only invalidations can refresh its status snapshot during the test
+        env={**os.environ, "MACHINE_STATUS_MAX_AGE_SECONDS": "3600"},
+    )
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+
+        async def is_up():
+            with suppress(httpx.TransportError):
+                return (await client.get("/docs")).status_code == 200
+            return False
+
+        try:
+            await wait_for(is_up, timeout=30)
+            yield client
+        finally:
+            process.terminate()
+            process.wait()
+
+
+async def test_invalidations_reach_other_instances(
+    second_instance: httpx.AsyncClient,
+    default_machine: Machine,
+    session: AsyncSession,
+):
+    version = topic_version(Topic.USERS)
+    listener = asyncio.create_task(listen_for_invalidations())
+    try:
+        # Caches are flushed once the listener is connected
+        async def listener_connected():
+            return topic_version(Topic.USERS) > version
+
+        await wait_for(listener_connected)
+
+        response = await second_instance.get("/machinestatus")
+        assert response.json()["groups"][0]["machines"][0]["maintenance_mode"] is False
+
+        # Committed here, so only NOTIFY can tell the other instance
+        machine = await session.scalar(
+            select(Machine).where(Machine.id == default_machine.id)
+        )
+        machine.maintenance_mode = True
+        await session.commit()
+
+        async def other_instance_updated():
+            response = await second_instance.get("/machinestatus")
+            return response.json()["groups"][0]["machines"][0]["maintenance_mode"]
+
+        await wait_for(other_instance_updated)
+
+        # And the other way around, a signup there evicts user caches here
+        version = topic_version(Topic.USERS)
+        response = await second_instance.post(
+            "/signup",
+            json={
+                "RCSID": "obamab",
+                "RIN": "123456789",
+                "first_name": "Barack",
+                "last_name": "Obama",
+                "major": "Political Science",
+                "gender_identity": "male",
+                "pronouns": "he_him",
+                "password": "BarackObama",
+            },
+        )
+        assert response.status_code == 200
+
+        async def users_invalidated_here():
+            return topic_version(Topic.USERS) > version
+
+        await wait_for(users_invalidated_here)
+    finally:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+
+
+async def test_claims_keep_catalog_etags(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_superuser: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    url = app.url_path_for("get_all_machine_groups")
+    etag = (await client.get(url, headers=default_user_headers)).headers["ETag"]
+
+    machine = await session.get(Machine, default_machine.id)
+    machine.active_usage = MachineUsage(
+        machine_id=machine.id,
+        user_id=default_superuser.id,
+        duration_seconds=600,
+        cost=0,
+    )
+    await session.commit()
+
+    response = await client.get(
+        url, headers={**default_user_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == codes.NOT_MODIFIED
+    # Not without a token, though
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == codes.UNAUTHORIZED
+
+    machine.name = "Prusa 2"
+    await session.commit()
+    response = await client.get(
+        url, headers={**default_user_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == codes.OK
+    assert response.headers["ETag"] != etag
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+
+import pytest
+from httpx import AsyncClient, codes
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api import deps, status_stream
+from core.config import settings
+from core.session import async_engine
+from main import app
+from models import Machine, MachineUsage, User
+
+
+async def get_status(client: AsyncClient) -> dict:
+    response = await client.get(app.url_path_for("get_machines_status"))
+    assert response.status_code == codes.OK
+    return response.json()
+
+
+async def test_machine_status_snapshot_skips_queries(
+    client: AsyncClient, default_machine: Machine
+):
+    first = await get_status(client)
+
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        second = await get_status(client)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    assert statements == []
+    assert second == first
+
+
+async def test_machine_status_rebuilt_after_usage(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_user: User,
+    session: AsyncSession,
+):
+    status = await get_status(client)
+    assert status["groups"][0]["machines"][0]["in_use"] is False
+
+    machine = await session.scalar(
+        select(Machine).where(Machine.id == default_machine.id)
+    )
+    machine.active_usage = MachineUsage(
+        machine_id=machine.id, user_id=default_user.id, duration_seconds=60, cost=0
+    )
+    await session.commit()
+
+    status = await get_status(client)
+    machine_status = status["groups"][0]["machines"][0]
+    assert machine_status["in_use"] is True
+    assert machine_status["user_name"] == "Gwen H."
+
+    machine.active_usage = None
+    await session.commit()
+
+    status = await get_status(client)
+    assert status["groups"][0]["machines"][0]["in_use"] is False
+
+
+async def test_machine_status_ignores_rolled_back_changes(
+    client: AsyncClient, default_machine: Machine, session: AsyncSession
+):
+    await get_status(client)
+
+    machine = await session.scalar(
+        select(Machine).where(Machine.id == default_machine.id)
+    )
+    machine.maintenance_mode = True
+    await session.flush()
+    await session.rollback()
+
+    status = await get_status(client)
+    assert status["groups"][0]["machines"][0]["maintenance_mode"] is False
+
+
+def parse_event(event: bytes) -> tuple[str, str, dict]:
+    fields = dict(line.split(": ", 1) for line in event.decode().strip().split("\n"))
+    return fields["id"], fields["event"], json.loads(fields["data"])
+
+
+async def test_status_stream_sends_deltas(
+    default_machine: Machine, default_user: User, session: AsyncSession
+):
+    queue, first_events = await status_stream.open_subscription()
+    try:
+        snapshot_id, event, data = parse_event(first_events[-1])
+        assert event == "snapshot"
+        assert data["groups"][0]["machines"][0]["in_use"] is False
+
+        machine = await session.scalar(
+            select(Machine).where(Machine.id == default_machine.id)
+        )
+        machine.active_usage = MachineUsage(
+            machine_id=machine.id, user_id=default_user.id, duration_seconds=60, cost=0
+        )
+        await session.commit()
+
+        delta_id, event, data = parse_event(await asyncio.wait_for(queue.get(), 5))
+        assert event == "delta"
+        assert [status["id"] for status in data["machines"]] == [str(machine.id)]
+        assert data["machines"][0]["in_use"] is True
+    finally:
+        status_stream.close_subscription(queue)
+
+    # Resuming from the snapshot replays the delta instead of sending a new snapshot
+    queue, first_events = await status_stream.open_subscription(snapshot_id)
+    status_stream.close_subscription(queue)
+    assert [parse_event(event)[:2] for event in first_events[1:]] == [
+        (delta_id, "delta")
+    ]
+
+
+async def test_status_stream_drops_slow_subscribers(
+    default_machine: Machine, session: AsyncSession, monkeypatch
+):
+    monkeypatch.setattr(settings, "STATUS_STREAM_QUEUE_SIZE", 1)
+    queue, _ = await status_stream.open_subscription()
+
+    machine = await session.scalar(
+        select(Machine).where(Machine.id == default_machine.id)
+    )
+    for maintenance_mode in (True, False):
+        machine.maintenance_mode = maintenance_mode
+        await session.commit()
+        await status_stream.refresh()
+
+    assert queue not in status_stream._subscribers
+    assert await queue.get() == b""
+
+
+async def test_machine_status_etag(
+    client: AsyncClient, default_machine: Machine, session: AsyncSession
+):
+    response = await client.get(app.url_path_for("get_machines_status"))
+    etag = response.headers["ETag"]
+
+    response = await client.get(
+        app.url_path_for("get_machines_status"), headers={"If-None-Match": etag}
+    )
+    assert response.status_code == codes.NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+
+    machine = await session.scalar(
+        select(Machine).where(Machine.id == default_machine.id)
+    )
+    machine.maintenance_mode = True
+    await session.commit()
+
+    response = await client.get(
+        app.url_path_for("get_machines_status"), headers={"If-None-Match": etag}
+    )
+    assert response.status_code == codes.OK
+    assert response.headers["ETag"] != etag
+    assert response.json()["groups"][0]["machines"][0]["maintenance_mode"] is True
+
+
+async def test_machine_status_etag_expires(
+    client: AsyncClient, default_machine: Machine, monkeypatch: pytest.MonkeyPatch
+):
+    response = await client.get(app.url_path_for("get_machines_status"))
+    etag = response.headers["ETag"]
+
+    # No invalidation, but a missed one can't keep the tag valid past the max age
+    now = time.time()
+    monkeypatch.setattr(
+        deps.time,
+        "time",
+        lambda: now + settings.MACHINE_STATUS_MAX_AGE_SECONDS,
+    )
+    response = await client.get(
+        app.url_path_for("get_machines_status"), headers={"If-None-Match": etag}
+    )
+    assert response.status_code == codes.OK
+    assert response.headers["ETag"] != etag
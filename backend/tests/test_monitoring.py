@@ -0,0 +1,55 @@
+from httpx import AsyncClient, codes
+
+from main import app
+from core import metrics
+from core.invalidation import cache_lookups
+from core.monitoring import http_requests
+
+
+def test_render():
+    counter = metrics.Counter("test_render_requests", 'A "test" counter', ["path"])
+    counter.inc(2, path='/a"b')
+    histogram = metrics.Histogram(
+        "test_render_seconds", "A test histogram", buckets=(1,)
+    )
+    histogram.observe(0.5)
+    histogram.observe(3)
+
+    metrics.REGISTRY[counter.name] = counter
+    metrics.REGISTRY[histogram.name] = histogram
+    try:
+        lines = metrics.render().splitlines()
+    finally:
+        del metrics.REGISTRY[counter.name], metrics.REGISTRY[histogram.name]
+
+    assert "# TYPE test_render_requests counter" in lines
+    assert 'test_render_requests_total{path="/a\\"b"} 2.0' in lines
+    assert 'test_render_seconds_bucket{le="1"} 1.0' in lines
+    assert 'test_render_seconds_bucket{le="+Inf"} 2.0' in lines
+    assert "test_render_seconds_sum 3.5" in lines
+
+
+async def test_metrics_endpoint(client: AsyncClient):
+    response = await client.get(app.url_path_for("get_machines_status"))
+    assert response.status_code == codes.OK
+    assert http_requests.value(route="GET /machinestatus", status="200") >= 1
+    assert (
+        cache_lookups.value(cache="machine_status", result="hit")
+        + cache_lookups.value(cache="machine_status", result="miss")
+        >= 1
+    )
+
+    response = await client.get("/metrics")
+    assert response.status_code == codes.OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'forge_http_requests_total{route="GET /machinestatus",status="200"}'
+        in response.text
+    )
+    assert "forge_db_pool_checked_out" in response.text
+    assert "forge_password_hash_queue_depth" in response.text
+
+
+async def test_metrics_endpoint_is_internal(client: AsyncClient):
+    response = await client.get("/metrics", headers={"Host": "backend"})
+    assert response.status_code == codes.BAD_REQUEST
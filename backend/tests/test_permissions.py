@@ -0,0 +1,230 @@
+import pytest
+from httpx import AsyncClient, codes
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from api.utils import get_user_permissions
+from core import config, security
+from core.permissions import (
+    LOCKOUT_MASK,
+    PERMISSION_SCHEMA,
+    from_mask,
+    resolve_mask,
+    to_mask,
+)
+from core.session import async_engine
+from main import app
+from models import Role, User
+from schemas.enums import Permissions
+
+
+async def test_cached_permissions_skip_queries(
+    default_user: User, session: AsyncSession
+):
+    await get_user_permissions(session, default_user.id)
+
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        await get_user_permissions(session, default_user.id)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    assert statements == []
+
+
+async def test_role_assignment_evicts_cached_permissions(
+    default_user: User, session: AsyncSession
+):
+    assert await get_user_permissions(session, default_user.id) == set()
+
+    role = Role(
+        name="Member",
+        permissions=[Permissions.CAN_USE_MACHINES],
+        inverse_permissions=[],
+        display_role=False,
+        priority=1,
+    )
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    user.roles.append(role)
+    await session.commit()
+
+    assert await get_user_permissions(session, default_user.id) == {
+        Permissions.CAN_USE_MACHINES
+    }
+
+
+async def test_role_edit_evicts_cached_permissions(
+    default_user: User, session: AsyncSession
+):
+    role = Role(
+        name="Member",
+        permissions=[Permissions.CAN_USE_MACHINES],
+        inverse_permissions=[],
+        display_role=False,
+        priority=1,
+    )
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    user.roles.append(role)
+    await session.commit()
+    assert await get_user_permissions(session, default_user.id) == {
+        Permissions.CAN_USE_MACHINES
+    }
+
+    role.permissions = [Permissions.CAN_USE_MACHINES, Permissions.CAN_SEE_USERS]
+    await session.commit()
+
+    assert await get_user_permissions(session, default_user.id) == {
+        Permissions.CAN_USE_MACHINES,
+        Permissions.CAN_SEE_USERS,
+    }
+
+
+async def test_rolled_back_role_edit_keeps_cached_permissions(
+    default_user: User, session: AsyncSession
+):
+    role = Role(
+        name="Member",
+        permissions=[Permissions.CAN_USE_MACHINES],
+        inverse_permissions=[],
+        display_role=False,
+        priority=1,
+    )
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    user.roles.append(role)
+    await session.commit()
+    assert await get_user_permissions(session, default_user.id) == {
+        Permissions.CAN_USE_MACHINES
+    }
+
+    role.permissions = [Permissions.LOCKOUT]
+    await session.flush()
+    await session.rollback()
+
+    assert await get_user_permissions(session, default_user.id) == {
+        Permissions.CAN_USE_MACHINES
+    }
+
+
+async def test_higher_priority_role_wins_regardless_of_order():
+    member = Role(
+        name="Member",
+        permissions=[Permissions.CAN_USE_MACHINES],
+        inverse_permissions=[],
+        priority=1,
+    )
+    jail = Role(
+        name="Jail",
+        permissions=[Permissions.LOCKOUT],
+        inverse_permissions=[Permissions.CAN_USE_MACHINES],
+        priority=100,
+    )
+
+    for roles in ([member, jail], [jail, member]):
+        mask = resolve_mask(roles)
+        assert mask & LOCKOUT_MASK
+        assert from_mask(mask) == {Permissions.LOCKOUT}
+
+
+async def test_role_changes_bump_permission_epoch(
+    default_user: User, session: AsyncSession
+):
+    role = Role(
+        name="Member",
+        permissions=[Permissions.CAN_USE_MACHINES],
+        inverse_permissions=[],
+        display_role=False,
+        priority=1,
+    )
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    user.roles.append(role)
+    await session.commit()
+
+    role.priority = 2
+    await session.commit()
+
+    assert (
+        await session.scalar(
+            select(User.permission_epoch).where(User.id == default_user.id)
+        )
+    ) == 2
+
+
+async def test_stale_permission_claims_are_ignored(
+    client: AsyncClient,
+    default_user: User,
+    session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(config.settings, "JWT_PERMISSION_CLAIMS", True)
+
+    role = Role(
+        name="Semester Viewer",
+        permissions=[Permissions.CAN_SEE_SEMESTERS],
+        inverse_permissions=[],
+        display_role=False,
+        priority=1,
+    )
+    user = (
+        await session.scalars(
+            select(User)
+            .where(User.id == default_user.id)
+            .options(selectinload(User.roles))
+        )
+    ).one()
+    user.roles.append(role)
+    await session.commit()
+    await session.refresh(user)
+
+    token = security.create_jwt_token(
+        user.RCSID,
+        60,
+        security.PermissionClaims(
+            uid=user.id,
+            perms=to_mask({Permissions.CAN_SEE_SEMESTERS}),
+            epoch=user.permission_epoch,
+            perm_schema=PERMISSION_SCHEMA,
+        ),
+    )[0]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await client.get(app.url_path_for("get_all_semesters"), headers=headers)
+    assert response.status_code == codes.OK
+
+    role.permissions = [Permissions.LOCKOUT]
+    await session.commit()
+
+    response = await client.get(app.url_path_for("get_all_semesters"), headers=headers)
+    assert response.status_code == codes.FORBIDDEN
+    assert (
+        response.json()["detail"] == "User access has been disabled by an administrator"
+    )
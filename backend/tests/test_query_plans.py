@@ -0,0 +1,113 @@
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+from sqlalchemy import Select, func, insert, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Machine, MachineType, MachineUsage, Semester, User
+from schemas.enums import PronounType, SemesterType
+
+USERS = 1000
+MACHINES = 100
+SEMESTERS = 40
+USAGES = 50_000
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+async def _seq_scanned(session: AsyncSession, query: Select) -> set[str]:
+    """Tables a query reads with a sequential scan, when run on the current data."""
+
+    sql = query.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    explained = await session.scalar(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"))
+    # asyncpg hands json back undecoded
+    [plan] = json.loads(explained) if isinstance(explained, str) else explained
+    return {
+        node["Relation Name"]
+        for node in _plan_nodes(plan["Plan"])
+        if node["Node Type"] == "Seq Scan"
+    }
+
+
+async def test_hot_usage_queries_use_indexes(session: AsyncSession):
+    machine_type = MachineType(name="Prusa MK4", cost_per_hour=0)
+    machines = [
+        Machine(name=f"Prusa {index}", type=machine_type) for index in range(MACHINES)
+    ]
+    semesters = [
+        Semester(semester_type=SemesterType.FALL, calendar_year=2000 + index)
+        for index in range(SEMESTERS)
+    ]
+    session.add_all([*machines, *semesters])
+    user_ids = [uuid4() for _ in range(USERS)]
+    await session.execute(
+        insert(User),
+        [
+            {
+                "id": user_id,
+                "RCSID": f"user{index}",
+                "RIN": f"{index:09}",
+                "first_name": "Test",
+                "last_name": f"User {index}",
+                "major": "Undeclared",
+                "pronouns": PronounType.NOT_SHOWN,
+                "hashed_password": "",
+                "is_graduating": False,
+                "is_rpi_staff": False,
+            }
+            for index, user_id in enumerate(user_ids)
+        ],
+    )
+    await session.flush()
+
+    # Core inserts, the balance ledger isn't needed here
+    started = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    await session.execute(
+        insert(MachineUsage),
+        [
+            {
+                "machine_id": machines[index % MACHINES].id,
+                "semester_id": semesters[index % SEMESTERS].id,
+                "user_id": user_ids[index % USERS],
+                "time_started": started + timedelta(minutes=index),
+                "duration_seconds": 600,
+                "failed": False,
+                "cost": Decimal(1),
+            }
+            for index in range(USAGES)
+        ],
+    )
+    await session.commit()
+    await session.execute(text("ANALYZE"))
+
+    user_id, semester_id, machine_id = user_ids[0], semesters[0].id, machines[0].id
+    hot_queries = {
+        # /usages/me, see machine_usages.get_my_usages and api.pagination
+        "usages of a user": select(MachineUsage)
+        .where(MachineUsage.user_id == user_id)
+        .order_by(MachineUsage.time_started.desc(), MachineUsage.id.desc())
+        .limit(20),
+        # Balance of a user in a semester, see api.balances
+        "usages of a user in a semester": select(func.sum(MachineUsage.cost)).where(
+            MachineUsage.user_id == user_id, MachineUsage.semester_id == semester_id
+        ),
+        # semesters.delete_semester
+        "usages in a semester": select(func.count())
+        .select_from(MachineUsage)
+        .where(MachineUsage.semester_id == semester_id),
+        # machines.delete_machine
+        "usages of a machine": select(func.count())
+        .select_from(MachineUsage)
+        .where(MachineUsage.machine_id == machine_id),
+    }
+    for name, query in hot_queries.items():
+        assert "machine_usages" not in await _seq_scanned(session, query), name
@@ -0,0 +1,46 @@
+import logging
+
+import pytest
+from httpx import AsyncClient, codes
+
+from main import app
+from core import config
+from models import User
+from core.query_stats import normalize_sql, request_db_statements
+
+ROUTE = "GET /users"
+
+
+def test_normalize_sql():
+    assert (
+        normalize_sql(
+            'SELECT users.id\nFROM users\n  WHERE users."RCSID" = $1 '
+            "AND users.id IN ($2, $3, $4) AND users.balance > 10.5 AND users.major = 'CS'"
+        )
+        == 'SELECT users.id FROM users WHERE users."RCSID" = ? '
+        "AND users.id IN (?) AND users.balance > ? AND users.major = ?"
+    )
+
+
+async def test_request_reports_its_queries(
+    client: AsyncClient,
+    default_superuser: User,
+    default_user_headers,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+):
+    requests = request_db_statements.count(route=ROUTE)
+    monkeypatch.setattr(config.settings, "SLOW_QUERY_MILLISECONDS", 0.001)
+
+    with caplog.at_level(logging.WARNING, logger="core.query_stats.slow"):
+        response = await client.get(
+            app.url_path_for("get_all_users"), headers=default_user_headers
+        )
+    assert response.status_code == codes.OK
+
+    timing = response.headers["server-timing"]
+    assert timing.startswith("db;dur=")
+    assert "db-slowest;dur=" in timing
+    assert request_db_statements.count(route=ROUTE) == requests + 1
+    assert request_db_statements.sum(route=ROUTE) > 0
+    assert any(ROUTE in record.getMessage() for record in caplog.records)
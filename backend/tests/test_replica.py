@@ -0,0 +1,57 @@
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from sqlalchemy import text
+from starlette.requests import Request
+
+from core import config, replica
+from core.replica import READ_PRIMARY_COOKIE, ReadYourWritesMiddleware
+from core.session import async_session, replica_engine, replica_session
+
+# Needs a second Postgres: a streaming replica of the test database, or just
+# another instance
+pytestmark = pytest.mark.skipif(
+    replica_engine is None, reason="TEST_REPLICA_DATABASE_URI is not set"
+)
+
+
+def make_request(cookie: str = "") -> Request:
+    return Request(
+        {"type": "http", "method": "GET", "headers": [(b"cookie", cookie.encode())]}
+    )
+
+
+async def server_port(session_maker) -> int:
+    async with session_maker() as session:
+        return await session.scalar(text("SELECT inet_server_port()"))
+
+
+async def test_reads_are_routed(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(replica, "_lag_checked_at", float("-inf"))
+    session_maker = await replica.read_session_maker(make_request())
+    assert session_maker is replica_session
+    assert await server_port(session_maker) == replica_engine.url.port
+
+    # Stays on the primary for a while after writing
+    session_maker = await replica.read_session_maker(
+        make_request(f"{READ_PRIMARY_COOKIE}=1")
+    )
+    assert session_maker is async_session
+
+    # Too far behind
+    monkeypatch.setattr(config.settings, "REPLICA_MAX_LAG_SECONDS", -1)
+    monkeypatch.setattr(replica, "_lag_checked_at", float("-inf"))
+    assert await replica.read_session_maker(make_request()) is async_session
+
+
+async def test_writes_set_the_read_primary_cookie():
+    app = FastAPI()
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    @app.api_route("/", methods=["GET", "POST"])
+    async def endpoint():
+        return {}
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        assert READ_PRIMARY_COOKIE not in (await client.get("/")).cookies
+        assert READ_PRIMARY_COOKIE in (await client.post("/")).cookies
@@ -0,0 +1,18 @@
+from sqlalchemy import text
+
+from core.session import (
+    async_engine,
+    pool_checked_out,
+    pool_checkout_wait_seconds,
+)
+
+
+async def test_pool_reports_checkouts():
+    waits = pool_checkout_wait_seconds.count(pool="primary")
+
+    async with async_engine.connect() as connection:
+        assert pool_checked_out.value(pool="primary") >= 1
+        await connection.execute(text("SELECT 1"))
+
+    assert pool_checkout_wait_seconds.count(pool="primary") == waits + 1
+    assert pool_checked_out.value(pool="primary") == async_engine.pool.checkedout()
@@ -0,0 +1,258 @@
+import asyncio
+from collections import Counter
+from decimal import Decimal
+
+from httpx import AsyncClient, codes
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api import pricing
+from core.session import async_engine
+from main import app
+from models import (
+    AuditLog,
+    Machine,
+    MachineGroup,
+    MachineType,
+    MachineUsage,
+    Resource,
+    ResourceSlot,
+    Semester,
+    State,
+    User,
+)
+from schemas.enums import EntityType, SemesterType
+
+
+async def test_use_a_machine_commits_once(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_user_with_use_machine: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    semester = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    session.add(State(active_semester=semester))
+    await session.commit()
+
+    commits = []
+
+    def count_commit(conn):
+        commits.append(conn)
+
+    event.listen(async_engine.sync_engine, "commit", count_commit)
+    try:
+        response = await client.post(
+            app.url_path_for("use_a_machine", machine_id=default_machine.id),
+            headers=default_user_headers,
+            json={"resource_usages": {}, "duration_seconds": 600, "as_org_id": None},
+        )
+    finally:
+        event.remove(async_engine.sync_engine, "commit", count_commit)
+
+    assert response.status_code == codes.OK
+    assert len(commits) == 1
+
+    usage = await session.scalar(
+        select(MachineUsage).where(MachineUsage.machine_id == default_machine.id)
+    )
+    assert usage.semester_id == semester.id
+    assert usage.user_id == default_user_with_use_machine.id
+    assert (await session.scalar(select(Machine.active_usage_id))) == usage.id
+    audit_log = await session.scalar(select(AuditLog))
+    assert audit_log.content["machine_usage_id"] == str(usage.id)
+    assert audit_log.entity_type == EntityType.MACHINE_USAGE
+    assert audit_log.entity_id == usage.id
+
+
+async def test_concurrent_claims_one_winner_per_machine(
+    client: AsyncClient,
+    default_user_with_use_machine: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    machine_count = 5
+    claims_per_machine = 60
+
+    machine_type = MachineType(name="Prusa MK4", cost_per_hour=0)
+    group = MachineGroup(name="Prusas")
+    machines = [
+        Machine(name=f"Prusa {index}", type=machine_type, group=group)
+        for index in range(machine_count)
+    ]
+    semester = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    session.add_all([*machines, State(active_semester=semester)])
+    await session.commit()
+
+    async def claim(machine: Machine) -> tuple[Machine, int]:
+        response = await client.post(
+            app.url_path_for("use_a_machine", machine_id=machine.id),
+            headers=default_user_headers,
+            json={"resource_usages": {}, "duration_seconds": 600, "as_org_id": None},
+        )
+        return machine, response.status_code
+
+    claims = [claim(machine) for _ in range(claims_per_machine) for machine in machines]
+    results = await asyncio.gather(*claims)
+
+    statuses = Counter(status for _, status in results)
+    assert statuses == {
+        codes.OK: machine_count,
+        codes.CONFLICT: len(claims) - machine_count,
+    }
+    wins = Counter(machine.id for machine, status in results if status == codes.OK)
+    assert wins == {machine.id: 1 for machine in machines}
+
+    usages = (await session.scalars(select(MachineUsage))).all()
+    assert len(usages) == machine_count
+
+
+async def test_quote_machine_usage(
+    client: AsyncClient,
+    default_user_with_use_machine: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    resource = Resource(name="PLA", units="g", cost=Decimal("0.05"))
+    slot = ResourceSlot(
+        db_name="filament",
+        display_name="Filament",
+        allow_own_material=True,
+        allow_empty=False,
+        valid_resources=[resource],
+    )
+    machine = Machine(
+        name="Prusa 1",
+        type=MachineType(
+            name="Prusa MK4", cost_per_hour=Decimal("2.5"), resource_slots=[slot]
+        ),
+    )
+    session.add(machine)
+    await session.commit()
+
+    async def quote(resource_usages: dict) -> dict:
+        response = await client.post(
+            app.url_path_for("quote_machine_usage", machine_id=machine.id),
+            headers=default_user_headers,
+            json={
+                "resource_usages": resource_usages,
+                "duration_seconds": 1234,
+                "as_org_id": None,
+            },
+        )
+        assert response.status_code == codes.OK
+        return response.json()
+
+    usage = {
+        str(slot.id): {
+            "resource_id": str(resource.id),
+            "amount": "12.5",
+            "is_own_material": False,
+        }
+    }
+    result = await quote(usage)
+    # 1234s at $2.50/h is $0.856944, rounded to the cent
+    assert Decimal(result["machine_cost"]) == Decimal("0.86")
+    assert Decimal(result["resources"][0]["cost"]) == Decimal("0.625")
+    assert Decimal(result["total_cost"]) == Decimal("1.485")
+
+    # Editing the resource recompiles the plan
+    resource.cost = Decimal("0.10")
+    await session.commit()
+    result = await quote(usage)
+    assert Decimal(result["total_cost"]) == Decimal("2.11")
+
+    response = await client.post(
+        app.url_path_for("quote_machine_usage", machine_id=machine.id),
+        headers=default_user_headers,
+        json={"resource_usages": {}, "duration_seconds": 60, "as_org_id": None},
+    )
+    assert response.status_code == codes.BAD_REQUEST
+    assert (
+        response.json()["detail"] == "One or more required resource slots not populated"
+    )
+
+
+async def test_usage_schema_cached_per_type(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_user_with_use_machine: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    slot = ResourceSlot(
+        db_name="filament",
+        display_name="Filament",
+        allow_own_material=True,
+        allow_empty=False,
+        valid_resources=[Resource(name="PLA", units="g", cost=Decimal("0.05"))],
+    )
+    machine_type = await session.get(MachineType, default_machine.type_id)
+    await session.refresh(machine_type, ["resource_slots"])
+    machine_type.resource_slots.append(slot)
+    await session.commit()
+
+    async def get_schema() -> dict:
+        response = await client.get(
+            app.url_path_for("get_usage_schema", machine_id=default_machine.id),
+            headers=default_user_headers,
+        )
+        assert response.status_code == codes.OK
+        return response.json()
+
+    schema = await get_schema()
+    assert schema["name"] == default_machine.name
+    assert schema["type_name"] == machine_type.name
+    assert [slot["display_name"] for slot in schema["resource_slots"]] == ["Filament"]
+
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        assert await get_schema() == schema
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    # Only the user lookup of the permission check
+    assert len(statements) == 1
+
+    slot.display_name = "Spool"
+    await session.commit()
+    schema = await get_schema()
+    assert [slot["display_name"] for slot in schema["resource_slots"]] == ["Spool"]
+
+
+async def test_claims_keep_cached_machines(
+    client: AsyncClient,
+    default_machine: Machine,
+    default_user_with_use_machine: User,
+    default_user_headers: dict[str, str],
+    session: AsyncSession,
+):
+    semester = Semester(semester_type=SemesterType.FALL, calendar_year=2026)
+    session.add(State(active_semester=semester))
+    await session.commit()
+
+    usage = {"resource_usages": {}, "duration_seconds": 600, "as_org_id": None}
+    response = await client.post(
+        app.url_path_for("quote_machine_usage", machine_id=default_machine.id),
+        headers=default_user_headers,
+        json=usage,
+    )
+    assert response.status_code == codes.OK
+    assert default_machine.id in pricing._machine_cache
+
+    response = await client.post(
+        app.url_path_for("use_a_machine", machine_id=default_machine.id),
+        headers=default_user_headers,
+        json=usage,
+    )
+    assert response.status_code == codes.OK
+    assert default_machine.id in pricing._machine_cache
+
+    machine = await session.get(Machine, default_machine.id)
+    machine.disabled = True
+    await session.commit()
+    assert default_machine.id not in pricing._machine_cache
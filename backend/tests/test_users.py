@@ -1,12 +1,15 @@
 from httpx import AsyncClient, codes
 from pydantic import SecretStr
-from sqlalchemy import select
+from sqlalchemy import event, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..main import app
-from models import User
+from models import Role, User
+from schemas.enums import GenderStatsType, Permissions, PronounType
 from .conftest import default_user_object, default_user_password
 from core import security
+from core.invalidation import invalidate_all
+from core.session import async_engine
 
 
 async def test_read_current_user(client: AsyncClient, default_user_headers):
@@ -81,3 +84,189 @@ async def test_register_new_user(
     result = await session.execute(select(User).where(User.RCSID == "obamab"))
     user = result.scalars().first()
     assert user is not None
+
+
+async def test_get_all_users_statement_count(
+    client: AsyncClient,
+    default_superuser: User,
+    default_user_headers,
+    session: AsyncSession,
+):
+    role = Role(
+        name="Member",
+        permissions=[Permissions.CAN_USE_MACHINES],
+        inverse_permissions=[],
+        display_role=True,
+        priority=1,
+    )
+    session.add_all(
+        User(
+            RCSID=f"user{index:02}",
+            RIN=f"1000000{index:02}",
+            first_name="Test",
+            last_name=f"User {index}",
+            major="Undeclared",
+            gender_identity=GenderStatsType.NOTDISCLOSED,
+            pronouns=PronounType.NOT_SHOWN,
+            hashed_password="",
+            is_graduating=False,
+            is_rpi_staff=False,
+            roles=[role],
+        )
+        for index in range(20)
+    )
+    await session.commit()
+
+    async def count_statements(limit: int) -> int:
+        # Start cold, cached permissions would hide per-user queries
+        invalidate_all()
+        statements = []
+
+        def count_statement(*args):
+            statements.append(args)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+        try:
+            response = await client.get(
+                app.url_path_for("get_all_users"),
+                headers=default_user_headers,
+                params={"limit": limit},
+            )
+        finally:
+            event.remove(
+                async_engine.sync_engine, "before_cursor_execute", count_statement
+            )
+        assert response.status_code == codes.OK
+        assert len(response.json()) == limit
+        assert response.json()[-1]["permissions"] == [Permissions.CAN_USE_MACHINES]
+        return len(statements)
+
+    assert await count_statements(2) == await count_statements(20)
+
+
+async def test_get_all_users_cursor_pages(
+    client: AsyncClient,
+    default_superuser: User,
+    default_user_headers,
+    session: AsyncSession,
+):
+    session.add_all(
+        User(
+            RCSID=f"user{index:02}",
+            RIN=f"1000000{index:02}",
+            first_name="Test",
+            last_name="User",
+            # Ties and NULLs, which the id tiebreaker has to page through
+            major=None if index % 3 == 0 else f"Major {index % 2}",
+            gender_identity=GenderStatsType.NOTDISCLOSED,
+            pronouns=PronounType.NOT_SHOWN,
+            hashed_password="",
+            is_graduating=False,
+            is_rpi_staff=False,
+        )
+        for index in range(10)
+    )
+    await session.commit()
+
+    for params in (
+        {"order_by": "major"},
+        {"order_by": "major", "descending": True},
+        {"order_by": "semester_balance"},
+        {"order_by": "last_name", "descending": True},
+    ):
+        response = await client.get(
+            app.url_path_for("get_all_users"),
+            headers=default_user_headers,
+            params={**params, "limit": 100},
+        )
+        assert response.status_code == codes.OK
+        expected = [user["id"] for user in response.json()]
+
+        ids, cursor = [], ""
+        while cursor is not None:
+            response = await client.get(
+                app.url_path_for("get_all_users"),
+                headers=default_user_headers,
+                params={**params, "limit": 3, "cursor": cursor},
+            )
+            assert response.status_code == codes.OK
+            page = response.json()
+            assert len(page["items"]) <= 3
+            ids += [user["id"] for user in page["items"]]
+            cursor = page["next_cursor"]
+        assert ids == expected
+
+    response = await client.get(
+        app.url_path_for("get_all_users"),
+        headers=default_user_headers,
+        params={"order_by": "RIN", "limit": 3, "cursor": ""},
+    )
+    cursor = response.json()["next_cursor"]
+    for params in ({"order_by": "RCSID", "cursor": cursor}, {"cursor": "garbage"}):
+        response = await client.get(
+            app.url_path_for("get_all_users"),
+            headers=default_user_headers,
+            params=params,
+        )
+        assert response.status_code == codes.BAD_REQUEST
+
+    for params in ({"limit": 0, "cursor": ""}, {"limit": -1}, {"offset": -1}):
+        response = await client.get(
+            app.url_path_for("get_all_users"),
+            headers=default_user_headers,
+            params=params,
+        )
+        assert response.status_code == codes.UNPROCESSABLE_ENTITY
+
+
+async def test_search_users(
+    client: AsyncClient,
+    default_superuser: User,
+    default_user_headers,
+    session: AsyncSession,
+):
+    session.add_all(
+        User(
+            RCSID=rcsid,
+            RIN=rin,
+            first_name=first_name,
+            last_name=last_name,
+            major="Undeclared",
+            gender_identity=GenderStatsType.NOTDISCLOSED,
+            pronouns=PronounType.NOT_SHOWN,
+            hashed_password="",
+            is_graduating=False,
+            is_rpi_staff=False,
+        )
+        for rcsid, rin, first_name, last_name in (
+            ("smithj", "661000001", "Jane", "Smith"),
+            ("smythe", "661000002", "Eve", "Smythe"),
+            ("doej", "662000003", "John", "Doe"),
+        )
+    )
+    await session.commit()
+
+    async def search(q: str) -> list[str]:
+        response = await client.get(
+            app.url_path_for("search_users"),
+            headers=default_user_headers,
+            params={"q": q},
+        )
+        assert response.status_code == codes.OK
+        return [user["RCSID"] for user in response.json()]
+
+    assert (await search("smith"))[0] == "smithj"
+    assert set(await search("sm")) == {"smithj", "smythe"}
+    assert await search("jane smi") == ["smithj"]
+    assert await search("6610") == ["smithj", "smythe"]
+    assert await search("662000003") == ["doej"]
+    assert await search("100%") == []
+
+    # Too short once stripped
+    for q in ("   ", " 6 "):
+        response = await client.get(
+            app.url_path_for("search_users"),
+            headers=default_user_headers,
+            params={"q": q},
+        )
+        assert response.status_code == codes.UNPROCESSABLE_ENTITY
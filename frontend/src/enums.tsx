@@ -61,6 +61,9 @@ export enum UserPermission {
 
     CAN_VIEW_FAILURE_LOGS = "canViewFailureLogs",
 
+    //  For browsing and exporting the whole audit log
+    CAN_SEE_AUDIT_LOGS = "canSeeAuditLogs",
+
     //  For user role management
     CAN_SEE_ROLES = "canSeeRoles",
     CAN_CREATE_ROLES = "canCreateRoles",